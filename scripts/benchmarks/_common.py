@@ -0,0 +1,181 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks import service code directly (no HTTP, no Docker), so each script
+first puts the service's `src/` directory on the Python path.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICES_DIR = REPO_ROOT / "services"
+
+# A small mix of English and Hindi questions users typically ask
+SAMPLE_QUESTIONS = [
+    "What is the notice period for ending this agreement?",
+    "Is there a lock-in period?",
+    "What happens if I pay rent late?",
+    "Who pays for repairs and maintenance?",
+    "Which court has jurisdiction over disputes?",
+    "Is there a penalty clause for early termination?",
+    "How much is the security deposit and when is it returned?",
+    "Can the landlord increase the rent?",
+    "इस अनुबंध की नोटिस अवधि क्या है?",
+    "क्या किराया देर से देने पर जुर्माना है?",
+    "सुरक्षा जमा राशि कब वापस मिलेगी?",
+    "विवाद होने पर कौन सी अदालत सुनवाई करेगी?",
+]
+
+# Typical clause sentences used to build synthetic document text
+SAMPLE_CLAUSES = [
+    "The Tenant shall pay a monthly rent of Rs. 15,000 on or before the 5th day of every month.",
+    "Either party may terminate this agreement by giving one month's notice in writing to the other party.",
+    "The security deposit of Rs. 45,000 shall be refunded without interest at the time of vacating the premises.",
+    "Any dispute arising out of this agreement shall be subject to the exclusive jurisdiction of the courts at New Delhi.",
+    "The Employee shall not disclose any confidential information of the Company during or after the term of employment.",
+    "A penalty of two percent per month shall be charged on any amount remaining unpaid after the due date.",
+    "The lock-in period of this agreement shall be eleven months from the date of commencement.",
+    "The Borrower shall repay the loan in equated monthly instalments as set out in Schedule II.",
+    "किरायेदार प्रत्येक माह की 5 तारीख तक 15,000 रुपये का मासिक किराया अदा करेगा।",
+    "कोई भी पक्ष दूसरे पक्ष को एक माह का लिखित नोटिस देकर यह अनुबंध समाप्त कर सकता है।",
+    "इस अनुबंध से उत्पन्न किसी भी विवाद पर केवल नई दिल्ली के न्यायालयों का क्षेत्राधिकार होगा।",
+    "मकान खाली करते समय सुरक्षा जमा राशि बिना ब्याज के वापस की जाएगी।",
+]
+
+
+def add_service_to_path(service: str) -> Path:
+    """Put services/<service>/src first on sys.path and return it."""
+    src = SERVICES_DIR / service / "src"
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+    return src
+
+
+def questions(n: int) -> list:
+    """Return n distinct-looking questions built from SAMPLE_QUESTIONS."""
+    return [
+        f"{SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]} ({i})"
+        for i in range(n)
+    ]
+
+
+def chunks(n: int, sentences_per_chunk: int = 6) -> list:
+    """Return n synthetic document chunks of varying length."""
+    out = []
+    for i in range(n):
+        count = 1 + (i * 7) % sentences_per_chunk
+        out.append(" ".join(
+            SAMPLE_CLAUSES[(i + j) % len(SAMPLE_CLAUSES)] for j in range(count)
+        ))
+    return out
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB (Linux/macOS)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> float:
+    """Current resident memory of this process in MB (Linux only, else peak)."""
+    try:
+        with open(f"/proc/{os.getpid()}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def process_memory_mb(pid: int) -> dict:
+    """Current and peak resident memory of another process in MB (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+
+def shared_memory_mb(pid: int) -> dict:
+    """
+    RSS, PSS and USS of another process in MB (Linux only).
+
+    RSS counts pages shared with other processes in full; PSS splits them
+    between the processes sharing them, and USS counts only private pages
+    (what the process alone costs).
+    """
+    fields = {"Rss:": "rss_mb", "Pss:": "pss_mb", "Private_Clean:": "uss_mb", "Private_Dirty:": "uss_mb"}
+    memory = {"rss_mb": 0.0, "pss_mb": 0.0, "uss_mb": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    memory[fields[parts[0]]] += int(parts[1]) / 1024
+    except OSError:
+        return {}
+    return {key: round(value, 1) for key, value in memory.items()}
+
+
+def child_pids(pid: int) -> list:
+    """Direct children of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def latency_summary(latencies: list, elapsed: float) -> dict:
+    """Count, throughput and p50/p95/p99 (ms) of a list of latencies in seconds."""
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "throughput_per_s": round(len(ordered) / elapsed, 2) if elapsed else None,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def git_commit() -> str:
+    """Commit the benchmark ran against, so results can be compared across commits."""
+    import subprocess
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(results, output: str = None):
+    """Print results as JSON and optionally save them to a file."""
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        Path(output).write_text(text + "\n", encoding="utf-8")
@@ -0,0 +1,33 @@
+"""
+Run one service for the end-to-end benchmark, with the fake Kafka installed.
+
+Usage (normally started by bench_end_to_end.py):
+    python scripts/benchmarks/_serve.py <service> <port> <fake kafka file>
+
+Configuration (database, Chroma directory, LLM backend, ...) comes from the
+environment, exactly as in production.
+"""
+
+import os
+import sys
+
+from _common import SERVICES_DIR
+
+import fake_kafka
+
+
+def main():
+    service, port, kafka_path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    fake_kafka.install(kafka_path)
+
+    src = SERVICES_DIR / service / "src"
+    os.chdir(src)
+    sys.path.insert(0, str(src))
+
+    import uvicorn
+
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
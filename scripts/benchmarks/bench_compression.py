@@ -0,0 +1,144 @@
+"""
+Report: recall loss versus memory saved for compressed embedding storage.
+
+Compares, against exact float32 search:
+- float16:        half-precision vectors, exact scan
+- pq:             product-quantized codes only (no re-score)
+- pq+rerank×N:    PQ candidates re-scored with float32 vectors (what the
+                  segment engine does with SEGMENT_PQ=true)
+
+Corpus (pick one):
+    --segments DIR   all vectors.npy files under a segment store (our corpus)
+    --chroma DIR     all embeddings in a local Chroma directory (our corpus)
+    (default)        synthetic clustered 384-d vectors
+
+Queries are corpus vectors with a little noise added, so each query has
+realistic near neighbours.
+
+Usage:
+    python scripts/benchmarks/bench_compression.py --segments ./chroma_db/segments
+    python scripts/benchmarks/bench_compression.py --chroma ./chroma_db --k 5
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from _common import add_service_to_path, write_results
+
+add_service_to_path("embedding-service")
+
+from utils.vector_store import pq_encode, pq_scores, train_pq  # noqa: E402
+
+
+def load_segments(root: str) -> np.ndarray:
+    parts = [np.load(p) for p in sorted(Path(root).glob("doc_*/seg_*/vectors.npy"))]
+    if not parts:
+        raise SystemExit(f"No segments found under {root}")
+    return np.vstack(parts).astype(np.float32)
+
+
+def load_chroma(path: str) -> np.ndarray:
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    parts = []
+    for collection in client.list_collections():
+        if isinstance(collection, str):  # newer chromadb returns names
+            collection = client.get_collection(collection)
+        embeddings = collection.get(include=["embeddings"])["embeddings"]
+        if embeddings is not None and len(embeddings):
+            parts.append(np.asarray(embeddings, dtype=np.float32))
+    if not parts:
+        raise SystemExit(f"No embeddings found in {path}")
+    return np.vstack(parts)
+
+
+def synthetic(n: int, dim: int = 384, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim))
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim))
+    return vectors.astype(np.float32)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return round(hits / truth.size, 4)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-scores, axis=-1)[..., :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments")
+    parser.add_argument("--chroma")
+    parser.add_argument("--synthetic-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--subspaces", type=int, default=48)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    if args.segments:
+        vectors = load_segments(args.segments)
+    elif args.chroma:
+        vectors = load_chroma(args.chroma)
+    else:
+        vectors = synthetic(args.synthetic_size)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    n, dim = vectors.shape
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(n, size=min(args.queries, n), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    truth = top_k(queries @ vectors.T, args.k)
+    results = [{"method": "float32", "bytes_per_vector": dim * 4, "recall_at_k": 1.0}]
+
+    half = vectors.astype(np.float16)
+    found = top_k(queries @ half.astype(np.float32).T, args.k)
+    results.append({"method": "float16", "bytes_per_vector": dim * 2, "recall_at_k": recall(found, truth)})
+
+    codebooks = train_pq(vectors, args.subspaces)
+    codes = pq_encode(vectors, codebooks)
+    approx = np.stack([pq_scores(codes, codebooks, q) for q in queries])
+    results.append({
+        "method": "pq",
+        "bytes_per_vector": args.subspaces,
+        "recall_at_k": recall(top_k(approx, args.k), truth),
+    })
+    for factor in args.rerank:
+        candidates = top_k(approx, args.k * factor)
+        found = np.stack([
+            c[top_k(vectors[c] @ q, args.k)] for c, q in zip(candidates, queries)
+        ])
+        results.append({
+            "method": f"pq+rerank×{factor}",
+            # Only codes are resident; full vectors stay on disk (memory-mapped)
+            "bytes_per_vector": args.subspaces,
+            "recall_at_k": recall(found, truth),
+        })
+
+    for r in results:
+        r["memory_saved"] = f"{100 * (1 - r['bytes_per_vector'] / (dim * 4)):.1f}%"
+
+    write_results(
+        {
+            "benchmark": "compression",
+            "vectors": n,
+            "dim": dim,
+            "k": args.k,
+            "codebook_bytes": int(codebooks.nbytes),
+            "results": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
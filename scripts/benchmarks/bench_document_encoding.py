@@ -0,0 +1,151 @@
+"""
+Benchmark: encoding one long document, document order vs length-sorted streaming.
+
+Both modes embed the same synthetic document (English and Hindi pages, so
+chunk token lengths vary) into a fresh local Chroma store:
+
+- document-order: the previous path, `encode(chunks, batch_size=32)` over
+                  the whole document, then `collection.add` of all vectors
+                  (split at Chroma's per-call limit, which one add of a
+                  1000-page document exceeds)
+- streamed:       `generate_and_store_embeddings`, i.e. length-sorted
+                  batches sized by EMBEDDING_BATCH_MEMORY_MB, written to the
+                  store every EMBEDDING_STORE_BATCH chunks
+
+Each mode runs in its own subprocess so peak memory is its own. For every
+mode we report:
+- chunks_per_sec:  chunks encoded and stored per second
+- padded_tokens:   tokens processed including padding (lower is better)
+- rss_loaded_mb:   resident memory once the model and store are loaded
+- peak_rss_mb:     peak resident memory of the whole run
+- peak_growth_mb:  peak minus loaded, the memory the document itself costs
+
+Usage:
+    python scripts/benchmarks/bench_document_encoding.py
+    python scripts/benchmarks/bench_document_encoding.py --pages 1000 --engine onnx
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import SAMPLE_CLAUSES, add_service_to_path, current_rss_mb, peak_rss_mb, write_results
+
+MODES = ["document-order", "streamed"]
+CHARS_PER_PAGE = 3000
+
+
+def document(pages: int) -> str:
+    """Synthetic contract: short headings between dense paragraphs, every third page in Hindi."""
+    english = [c for c in SAMPLE_CLAUSES if c.isascii()]
+    hindi = [c for c in SAMPLE_CLAUSES if not c.isascii()]
+    out = []
+    for page in range(pages):
+        clauses = hindi if page % 3 == 2 else english
+        text = [f"ARTICLE {page + 1}"]
+        i = page
+        while sum(map(len, text)) < CHARS_PER_PAGE:
+            text.append(clauses[i % len(clauses)])
+            i += 1
+        out.append("\n".join(text))
+    return "\n\n".join(out)
+
+
+def padded_tokens(lengths, batches) -> int:
+    return sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+
+
+def worker(mode: str, pages: int, engine: str) -> dict:
+    """Runs inside the subprocess: embed one document with one mode."""
+    os.environ.update(
+        EMBEDDING_ENGINE=engine,
+        VECTOR_STORE="chroma",
+        CHROMA_PATH=tempfile.mkdtemp(prefix="bench-doc-"),
+        ANONYMIZED_TELEMETRY="False",
+        TRACE_EXPORTER="none",
+        DATABASE_URL="sqlite://",  # imported by the clause pipeline, never used here
+    )
+    add_service_to_path("embedding-service")
+    from utils import embedding
+    from utils.encoder import EMBEDDING_BATCH_MEMORY_MB, plan_batches
+
+    embedding.warm_up()
+    encoder = embedding.get_model()
+    text = document(pages)
+    chunks = embedding.chunk_text(text)
+    rss_loaded = current_rss_mb()
+
+    start = time.perf_counter()
+    if mode == "streamed":
+        embedding.generate_and_store_embeddings(1, text)
+    else:
+        vectors = encoder.encode(chunks, batch_size=32, normalize_embeddings=True)
+        collection = embedding.get_collection(1)
+        # Local Chroma refuses more than ~5461 records per add, which a
+        # 1000-page document exceeds in one call
+        for i in range(0, len(chunks), 5000):
+            collection.add(
+                ids=[f"chunk_{j}" for j in range(i, min(i + 5000, len(chunks)))],
+                documents=chunks[i:i + 5000],
+                embeddings=vectors[i:i + 5000],
+                metadatas=[{"source": "document", "document_id": 1, "chunk_index": j}
+                           for j in range(i, min(i + 5000, len(chunks)))],
+            )
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+
+    # Padding each mode paid for (measured after the run, not counted above)
+    lengths = encoder.token_lengths(chunks)
+    if mode == "streamed":
+        batches = plan_batches(lengths, encoder.dimension, EMBEDDING_BATCH_MEMORY_MB * 1024 * 1024)
+    else:
+        # SentenceTransformer.encode sorts by character length before batching
+        order = sorted(range(len(chunks)), key=lambda i: -len(chunks[i]))
+        batches = [order[i:i + 32] for i in range(0, len(order), 32)]
+    return {
+        "mode": mode,
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 2),
+        "chunks_per_sec": round(len(chunks) / elapsed, 1),
+        "forward_passes": len(batches),
+        "padded_tokens": padded_tokens(lengths, batches),
+        "real_tokens": sum(lengths),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_growth_mb": round(peak - rss_loaded, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--engine", default=os.getenv("EMBEDDING_ENGINE", "torch"))
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.pages, args.engine)))
+        return
+
+    results = []
+    for mode in args.modes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", mode, "--pages", str(args.pages), "--engine", args.engine],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    write_results(
+        {"benchmark": "document_encoding", "pages": args.pages, "engine": args.engine, "results": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: torch vs ONNX Runtime vs ONNX int8 embedding engines.
+
+Each engine runs in its own subprocess so cold-start time and memory are
+measured from a clean interpreter. For every engine we report:
+- cold_start_s:    import + model load time
+- sentences_per_sec on synthetic legal chunks (CPU)
+- rss_mb:          resident memory after encoding
+
+It also checks compatibility with the torch engine (the one existing Chroma
+collections were built with): the cosine similarity between torch and each
+engine's vector for the same text must stay above the tolerance below.
+The script exits with status 1 if an engine is out of tolerance.
+
+Usage:
+    python scripts/benchmarks/bench_embedding_engines.py
+    python scripts/benchmarks/bench_embedding_engines.py --engines torch onnx-int8 --chunks 512
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from _common import add_service_to_path, chunks, current_rss_mb, write_results
+
+# Minimum cosine similarity to the torch vector for the same text
+TOLERANCE = {
+    "torch": 0.9999,
+    "onnx": 0.999,
+    "onnx-int8": 0.98,
+}
+
+# Texts whose vectors are compared between engines
+REFERENCE_TEXTS = chunks(48)
+
+
+def worker(engine: str, n_chunks: int, batch_size: int) -> dict:
+    """Runs inside the subprocess: load one engine and measure it."""
+    start = time.perf_counter()
+    add_service_to_path("embedding-service")
+    from utils.encoder import load_encoder
+
+    encoder = load_encoder(engine)
+    encoder.encode(REFERENCE_TEXTS[:4])  # first call initializes kernels
+    cold_start = time.perf_counter() - start
+
+    texts = chunks(n_chunks)
+    start = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "engine": engine,
+        "cold_start_s": round(cold_start, 2),
+        "sentences_per_sec": round(n_chunks / elapsed, 1),
+        "rss_mb": round(current_rss_mb(), 1),
+        "reference_vectors": encoder.encode(REFERENCE_TEXTS).tolist(),
+    }
+
+
+def cosine_min(a, b) -> float:
+    import numpy as np
+
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    sims = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return float(sims.min())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.chunks, args.batch_size)))
+        return
+
+    runs = {}
+    for engine in args.engines:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", engine,
+             "--chunks", str(args.chunks), "--batch-size", str(args.batch_size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs[engine] = json.loads(out.strip().splitlines()[-1])
+
+    ok = True
+    vectors = {engine: run.pop("reference_vectors") for engine, run in runs.items()}
+    baseline = vectors.get("torch")
+    for engine, run in runs.items():
+        if baseline is None:
+            break
+        run["min_cosine_vs_torch"] = round(cosine_min(baseline, vectors[engine]), 5)
+        run["tolerance"] = TOLERANCE.get(engine, 0.98)
+        run["compatible"] = run["min_cosine_vs_torch"] >= run["tolerance"]
+        ok = ok and run["compatible"]
+
+    write_results(
+        {"benchmark": "embedding_engines", "chunks": args.chunks, "results": list(runs.values())},
+        args.output,
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
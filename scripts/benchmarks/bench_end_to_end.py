@@ -0,0 +1,548 @@
+"""
+Benchmark: the whole system, end to end, on one machine.
+
+Starts the auth, upload, embedding and query services as separate
+processes against local stand-ins:
+- database:  a SQLite file (or --database-url, e.g. a throw-away Postgres)
+- Kafka:     fake_kafka.py, a SQLite-backed stand-in shared by the services
+- Chroma:    a temporary directory (VECTOR_STORE=chroma)
+- LLM:       the mock backend with --token-latency-ms per generated token
+
+Then drives two phases over HTTP:
+1. ingest: upload --documents synthetic legal PDFs (English and Hindi)
+   while polling GET /documents, as the frontend does, until all are ready
+2. mixed:  --users virtual users for --duration seconds, each picking
+   uploads, listing polls and questions according to --mix
+
+Reported as JSON (see --output): per-endpoint throughput and p50/p95/p99
+latency, documents ingested per minute, upload-to-ready latency, embedding
+chunks/sec (from the embedding service's /metrics) and current/peak memory
+of every service. Runs are seeded, so two commits can be compared with
+--compare old.json.
+
+Usage:
+    python scripts/benchmarks/bench_end_to_end.py --output e2e.json
+    python scripts/benchmarks/bench_end_to_end.py --documents 50 --users 16 --duration 60
+    python scripts/benchmarks/bench_end_to_end.py --compare e2e-main.json --output e2e.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+from _common import (
+    SAMPLE_CLAUSES,
+    SAMPLE_QUESTIONS,
+    SERVICES_DIR,
+    git_commit,
+    latency_summary,
+    process_memory_mb,
+    write_results,
+)
+
+HERE = Path(__file__).resolve().parent
+SERVICES = ["auth-service", "upload-service", "embedding-service", "query-service"]
+ENGLISH_CLAUSES = [c for c in SAMPLE_CLAUSES if c.isascii()]
+HINDI_CLAUSES = [c for c in SAMPLE_CLAUSES if not c.isascii()]
+
+
+# ==============================================================================
+# SYNTHETIC PDFS
+# ==============================================================================
+
+def _pdf(pages) -> bytes:
+    """
+    Minimal PDF with one text line per entry of each page.
+
+    Text is written as Unicode code points (Identity-H) with a ToUnicode
+    map, so text extraction returns Hindi as well as English exactly.
+    """
+    to_unicode = (
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n"
+        "/CMapName /Unicode def /CMapType 2 def\n"
+        "1 begincodespacerange <0000> <FFFF> endcodespacerange\n"
+        "3 beginbfrange <0020> <007E> <0020> <0900> <097F> <0900> <2000> <206F> <2000> endbfrange\n"
+        "endcmap CMapName currentdict /CMap defineresource pop end end"
+    ).encode("ascii")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /NotoSans /Encoding /Identity-H "
+        b"/DescendantFonts [4 0 R] /ToUnicode 6 0 R >>",
+        b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /NotoSans "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        b"/FontDescriptor 5 0 R /DW 500 >>",
+        b"<< /Type /FontDescriptor /FontName /NotoSans /Flags 32 /FontBBox [0 -300 1000 900] "
+        b"/ItalicAngle 0 /Ascent 900 /Descent -300 /CapHeight 700 /StemV 80 >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(to_unicode), to_unicode),
+    ]
+    page_ids = []
+    for lines in pages:
+        ops = []
+        for i, line in enumerate(lines):
+            hex_text = "".join(f"{ord(ch):04X}" for ch in line)
+            ops.append(f"BT /F1 10 Tf 40 {800 - 14 * i} Td <{hex_text}> Tj ET")
+        content = "\n".join(ops).encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.7\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _wrap(text: str, width: int = 90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def make_document(rng: random.Random, pages: int, hindi: bool):
+    """(filename, PDF bytes) for a synthetic agreement, mostly in one language."""
+    primary = HINDI_CLAUSES if hindi else ENGLISH_CLAUSES
+    page_lines, clause_number = [], 0
+    for _ in range(pages):
+        lines = []
+        while len(lines) < 50:
+            # Real agreements mix in the other language now and then
+            pool = primary if rng.random() < 0.85 else SAMPLE_CLAUSES
+            clause_number += 1
+            lines.extend(_wrap(f"{clause_number}. {rng.choice(pool)}"))
+        page_lines.append(lines[:50])
+    name = f"{'hi' if hindi else 'en'}-agreement-{uuid.UUID(int=rng.getrandbits(128)).hex[:8]}.pdf"
+    return name, _pdf(page_lines)
+
+
+# ==============================================================================
+# HTTP
+# ==============================================================================
+
+class Stats:
+    """Latencies and errors per endpoint (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint: str, seconds: float, error: str = None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error:
+                self.errors.setdefault(endpoint, []).append(error)
+
+    def summary(self, elapsed: float) -> dict:
+        out = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            errors = self.errors.get(endpoint, [])
+            out[endpoint] = dict(latency_summary(latencies, elapsed), errors=len(errors))
+            if errors:
+                out[endpoint]["error_samples"] = sorted(set(errors))[:5]
+        return out
+
+
+def request(method: str, url: str, token: str = None, body: bytes = None,
+            content_type: str = None, timeout: float = 300):
+    """(status, parsed JSON or text) for one HTTP request."""
+    headers = {}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if content_type:
+        headers["Content-Type"] = content_type
+    req = urllib.request.Request(url, data=body, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            status, raw = resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    try:
+        return status, json.loads(raw)
+    except ValueError:
+        return status, raw.decode("utf-8", errors="replace")
+
+
+def timed(stats: Stats, endpoint: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        status, body = request(method, url, **kwargs)
+        error = None if status < 400 else f"HTTP {status}: {str(body)[:200]}"
+    except Exception as e:
+        status, body, error = None, None, f"{type(e).__name__}: {e}"
+    stats.record(endpoint, time.perf_counter() - start, error)
+    return status, body
+
+
+def multipart(filename: str, content: bytes, content_type: str = "application/pdf"):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("ascii")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+# ==============================================================================
+# SERVICES
+# ==============================================================================
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Cluster:
+    """The four services, each in its own process, sharing the local stand-ins."""
+
+    def __init__(self, workdir: Path, args):
+        self.workdir = workdir
+        self.ports = {service: free_port() for service in SERVICES}
+        self.processes = {}
+        self.kafka_path = str(workdir / "kafka.db")
+        database_url = args.database_url or f"sqlite:///{workdir / 'nyayaai.db'}?check_same_thread=false&timeout=30"
+        (workdir / "uploads").mkdir()
+        self.env = dict(
+            os.environ,
+            DOCKER_ENV="true",
+            DATABASE_URL=database_url,
+            KAFKA_BOOTSTRAP_SERVERS="fake-kafka:9092",
+            VECTOR_STORE="chroma",
+            CHROMA_PATH=str(workdir / "chroma"),
+            UPLOAD_DIR=str(workdir / "uploads"),
+            LLM_BACKEND="mock",
+            MOCK_LLM_TOKEN_LATENCY_MS=str(args.token_latency_ms),
+            WARM_UP_ON_STARTUP="true",
+            TRACE_EXPORTER="none",
+            # One benchmark user would hit the per-user limits immediately
+            RATE_LIMIT_ENABLED="false",
+            ANONYMIZED_TELEMETRY="False",
+        )
+
+    def url(self, service: str, path: str) -> str:
+        return f"http://127.0.0.1:{self.ports[service]}{path}"
+
+    def start(self, timeout: float):
+        # The users table normally comes from the auth service's Alembic migrations
+        subprocess.run(
+            [sys.executable, "-c", "import models, database; models.Base.metadata.create_all(database.engine)"],
+            cwd=SERVICES_DIR / "auth-service" / "src", env=self.env, check=True,
+        )
+        # One at a time: the upload service creates the remaining tables
+        for service in SERVICES:
+            log = open(self.workdir / f"{service}.log", "w")
+            self.processes[service] = subprocess.Popen(
+                [sys.executable, str(HERE / "_serve.py"), service, str(self.ports[service]), self.kafka_path],
+                cwd=HERE, env=dict(self.env, SERVICE_NAME=service), stdout=log, stderr=subprocess.STDOUT,
+            )
+            path = "/ready" if service in ("embedding-service", "query-service") else "/openapi.json"
+            self._wait(service, path, timeout)
+
+    def _wait(self, service: str, path: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.processes[service].poll() is not None:
+                break
+            try:
+                if request("GET", self.url(service, path), timeout=5)[0] == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        log = (self.workdir / f"{service}.log").read_text(errors="replace")
+        raise SystemExit(f"{service} did not become ready:\n{log[-3000:]}")
+
+    def memory(self) -> dict:
+        return {service: process_memory_mb(p.pid) for service, p in self.processes.items()}
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def login(cluster: Cluster) -> str:
+    email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "benchmark-password"
+    body = json.dumps({"email": email, "password": password, "full_name": "Benchmark"}).encode()
+    status, reply = request("POST", cluster.url("auth-service", "/register"), body=body,
+                            content_type="application/json")
+    if status >= 400:
+        raise SystemExit(f"Registration failed: {reply}")
+    form = urllib.parse.urlencode({"username": email, "password": password}).encode()
+    status, reply = request("POST", cluster.url("auth-service", "/login"), body=form,
+                            content_type="application/x-www-form-urlencoded")
+    if status >= 400:
+        raise SystemExit(f"Login failed: {reply}")
+    return reply["access_token"]
+
+
+def embedding_metrics(cluster: Cluster) -> dict:
+    """Chunks embedded and time spent encoding, from the embedding service's /metrics."""
+    status, text = request("GET", cluster.url("embedding-service", "/metrics"))
+    values = {}
+    for line in str(text).splitlines():
+        for name in ("embedding_chunks_total", "embedding_encode_seconds_sum",
+                     "embedding_document_processing_seconds_sum"):
+            if line.startswith(name + " ") or line.startswith(name + "{"):
+                values[name] = values.get(name, 0.0) + float(line.rsplit(" ", 1)[1])
+    chunks = values.get("embedding_chunks_total", 0.0)
+    encode = values.get("embedding_encode_seconds_sum", 0.0)
+    return {
+        "chunks": int(chunks),
+        "encode_s": round(encode, 2),
+        "chunks_per_s": round(chunks / encode, 1) if encode else None,
+    }
+
+
+# ==============================================================================
+# WORKLOAD
+# ==============================================================================
+
+def run_ingest(cluster: Cluster, token: str, documents, args) -> dict:
+    """Upload all documents and poll the listing until every one is ready (or failed)."""
+    stats = Stats()
+    start = time.perf_counter()
+    uploaded = {}  # document id -> time its upload finished
+    lock = threading.Lock()
+    queue = list(documents)
+
+    def uploader():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                filename, content = queue.pop()
+            body, content_type = multipart(filename, content)
+            status, reply = timed(stats, "POST /upload", "POST", cluster.url("upload-service", "/upload"),
+                                  token=token, body=body, content_type=content_type)
+            if status == 201:
+                with lock:
+                    uploaded[reply["document_id"]] = time.perf_counter()
+
+    threads = [threading.Thread(target=uploader) for _ in range(args.upload_concurrency)]
+    for t in threads:
+        t.start()
+
+    # The frontend polls the document list until processing finishes
+    finished, failed = {}, set()
+    deadline = start + args.timeout
+    while time.perf_counter() < deadline:
+        status, docs = timed(stats, "GET /documents", "GET", cluster.url("upload-service", "/documents"),
+                             token=token)
+        now = time.perf_counter()
+        if status == 200:
+            for doc in docs:
+                if doc["id"] in uploaded and doc["id"] not in finished:
+                    if doc["status"] == "ready":
+                        finished[doc["id"]] = now
+                    elif doc["status"] == "error":
+                        failed.add(doc["id"])
+        uploads_done = not any(t.is_alive() for t in threads)
+        if uploads_done and len(finished) + len(failed) >= len(uploaded):
+            break
+        time.sleep(args.poll_interval)
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - start
+    last_ready = max(finished.values(), default=start)
+    return {
+        "documents": len(documents),
+        "uploaded": len(uploaded),
+        "ready": len(finished),
+        "failed": len(failed),
+        "timed_out": len(uploaded) - len(finished) - len(failed),
+        "elapsed_s": round(elapsed, 2),
+        "documents_per_min": round(len(finished) / (last_ready - start) * 60, 2) if finished else 0.0,
+        # Resolution is the poll interval, as for a real user
+        "upload_to_ready": latency_summary([finished[d] - uploaded[d] for d in finished], 0),
+        "endpoints": stats.summary(elapsed),
+        "ready_document_ids": sorted(finished),
+    }
+
+
+def run_mixed(cluster: Cluster, token: str, document_ids, args, seed: int) -> dict:
+    """Virtual users issuing uploads, listing polls and questions for a fixed time."""
+    stats = Stats()
+    mix = parse_mix(args.mix)
+    operations, weights = list(mix), list(mix.values())
+    stop_at = time.perf_counter() + args.duration
+
+    def user(n: int):
+        rng = random.Random(seed * 1000 + n)
+        while time.perf_counter() < stop_at:
+            op = rng.choices(operations, weights)[0]
+            if op == "upload":
+                filename, content = make_document(rng, args.pages, rng.random() < args.hindi_ratio)
+                body, content_type = multipart(filename, content)
+                timed(stats, "POST /upload", "POST", cluster.url("upload-service", "/upload"),
+                      token=token, body=body, content_type=content_type)
+            elif op == "list":
+                timed(stats, "GET /documents", "GET", cluster.url("upload-service", "/documents"), token=token)
+            else:
+                body = json.dumps({
+                    "document_id": rng.choice(document_ids),
+                    "question": rng.choice(SAMPLE_QUESTIONS),
+                }).encode("utf-8")
+                path = "/query/stream" if op == "stream" else "/query"
+                timed(stats, f"POST {path}", "POST", cluster.url("query-service", path),
+                      token=token, body=body, content_type="application/json")
+            if args.think_time:
+                time.sleep(rng.expovariate(1 / args.think_time))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(args.users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = sum(len(v) for v in stats.latencies.values())
+    return {
+        "users": args.users,
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(total / elapsed, 2),
+        "endpoints": stats.summary(elapsed),
+    }
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("upload", "list", "query", "stream"):
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+# ==============================================================================
+# COMPARISON
+# ==============================================================================
+
+def compare(old: dict, new: dict):
+    """Print the change of the headline numbers between two result files."""
+    def metrics(results):
+        out = {"ingest documents/min": results["ingest"]["documents_per_min"]}
+        for phase in ("ingest", "mixed"):
+            for endpoint, summary in results[phase]["endpoints"].items():
+                if summary.get("count"):
+                    out[f"{phase} {endpoint} p95 ms"] = summary["p95_ms"]
+                    out[f"{phase} {endpoint} per s"] = summary["throughput_per_s"]
+        for service, memory in results["memory"].items():
+            if "peak_rss_mb" in memory:
+                out[f"{service} peak MB"] = memory["peak_rss_mb"]
+        return out
+
+    before, after = metrics(old), metrics(new)
+    print(f"\n{'metric':<48} {old.get('commit', '?'):>10} {new.get('commit', '?'):>10} {'change':>8}")
+    for name in after:
+        if name in before and before[name]:
+            change = (after[name] - before[name]) / before[name] * 100
+            print(f"{name:<48} {before[name]:>10} {after[name]:>10} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20, help="documents uploaded in the ingest phase")
+    parser.add_argument("--pages", type=int, default=3, help="pages per synthetic PDF")
+    parser.add_argument("--hindi-ratio", type=float, default=0.5, help="share of Hindi documents")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between listing polls")
+    parser.add_argument("--users", type=int, default=8, help="virtual users in the mixed phase")
+    parser.add_argument("--duration", type=float, default=30.0, help="length of the mixed phase (seconds)")
+    parser.add_argument("--mix", default="query=0.6,stream=0.1,list=0.25,upload=0.05",
+                        help="operation weights for the mixed phase")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="mock LLM delay per token")
+    parser.add_argument("--database-url", help="default: a SQLite file in the work directory")
+    parser.add_argument("--timeout", type=float, default=600.0, help="startup and ingest timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (logs, databases)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng, args.pages, rng.random() < args.hindi_ratio) for _ in range(args.documents)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="nyaya-e2e-"))
+    cluster = Cluster(workdir, args)
+    try:
+        started = time.perf_counter()
+        cluster.start(args.timeout)
+        startup_s = time.perf_counter() - started
+        token = login(cluster)
+
+        ingest = run_ingest(cluster, token, documents, args)
+        ingest["embedding"] = embedding_metrics(cluster)
+        memory_after_ingest = cluster.memory()
+
+        document_ids = ingest.pop("ready_document_ids")
+        if not document_ids:
+            raise SystemExit(f"No document became ready; see the logs in {workdir} (use --keep)")
+        mixed = run_mixed(cluster, token, document_ids, args, args.seed)
+        memory = cluster.memory()
+    finally:
+        cluster.stop()
+        if args.keep:
+            print(f"Work directory kept: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "benchmark": "end_to_end",
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")},
+        "startup_s": round(startup_s, 2),
+        "ingest": ingest,
+        "mixed": mixed,
+        "memory_after_ingest": memory_after_ingest,
+        "memory": memory,
+    }
+    write_results(results, args.output)
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), results)
+
+
+if __name__ == "__main__":
+    main()
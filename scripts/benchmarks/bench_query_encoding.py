@@ -0,0 +1,97 @@
+"""
+Benchmark: question encoding throughput versus concurrency.
+
+Compares encoding each question on its own (one forward pass per request,
+the old behaviour) with the query service's micro-batcher, for increasing
+numbers of concurrent requests.
+
+Usage:
+    python scripts/benchmarks/bench_query_encoding.py
+    python scripts/benchmarks/bench_query_encoding.py --concurrency 1 4 16 --requests 256 --output enc.json
+"""
+
+import argparse
+import threading
+import time
+
+from _common import add_service_to_path, questions, write_results
+
+add_service_to_path("query-service")
+
+from sentence_transformers import SentenceTransformer  # noqa: E402
+from utils.batching import MicroBatcher  # noqa: E402
+
+
+def run(encode_one, concurrency: int, total: int) -> dict:
+    """Fire `total` encodes from `concurrency` threads and time them."""
+    qs = questions(total)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        for i in range(offset, total, concurrency):
+            start = time.perf_counter()
+            encode_one(qs[i])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "questions_per_sec": round(total / wall, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=256, help="encodes per run")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    model.encode(questions(8), normalize_embeddings=True)  # warm-up
+
+    def direct(q):
+        return model.encode([q], normalize_embeddings=True)[0]
+
+    results = []
+    for c in args.concurrency:
+        batcher = MicroBatcher(
+            lambda qs: model.encode(qs, normalize_embeddings=True),
+            max_batch=args.max_batch,
+            max_delay_ms=args.max_delay_ms,
+        )
+        batched = run(batcher.submit, c, args.requests)
+        batched["avg_batch_size"] = batcher.stats()["avg_batch_size"]
+        results.append({
+            "concurrency": c,
+            "direct": run(direct, c, args.requests),
+            "batched": batched,
+        })
+
+    write_results(
+        {
+            "benchmark": "query_encoding",
+            "max_batch": args.max_batch,
+            "max_delay_ms": args.max_delay_ms,
+            "results": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
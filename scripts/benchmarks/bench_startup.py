@@ -0,0 +1,77 @@
+"""
+Benchmark: service startup time.
+
+Measures, in a fresh Python process per service:
+- import_s: time to import the FastAPI app. This is when the service can
+  answer /live (and /health) — it no longer loads the model or connects to
+  Kafka/Chroma at import time.
+- ready_s:  import_s plus warm-up (model load + vector store), i.e. when
+  /ready starts returning 200.
+
+Before lazy initialization, import_s was roughly equal to ready_s (and
+failed outright if Kafka was unreachable).
+
+Usage:
+    python scripts/benchmarks/bench_startup.py
+    python scripts/benchmarks/bench_startup.py --services query-service --repeat 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from _common import SERVICES_DIR, write_results
+
+# Runs inside the subprocess (cwd = the service's src directory)
+PROBE = r"""
+import json, sys, time
+sys.path.insert(0, ".")
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+from utils.embedding import warm_up
+warm_up()
+ready = time.perf_counter() - start
+print(json.dumps({"import_s": round(imported, 3), "ready_s": round(ready, 3)}))
+"""
+
+
+def measure(service: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DOCKER_ENV", "true")
+    # Point Chroma at a throw-away directory; no Kafka broker is needed
+    env.setdefault("CHROMA_PATH", tempfile.mkdtemp(prefix="nyaya-chroma-"))
+    env["WARM_UP_ON_STARTUP"] = "false"
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SERVICES_DIR / service / "src",
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", nargs="+", default=["query-service", "embedding-service"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for service in args.services:
+        runs = [measure(service) for _ in range(args.repeat)]
+        results.append({
+            "service": service,
+            "import_s": min(r["import_s"] for r in runs),
+            "ready_s": min(r["ready_s"] for r in runs),
+            "runs": runs,
+        })
+
+    write_results({"benchmark": "startup", "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
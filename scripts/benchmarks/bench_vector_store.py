@@ -0,0 +1,122 @@
+"""
+Benchmark: segment vector store vs Chroma.
+
+For each engine and collection size, in a fresh subprocess:
+- ingest_s:  time to add all vectors
+- qps:       single-vector queries per second (top-k)
+- recall:    overlap of the returned top-k with exact brute-force top-k
+- rss_mb:    resident memory after loading and querying
+
+Vectors are random unit vectors (384-d, like all-MiniLM-L6-v2), so recall
+here is a lower bound: real embeddings cluster and are easier for HNSW.
+
+Usage:
+    python scripts/benchmarks/bench_vector_store.py
+    python scripts/benchmarks/bench_vector_store.py --sizes 1000 50000 --engines segment chroma
+    SEGMENT_DTYPE=float16 python scripts/benchmarks/bench_vector_store.py --engines segment
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import add_service_to_path, current_rss_mb, write_results
+
+DIM = 384
+
+
+def make_data(n: int, n_queries: int, seed: int = 0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.standard_normal((n_queries, DIM)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def worker(engine: str, n: int, n_queries: int, k: int) -> dict:
+    import numpy as np
+
+    vectors, queries = make_data(n, n_queries)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+    tmp = tempfile.mkdtemp(prefix="nyaya-vs-")
+    os.environ["CHROMA_PATH"] = tmp
+    os.environ["SEGMENT_PATH"] = os.path.join(tmp, "segments")
+    add_service_to_path("embedding-service")
+    from utils.vector_store import create_vector_store
+
+    store = create_vector_store(engine)
+    collection = store.get_or_create_collection(1)
+    ids = [f"chunk_{i}" for i in range(n)]
+
+    start = time.perf_counter()
+    batch = 5000  # Chroma limits the size of a single add()
+    for i in range(0, n, batch):
+        collection.add(
+            ids=ids[i:i + batch],
+            documents=[""] * len(ids[i:i + batch]),
+            embeddings=vectors[i:i + batch] if engine == "segment" else vectors[i:i + batch].tolist(),
+            metadatas=[{"chunk_index": j} for j in range(i, min(i + batch, n))],
+        )
+    ingest = time.perf_counter() - start
+
+    # Reopen like a reader process would
+    collection = create_vector_store(engine).get_collection(1)
+    hits = 0
+    start = time.perf_counter()
+    for q, truth in zip(queries, exact):
+        result = collection.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        found = {int(x.split("_")[1]) for x in result["ids"][0]}
+        hits += len(found & set(truth.tolist()))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "engine": engine,
+        "vectors": n,
+        "ingest_s": round(ingest, 2),
+        "qps": round(n_queries / elapsed, 1),
+        "recall_at_k": round(hits / (n_queries * k), 4),
+        "rss_mb": round(current_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=["segment", "chroma"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        engine, n = args.worker
+        print(json.dumps(worker(engine, int(n), args.queries, args.k)))
+        return
+
+    results = []
+    for n in args.sizes:
+        for engine in args.engines:
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", engine, str(n),
+                 "--queries", str(args.queries), "--k", str(args.k)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+
+    write_results(
+        {"benchmark": "vector_store", "k": args.k, "dtype": os.getenv("SEGMENT_DTYPE", "float32"), "results": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark: query-service memory per worker, `uvicorn --workers` vs pre-fork.
+
+Starts the query service with N workers in each mode and measures every
+process once all workers have loaded the model and warmed up:
+
+- uvicorn-workers: `uvicorn main:app --workers N`, each worker a fresh
+                   interpreter that loads its own model
+- prefork:         `python serve.py` (WEB_CONCURRENCY=N), the model loaded
+                   once in the master and shared copy-on-write
+
+For every mode we report, per worker and for the whole service (master
+included):
+- rss_mb:  resident memory; counts shared pages in every process, so it
+           looks the same in both modes
+- pss_mb:  shared pages split between the processes sharing them; the
+           total is what the service really occupies
+- uss_mb:  private pages only, what one more worker costs
+- ready_s: seconds from launch until every worker is warmed up
+
+Uses a throw-away SQLite database and Chroma directory; Kafka is not needed
+(the job worker and document cache listener are turned off).
+
+Usage:
+    python scripts/benchmarks/bench_worker_memory.py
+    python scripts/benchmarks/bench_worker_memory.py --workers 4 --engine onnx
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from _common import SERVICES_DIR, child_pids, shared_memory_mb, write_results
+
+MODES = ["uvicorn-workers", "prefork"]
+SRC = SERVICES_DIR / "query-service" / "src"
+
+
+def _ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def _workers(master: int) -> list:
+    """Worker pids (uvicorn may also start a multiprocessing resource tracker)."""
+    pids = []
+    for pid in child_pids(master):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"resource_tracker" in f.read():
+                    continue
+        except OSError:
+            continue
+        pids.append(pid)
+    return pids
+
+
+def _settled(master: int, workers: int, port: int, timeout: float) -> float:
+    """
+    Wait until every worker has warmed up; returns the time it took.
+
+    /ready only tells about the worker that answered, so we also wait for
+    the workers' memory to stop growing (the warm-up loads the model and
+    runs a first forward pass in each of them).
+    """
+    start = time.monotonic()
+    last, stable_since = None, None
+    while time.monotonic() - start < timeout:
+        pids = _workers(master)
+        rss = [shared_memory_mb(pid).get("rss_mb", 0) for pid in pids]
+        if len(pids) == workers and _ready(port):
+            if last is not None and all(abs(a - b) < 1 for a, b in zip(rss, last)):
+                if time.monotonic() - stable_since >= 3:
+                    return stable_since - start
+            else:
+                stable_since = time.monotonic()
+            last = rss
+        time.sleep(0.5)
+    raise SystemExit(f"workers did not settle within {timeout:.0f}s")
+
+
+def run(mode: str, workers: int, engine: str, port: int, timeout: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-workers-")
+    env = dict(
+        os.environ,
+        DOCKER_ENV="true",
+        EMBEDDING_ENGINE=engine,
+        DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+        VECTOR_STORE="chroma",
+        CHROMA_PATH=os.path.join(workdir, "chroma"),
+        WARM_UP_ON_STARTUP="true",
+        QUERY_JOB_WORKER="false",
+        DOCUMENT_CACHE_TTL_SECONDS="0",
+        LLM_BACKEND="mock",
+        TRACE_EXPORTER="none",
+        ANONYMIZED_TELEMETRY="False",
+    )
+    if mode == "prefork":
+        command = [sys.executable, "serve.py"]
+        env.update(WEB_CONCURRENCY=str(workers), HOST="127.0.0.1", PORT=str(port))
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers)]
+
+    process = subprocess.Popen(command, cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready_s = _settled(process.pid, workers, port, timeout)
+        per_worker = [shared_memory_mb(pid) for pid in _workers(process.pid)]
+        master = shared_memory_mb(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def mean(key):
+        return round(sum(m[key] for m in per_worker) / len(per_worker), 1)
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "ready_s": round(ready_s, 1),
+        "per_worker": {key: mean(key) for key in ("rss_mb", "pss_mb", "uss_mb")},
+        "master": master,
+        "total_pss_mb": round(master["pss_mb"] + sum(m["pss_mb"] for m in per_worker), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--engine", default=os.getenv("EMBEDDING_ENGINE", "torch"))
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--port", type=int, default=8093)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    results = [run(mode, args.workers, args.engine, args.port, args.timeout) for mode in args.modes]
+    write_results(
+        {"benchmark": "worker_memory", "engine": args.engine, "workers": args.workers, "results": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+In-process stand-in for Kafka, used by the end-to-end benchmark.
+
+Implements the part of the kafka-python API the services use
+(KafkaProducer, KafkaConsumer, KafkaAdminClient and their structs) on top
+of one SQLite file. Each service process calls `install(path)` before
+importing its code; processes that share the file share the "broker", so
+the upload service's events reach the embedding consumer exactly as they
+would through Kafka: per-partition offsets, consumer group commits, pause/
+resume, headers and keyed partitioning.
+
+It is not a broker: there is no replication, retention or rebalancing
+between several consumers of one group (each consumer gets every
+partition). That is enough to benchmark one worker per service.
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import namedtuple
+
+# Partitions per topic, as in infrastructure/kafka/topics.yaml
+TOPIC_PARTITIONS = {
+    "document_uploaded": 6,
+    "document_uploaded.bulk": 12,
+    "document_uploaded.dlq": 3,
+    "query_requested": 6,
+    "query_completed": 3,
+    "document_deleted": 6,
+    "document_status": 6,
+}
+DEFAULT_PARTITIONS = 1
+
+TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+OffsetAndMetadata = namedtuple("OffsetAndMetadata", ["offset", "metadata", "leader_epoch"])
+RecordMetadata = namedtuple("RecordMetadata", ["topic", "partition", "offset"])
+ConsumerRecord = namedtuple(
+    "ConsumerRecord", ["topic", "partition", "offset", "timestamp", "key", "value", "headers"]
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    topic TEXT NOT NULL,
+    partition INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    key BLOB,
+    value BLOB,
+    headers TEXT,
+    PRIMARY KEY (topic, partition, offset)
+);
+CREATE TABLE IF NOT EXISTS group_offsets (
+    group_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    partition INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (group_id, topic, partition)
+);
+"""
+
+_path = None
+_local = threading.local()
+
+
+class KafkaError(Exception):
+    pass
+
+
+class NoBrokersAvailable(KafkaError):
+    pass
+
+
+class KafkaTimeoutError(KafkaError):
+    pass
+
+
+def _connect() -> sqlite3.Connection:
+    # One connection per thread; WAL lets readers and the writer overlap
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        if _path is None:
+            raise NoBrokersAvailable("fake_kafka.install() was not called")
+        conn = sqlite3.connect(_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def partitions(topic: str) -> int:
+    return TOPIC_PARTITIONS.get(topic, DEFAULT_PARTITIONS)
+
+
+def _encode_headers(headers) -> str:
+    return "\n".join(f"{k}={v.hex()}" for k, v in headers or [])
+
+
+def _decode_headers(text: str):
+    out = []
+    for line in (text or "").splitlines():
+        key, _, value = line.partition("=")
+        out.append((key, bytes.fromhex(value)))
+    return out
+
+
+class _Future:
+    """Already-completed send result with kafka-python's Future interface."""
+
+    def __init__(self, value=None, exception=None):
+        self.value = value
+        self.exception = exception
+
+    def add_callback(self, f, *args, **kwargs):
+        if self.exception is None:
+            f(*args, self.value, **kwargs)
+        return self
+
+    def add_errback(self, f, *args, **kwargs):
+        if self.exception is not None:
+            f(*args, self.exception, **kwargs)
+        return self
+
+    def get(self, timeout=None):
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def succeeded(self):
+        return self.exception is None
+
+
+class KafkaProducer:
+    def __init__(self, key_serializer=None, value_serializer=None, **config):
+        self.key_serializer = key_serializer
+        self.value_serializer = value_serializer
+        _connect()
+
+    def send(self, topic, value=None, key=None, headers=None, partition=None, timestamp_ms=None):
+        key_bytes = self.key_serializer(key) if key is not None and self.key_serializer else key
+        value_bytes = self.value_serializer(value) if self.value_serializer else value
+        if partition is None:
+            # Keyed messages always land on the same partition, like Kafka's default partitioner
+            partition = zlib.crc32(key_bytes) % partitions(topic) if key_bytes else 0
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            offset = conn.execute(
+                "SELECT COALESCE(MAX(offset) + 1, 0) FROM messages WHERE topic = ? AND partition = ?",
+                (topic, partition),
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (topic, partition, offset, timestamp_ms or int(time.time() * 1000),
+                 key_bytes, value_bytes, _encode_headers(headers)),
+            )
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            return _Future(exception=KafkaError(str(e)))
+        return _Future(RecordMetadata(topic, partition, offset))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+
+class ConsumerRebalanceListener:
+    def on_partitions_revoked(self, revoked):
+        pass
+
+    def on_partitions_assigned(self, assigned):
+        pass
+
+
+class KafkaConsumer:
+    def __init__(self, *topics, group_id=None, value_deserializer=None, key_deserializer=None,
+                 max_poll_records=500, auto_offset_reset="latest", **config):
+        self.group_id = group_id
+        self.value_deserializer = value_deserializer
+        self.key_deserializer = key_deserializer
+        self.max_poll_records = max_poll_records
+        self.auto_offset_reset = auto_offset_reset
+        self._assigned = set()
+        self._paused = set()
+        self._positions = {}
+        _connect()
+        if topics:
+            self.subscribe(list(topics))
+
+    def subscribe(self, topics=None, listener=None):
+        assigned = {TopicPartition(t, p) for t in topics for p in range(partitions(t))}
+        committed = self._committed()
+        ends = self.end_offsets(list(assigned))
+        for tp in assigned:
+            if tp in committed:
+                self._positions[tp] = committed[tp]
+            else:
+                self._positions[tp] = 0 if self.auto_offset_reset == "earliest" else ends[tp]
+        self._assigned = assigned
+        if listener:
+            listener.on_partitions_assigned(assigned)
+
+    def _committed(self):
+        if self.group_id is None:
+            return {}
+        rows = _connect().execute(
+            "SELECT topic, partition, offset FROM group_offsets WHERE group_id = ?", (self.group_id,)
+        ).fetchall()
+        return {TopicPartition(t, p): o for t, p, o in rows}
+
+    def assignment(self):
+        return set(self._assigned)
+
+    def partitions_for_topic(self, topic):
+        return set(range(partitions(topic)))
+
+    def pause(self, *tps):
+        self._paused.update(tps)
+
+    def resume(self, *tps):
+        self._paused.difference_update(tps)
+
+    def position(self, tp):
+        return self._positions.get(tp, 0)
+
+    def end_offsets(self, tps):
+        conn = _connect()
+        out = {}
+        for tp in tps:
+            out[tp] = conn.execute(
+                "SELECT COALESCE(MAX(offset) + 1, 0) FROM messages WHERE topic = ? AND partition = ?",
+                (tp.topic, tp.partition),
+            ).fetchone()[0]
+        return out
+
+    def beginning_offsets(self, tps):
+        return {tp: 0 for tp in tps}
+
+    def _fetch(self):
+        conn = _connect()
+        records = {}
+        budget = self.max_poll_records
+        for tp in sorted(self._assigned - self._paused):
+            if budget <= 0:
+                break
+            rows = conn.execute(
+                "SELECT offset, timestamp, key, value, headers FROM messages "
+                "WHERE topic = ? AND partition = ? AND offset >= ? ORDER BY offset LIMIT ?",
+                (tp.topic, tp.partition, self._positions[tp], budget),
+            ).fetchall()
+            if not rows:
+                continue
+            records[tp] = [
+                ConsumerRecord(
+                    tp.topic, tp.partition, offset, timestamp,
+                    self.key_deserializer(key) if key is not None and self.key_deserializer else key,
+                    self.value_deserializer(value) if self.value_deserializer else value,
+                    _decode_headers(headers),
+                )
+                for offset, timestamp, key, value, headers in rows
+            ]
+            self._positions[tp] = rows[-1][0] + 1
+            budget -= len(rows)
+        return records
+
+    def poll(self, timeout_ms=0, max_records=None):
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while True:
+            records = self._fetch()
+            if records or time.monotonic() >= deadline:
+                return records
+            time.sleep(min(0.02, max(0.0, deadline - time.monotonic())))
+
+    def commit(self, offsets=None):
+        if offsets is None:
+            # Like kafka-python: commit the current position of every partition
+            offsets = {tp: OffsetAndMetadata(pos, "", -1) for tp, pos in self._positions.items()}
+        if self.group_id is None or not offsets:
+            return
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO group_offsets VALUES (?, ?, ?, ?)",
+            [(self.group_id, tp.topic, tp.partition, meta.offset) for tp, meta in offsets.items()],
+        )
+        conn.execute("COMMIT")
+
+    def close(self, autocommit=False):
+        pass
+
+
+class KafkaAdminClient:
+    def __init__(self, **config):
+        _connect()
+
+    def list_consumer_group_offsets(self, group_id):
+        rows = _connect().execute(
+            "SELECT topic, partition, offset FROM group_offsets WHERE group_id = ?", (group_id,)
+        ).fetchall()
+        return {TopicPartition(t, p): OffsetAndMetadata(o, "", -1) for t, p, o in rows}
+
+    def close(self):
+        pass
+
+
+def install(path: str):
+    """Use the SQLite file at `path` as the broker and replace the `kafka` package."""
+    global _path
+    _path = path
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    conn.close()
+
+    kafka = types.ModuleType("kafka")
+    errors = types.ModuleType("kafka.errors")
+    structs = types.ModuleType("kafka.structs")
+    admin = types.ModuleType("kafka.admin")
+    for name in ("KafkaProducer", "KafkaConsumer", "KafkaAdminClient",
+                 "ConsumerRebalanceListener", "TopicPartition", "OffsetAndMetadata"):
+        setattr(kafka, name, globals()[name])
+    for name in ("KafkaError", "NoBrokersAvailable", "KafkaTimeoutError"):
+        setattr(errors, name, globals()[name])
+    for name in ("TopicPartition", "OffsetAndMetadata", "RecordMetadata"):
+        setattr(structs, name, globals()[name])
+    admin.KafkaAdminClient = KafkaAdminClient
+    kafka.errors, kafka.structs, kafka.admin = errors, structs, admin
+    sys.modules.update({"kafka": kafka, "kafka.errors": errors, "kafka.structs": structs, "kafka.admin": admin})
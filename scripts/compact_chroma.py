@@ -0,0 +1,44 @@
+"""
+Compact a local Chroma directory (VECTOR_STORE=chroma) offline.
+
+Deleting a collection leaves its HNSW directory behind, and chroma.sqlite3
+never shrinks on its own. This removes those directories and VACUUMs the
+catalog. Every service keeps the files open while it runs, so the embedding
+and query services must be stopped first; the embedding service's vector GC
+only deletes collections and leaves compaction to this script.
+
+For VECTOR_STORE=chroma-http, stop the Chroma server and run
+`chroma vacuum --path <its data directory>` there instead.
+
+Usage:
+    docker compose stop embedding-service query-service
+    python scripts/compact_chroma.py --path ./chroma_db
+    docker compose start embedding-service query-service
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "services" / "embedding-service" / "src"
+sys.path.insert(0, str(SRC))
+
+from utils.vector_store import compact_chroma_directory  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.getenv("CHROMA_PATH", "./chroma_db"),
+                        help="Chroma persistent directory (default: CHROMA_PATH or ./chroma_db)")
+    args = parser.parse_args()
+
+    if not (Path(args.path) / "chroma.sqlite3").exists():
+        raise SystemExit(f"No Chroma database in {args.path}")
+
+    print(json.dumps(compact_chroma_directory(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
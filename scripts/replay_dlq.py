@@ -0,0 +1,111 @@
+"""
+Replay dead-lettered embedding jobs.
+
+Reads the whole `document_uploaded.dlq` topic (it is small: only messages
+that failed EMBEDDING_MAX_ATTEMPTS times end up there), prints what failed
+and why, and publishes the selected original events back to the lane they
+came from. Nothing is committed, so the DLQ stays intact for later runs;
+use the filters to pick what to replay.
+
+Usage:
+    # List dead letters
+    python scripts/replay_dlq.py
+
+    # Replay everything (after fixing the cause)
+    python scripts/replay_dlq.py --replay
+
+    # Replay selected documents, or one error type, into the bulk lane
+    python scripts/replay_dlq.py --replay --document-id 42 --document-id 43
+    python scripts/replay_dlq.py --replay --error-type OperationalError --lane bulk
+"""
+
+import argparse
+import json
+import os
+
+from kafka import KafkaConsumer, KafkaProducer, TopicPartition
+
+DLQ_TOPIC = os.getenv("EMBEDDING_DLQ_TOPIC", "document_uploaded.dlq")
+LANE_TOPICS = {
+    "interactive": "document_uploaded",
+    "bulk": "document_uploaded.bulk",
+}
+
+
+def read_dead_letters(bootstrap_servers: str):
+    """Every message currently in the DLQ, oldest first per partition."""
+    consumer = KafkaConsumer(
+        bootstrap_servers=bootstrap_servers,
+        enable_auto_commit=False,
+        value_deserializer=lambda x: json.loads(x.decode("utf-8")),
+    )
+    partitions = [TopicPartition(DLQ_TOPIC, p) for p in sorted(consumer.partitions_for_topic(DLQ_TOPIC) or ())]
+    if not partitions:
+        return []
+    consumer.assign(partitions)
+    consumer.seek_to_beginning(*partitions)
+    end = consumer.end_offsets(partitions)
+
+    records = []
+    remaining = {tp for tp in partitions if end[tp] > consumer.position(tp)}
+    while remaining:
+        for tp, messages in consumer.poll(timeout_ms=1000).items():
+            records.extend(messages)
+            if consumer.position(tp) >= end[tp]:
+                remaining.discard(tp)
+    consumer.close()
+    return records
+
+
+def matches(record: dict, args) -> bool:
+    event, failure = record["event"], record["failure"]
+    if args.document_id and event.get("document_id") not in args.document_id:
+        return False
+    if args.error_type and failure.get("error_type") != args.error_type:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bootstrap-servers", default=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"))
+    parser.add_argument("--replay", action="store_true", help="publish the selected events (default: only list)")
+    parser.add_argument("--document-id", type=int, action="append", help="only this document (repeatable)")
+    parser.add_argument("--error-type", help="only failures with this exception type")
+    parser.add_argument("--lane", choices=list(LANE_TOPICS), help="replay into this lane instead of the original")
+    args = parser.parse_args()
+
+    selected = [m.value for m in read_dead_letters(args.bootstrap_servers) if matches(m.value, args)]
+    for record in selected:
+        failure = record["failure"]
+        print(
+            f"document {record['event'].get('document_id')}: {failure['error_type']}: {failure['error']} "
+            f"({failure['attempts']} attempts, {failure['topic']}[{failure['partition']}]@{failure['offset']}, "
+            f"failed at {failure['failed_at']})"
+        )
+    print(f"{len(selected)} dead letter(s) selected")
+
+    if not args.replay or not selected:
+        return
+
+    producer = KafkaProducer(
+        bootstrap_servers=args.bootstrap_servers,
+        key_serializer=lambda k: str(k).encode("utf-8"),
+        value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+        acks="all",
+    )
+    replayed = 0
+    for record in selected:
+        event = record["event"]
+        if "document_id" not in event:
+            print(f"Skipping malformed event: {event}")
+            continue
+        topic = LANE_TOPICS[args.lane] if args.lane else record["failure"]["topic"]
+        producer.send(topic, key=event["document_id"], value=event)
+        replayed += 1
+    producer.flush()
+    print(f"Replayed {replayed} event(s)")
+
+
+if __name__ == "__main__":
+    main()
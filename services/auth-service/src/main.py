@@ -34,6 +34,7 @@ from dependencies import get_current_user  # JWT token validation
 from models import User  # User database model
 from schemas import Token, UserCreate, UserOut  # Request/Response data structures
 from utils.auth import create_access_token, get_password_hash, verify_password  # Password & JWT utilities
+from utils.metrics import instrument  # Prometheus /metrics endpoint
 
 # ==============================================================================
 # DATABASE INITIALIZATION
@@ -66,6 +67,12 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# ==============================================================================
+# METRICS
+# ==============================================================================
+# GET /metrics: request latency per route and database connection pool usage
+instrument(app, engine)
+
 # ==============================================================================
 # API ENDPOINTS
 # ==============================================================================
@@ -1,62 +1,479 @@
-from kafka import KafkaConsumer
+from kafka import ConsumerRebalanceListener, KafkaConsumer, TopicPartition
+from kafka.errors import NoBrokersAvailable
+from kafka.structs import OffsetAndMetadata
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+import heapq
 import json
 import os
+import threading
+import time
+from prometheus_client import Counter, Histogram
 from sqlalchemy.orm import Session
 
 # Use absolute imports so this works when main.py is executed as a script
 from database import SessionLocal
 from models import Document
 from utils.embedding import generate_and_store_embeddings
+from utils.clause_pipeline import schedule_clause_summaries, summary_worker
+from utils.dead_letter import publish_dead_letter
+from utils.status_events import publish_status
+from utils.metrics import gauge_callback
+from utils.tracing import span, traceparent_from_headers
 
-consumer = KafkaConsumer(
-    'document_uploaded',
-    bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
-    auto_offset_reset='earliest',      # For dev — change to 'latest' in prod
-    enable_auto_commit=False,          # Manual commit for safety
-    group_id='embedding-service-group',
-    value_deserializer=lambda x: json.loads(x.decode('utf-8'))
+# Priority lanes (see infrastructure/kafka/topics.yaml)
+LANES = {
+    "document_uploaded": "interactive",
+    "document_uploaded.bulk": "bulk",
+}
+# Interactive messages processed per bulk message when both lanes have work,
+# so interactive uploads go first but bulk imports are never starved
+INTERACTIVE_WEIGHT = int(os.getenv("EMBEDDING_INTERACTIVE_WEIGHT", "4"))
+# Fetched-but-unfinished messages (buffered or waiting to retry) held per lane
+# before its partitions are paused
+LANE_BUFFER_SIZE = int(os.getenv("EMBEDDING_LANE_BUFFER", "50"))
+# A failing message is retried with exponential backoff (1s, 2s, 4s, ...),
+# without blocking other messages, then moved to the dead-letter topic
+MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1"))
+RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_RETRY_MAX_BACKOFF", "60"))
+# How often consumer lag is read from the brokers for /metrics
+CONSUMER_LAG_INTERVAL_SECONDS = float(os.getenv("CONSUMER_LAG_INTERVAL_SECONDS", "15"))
+
+# The consumer connects lazily from the background thread, so importing this
+# module never blocks and a missing broker does not crash startup
+consumer = None
+_consumer_lock = threading.Lock()
+
+# Reported by the /ready endpoint
+consumer_state = {
+    "connected": False,
+    "last_error": None,
+    "buffered": {"interactive": 0, "bulk": 0},
+    "retrying": 0,
+    "dead_lettered": 0,
+    "lag": {"interactive": 0, "bulk": 0},
+}
+
+# Prometheus metrics (GET /metrics). Consumer lag is what the embedding
+# workers' HorizontalPodAutoscaler scales on (kubernetes/embedding-service-hpa.yaml)
+DOCUMENT_SECONDS = Histogram(
+    "embedding_document_processing_seconds",
+    "Time to embed one document, from dequeue to ready",
+    ["lane"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+UPLOAD_TO_READY_SECONDS = Histogram(
+    "embedding_upload_to_ready_seconds",
+    "Time from upload to embeddings ready, including time queued in Kafka",
+    ["lane"],
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+DOCUMENTS_PROCESSED = Counter(
+    "embedding_documents_processed_total",
+    "Documents handled by the consumer",
+    ["lane", "outcome"],  # outcome: ready | deleted | retry | dead_lettered
 )
+gauge_callback(
+    "embedding_consumer_lag",
+    "Messages not yet processed on this worker's partitions",
+    lambda: consumer_state["lag"],
+    ["lane"],
+)
+gauge_callback(
+    "embedding_queue_depth",
+    "Messages held by this worker, by state",
+    lambda: {
+        "buffered_interactive": consumer_state["buffered"]["interactive"],
+        "buffered_bulk": consumer_state["buffered"]["bulk"],
+        "retrying": consumer_state["retrying"],
+        "clause_summaries": summary_worker.pending(),
+    },
+    ["queue"],
+)
+
+
+def _deserialize(raw: bytes):
+    # A malformed message must not crash poll(); it is dead-lettered instead
+    try:
+        value = json.loads(raw.decode('utf-8'))
+        if isinstance(value, dict):
+            return value
+    except ValueError:
+        pass
+    return {"raw": raw.decode('utf-8', errors='replace')}
 
-def update_document_status(document_id: int, status: str):
+
+def get_consumer() -> KafkaConsumer:
+    global consumer
+    if consumer is None:
+        with _consumer_lock:
+            if consumer is None:
+                consumer = KafkaConsumer(
+                    bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                    auto_offset_reset='earliest',      # For dev — change to 'latest' in prod
+                    enable_auto_commit=False,          # Manual commit for safety
+                    group_id='embedding-service-group',
+                    value_deserializer=_deserialize,
+                    max_poll_records=LANE_BUFFER_SIZE,
+                )
+                consumer.subscribe(topics=list(LANES), listener=_RebalanceListener())
+    return consumer
+
+def update_document_status(document_id: int, status: str) -> bool:
+    """Set the document's status; False if it no longer exists (deleted)."""
     db: Session = SessionLocal()
     try:
         doc = db.query(Document).filter(Document.id == document_id).first()
         if doc:
             doc.status = status
             db.commit()
-        else:
-            print(f"Document {document_id} not found in DB")
+            # Query-service replicas drop their cached copy of the status
+            publish_status(document_id, status)
+            return True
+        print(f"Document {document_id} not found in DB")
+        return False
     finally:
         db.close()
 
-def process_event(event: dict):
-    document_id = event.get("document_id")
+class InvalidEventError(ValueError):
+    """An event that can never succeed; it goes straight to the dead-letter topic."""
+
+
+def process_event(event: dict, traceparent: Optional[str] = None, lane: str = "interactive") -> bool:
+    """
+    Embed one uploaded document. Raises on failure; the caller decides whether to retry.
+    Returns False if the document was deleted before its turn came.
+
+    `traceparent` (from the Kafka message headers) continues the trace that
+    started with the upload request.
+    """
+    if not event.get("document_id"):
+        raise InvalidEventError("Invalid event: missing document_id")
+
+    document_id = event["document_id"]
     extracted_text = event.get("extracted_text", "")
-    
-    if not document_id:
-        print("Invalid event: missing document_id")
+
+    with span("embedding.process_document", parent=traceparent, document_id=document_id) as s:
+        with span("db.status"):
+            if not update_document_status(document_id, "processing"):
+                return False  # deleted while queued: nothing to embed
+
+        # Background clause summaries pause while a document is embedded
+        summary_worker.mark_busy()
+        try:
+            chunks, clause_types = generate_and_store_embeddings(document_id, extracted_text)
+        finally:
+            summary_worker.mark_idle()
+
+        with span("db.status"):
+            update_document_status(document_id, "ready")
+
+        schedule_clause_summaries(document_id, chunks, clause_types)
+
+    DOCUMENT_SECONDS.labels(lane=lane).observe(s.duration_ms / 1000)
+    _record_upload_to_ready(event, traceparent, lane)
+    return True
+
+
+def _record_upload_to_ready(event: dict, traceparent: Optional[str], lane: str):
+    # One span from the upload's timestamp to now: the end-to-end latency a
+    # user sees, including time spent waiting in Kafka
+    try:
+        uploaded = datetime.fromisoformat(event["timestamp"]).replace(tzinfo=timezone.utc)
+    except (KeyError, TypeError, ValueError):
         return
-    
+    start_ns = int(uploaded.timestamp() * 1e9)
+    with span("document.upload_to_ready", parent=traceparent, start_ns=start_ns,
+              document_id=event["document_id"]) as s:
+        pass
+    UPLOAD_TO_READY_SECONDS.labels(lane=lane).observe(s.duration_ms / 1000)
+
+
+def _offset(value: int) -> OffsetAndMetadata:
+    # kafka-python >= 2.1 added a leader_epoch field
     try:
-        print(f"Processing document {document_id}...")
-        update_document_status(document_id, "processing")
-        
-        generate_and_store_embeddings(document_id, extracted_text)
-        
-        update_document_status(document_id, "ready")
-        print(f"Document {document_id} embeddings ready!")
-        
-        # Commit offset only on success
-        consumer.commit()
-        
+        return OffsetAndMetadata(value, "", -1)
+    except TypeError:
+        return OffsetAndMetadata(value, "")
+
+
+class OffsetTracker:
+    """
+    Per-partition record of which fetched messages are finished.
+
+    Messages finish out of order (retries wait while later messages go
+    ahead), so a partition is only committed up to its first unfinished
+    message. A restart then re-delivers that message and anything after
+    it, and never skips one that did not succeed or reach the DLQ.
+    """
+
+    def __init__(self):
+        self._pending: Dict[TopicPartition, Set[int]] = {}
+        self._next: Dict[TopicPartition, int] = {}  # one past the highest offset fetched
+        self._committed: Dict[TopicPartition, int] = {}
+
+    def received(self, message):
+        tp = TopicPartition(message.topic, message.partition)
+        self._pending.setdefault(tp, set()).add(message.offset)
+        self._next[tp] = max(self._next.get(tp, 0), message.offset + 1)
+        # The group's position when we started reading this partition
+        self._committed.setdefault(tp, message.offset)
+
+    def done(self, message):
+        tp = TopicPartition(message.topic, message.partition)
+        self._pending.get(tp, set()).discard(message.offset)
+
+    def committable(self, partitions=None) -> Dict[TopicPartition, OffsetAndMetadata]:
+        offsets = {}
+        for tp, next_offset in self._next.items():
+            if partitions is not None and tp not in partitions:
+                continue
+            pending = self._pending.get(tp)
+            point = min(pending) if pending else next_offset
+            if point > self._committed[tp]:
+                offsets[tp] = _offset(point)
+        return offsets
+
+    def committed(self, offsets: Dict[TopicPartition, OffsetAndMetadata]):
+        for tp, meta in offsets.items():
+            self._committed[tp] = meta.offset
+
+    def position(self, tp: TopicPartition) -> Optional[int]:
+        """Offset this worker would resume from: its first unfinished message."""
+        if tp not in self._next:
+            return None
+        pending = self._pending.get(tp)
+        return min(pending) if pending else self._next[tp]
+
+    def forget(self, partitions):
+        for tp in partitions:
+            self._pending.pop(tp, None)
+            self._next.pop(tp, None)
+            self._committed.pop(tp, None)
+
+
+class LaneScheduler:
+    """
+    Weighted-fair choice between the interactive and bulk lanes.
+
+    Messages are buffered per lane after each poll. While both lanes have
+    work, `weight` interactive messages are taken for every bulk message. A
+    lane whose buffer is full has its partitions paused, so a flood of bulk
+    messages cannot crowd interactive ones out of the fetches. Failed
+    messages wait in a retry heap until their backoff has passed; they still
+    count against their lane's buffer, so a burst of failures pauses the lane
+    instead of letting the heap grow while new messages keep being fetched.
+    """
+
+    def __init__(self, weight: int, buffer_size: int):
+        self.weight = max(1, weight)
+        self.buffer_size = buffer_size
+        self.buffers = {"interactive": deque(), "bulk": deque()}
+        self._credits = self.weight
+        self._retries = []  # heap of (due time, sequence, message)
+        self._retrying = {"interactive": 0, "bulk": 0}
+        self._sequence = 0
+
+    def add(self, records: dict):
+        for tp, messages in records.items():
+            self.buffers[LANES[tp.topic]].extend(messages)
+
+    def retry_later(self, message, delay: float):
+        self._sequence += 1
+        heapq.heappush(self._retries, (time.monotonic() + delay, self._sequence, message))
+        self._retrying[LANES[message.topic]] += 1
+
+    def has_work(self) -> bool:
+        due = self._retries and self._retries[0][0] <= time.monotonic()
+        return bool(due) or any(self.buffers.values())
+
+    def poll_timeout_ms(self) -> int:
+        if self.has_work():
+            return 0
+        if self._retries:
+            return max(0, min(1000, int((self._retries[0][0] - time.monotonic()) * 1000)))
+        return 1000
+
+    def next_message(self):
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            message = heapq.heappop(self._retries)[2]
+            self._retrying[LANES[message.topic]] -= 1
+            return message
+        interactive, bulk = self.buffers["interactive"], self.buffers["bulk"]
+        if interactive and (self._credits > 0 or not bulk):
+            self._credits -= 1
+            return interactive.popleft()
+        if bulk:
+            self._credits = self.weight
+            return bulk.popleft()
+        return None
+
+    def drop(self, partitions):
+        """Forget messages of partitions this consumer no longer owns."""
+        owned = {(tp.topic, tp.partition) for tp in partitions}
+        for lane, buffer in self.buffers.items():
+            self.buffers[lane] = deque(m for m in buffer if (m.topic, m.partition) not in owned)
+        self._retries = [r for r in self._retries if (r[2].topic, r[2].partition) not in owned]
+        heapq.heapify(self._retries)
+        self._retrying = {lane: 0 for lane in self.buffers}
+        for _, _, message in self._retries:
+            self._retrying[LANES[message.topic]] += 1
+
+    def held(self, lane: str) -> int:
+        """Messages of a lane fetched but not finished: buffered or waiting to retry."""
+        return len(self.buffers[lane]) + self._retrying[lane]
+
+    def apply_flow_control(self, kafka_consumer: KafkaConsumer):
+        assigned = kafka_consumer.assignment()
+        for lane, buffer in self.buffers.items():
+            partitions = [tp for tp in assigned if LANES[tp.topic] == lane]
+            held = self.held(lane)
+            if held >= self.buffer_size:
+                kafka_consumer.pause(*partitions)
+            elif held <= self.buffer_size // 2:
+                kafka_consumer.resume(*partitions)
+            consumer_state["buffered"][lane] = len(buffer)
+        consumer_state["retrying"] = len(self._retries)
+
+
+scheduler = LaneScheduler(INTERACTIVE_WEIGHT, LANE_BUFFER_SIZE)
+tracker = OffsetTracker()
+# (topic, partition, offset) -> (attempts so far, time of first failure)
+_failures: Dict[tuple, tuple] = {}
+# (topic, partition, offset) -> final error of messages waiting to reach the DLQ
+_dlq_pending: Dict[tuple, Exception] = {}
+
+
+def _commit_progress(kafka_consumer: KafkaConsumer, partitions=None):
+    offsets = tracker.committable(partitions)
+    if not offsets:
+        return
+    try:
+        kafka_consumer.commit(offsets)
+        tracker.committed(offsets)
     except Exception as e:
-        print(f"Error processing document {document_id}: {e}")
+        # Harmless: the same messages are re-delivered and the next commit covers them
+        print(f"Offset commit failed: {e}")
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    def on_partitions_revoked(self, revoked):
+        # Save progress, then drop work another consumer will now own
+        _commit_progress(consumer, set(revoked))
+        tracker.forget(revoked)
+        scheduler.drop(revoked)
+        lost = {(tp.topic, tp.partition) for tp in revoked}
+        for key in [k for k in _failures if k[:2] in lost]:
+            del _failures[key]
+        for key in [k for k in _dlq_pending if k[:2] in lost]:
+            del _dlq_pending[key]
+
+    def on_partitions_assigned(self, assigned):
+        pass
+
+
+def _update_lag(kafka_consumer: KafkaConsumer):
+    # Lag counts everything not yet finished: unfetched, buffered and retrying messages
+    assigned = list(kafka_consumer.assignment())
+    lag = {lane: 0 for lane in LANES.values()}
+    if assigned:
+        for tp, end in kafka_consumer.end_offsets(assigned).items():
+            position = tracker.position(tp)
+            if position is None:
+                position = kafka_consumer.position(tp)
+            lag[LANES[tp.topic]] += max(0, end - position)
+    consumer_state["lag"] = lag
+
+
+def _dead_letter(message, error: Exception) -> bool:
+    """Move a message that failed for good to the DLQ; False if Kafka did not take it yet."""
+    key = (message.topic, message.partition, message.offset)
+    attempts, first_failed_at = _failures[key]
+    if not publish_dead_letter(message, error, attempts, first_failed_at):
+        # Kafka unavailable: keep the message (uncommitted) and retry only the
+        # publish later, never the processing itself again
+        _dlq_pending[key] = error
+        scheduler.retry_later(message, RETRY_MAX_BACKOFF_SECONDS)
+        return False
+
+    _failures.pop(key, None)
+    consumer_state["dead_lettered"] += 1
+    DOCUMENTS_PROCESSED.labels(lane=LANES[message.topic], outcome="dead_lettered").inc()
+    document_id = message.value.get("document_id")
+    if document_id:
         update_document_status(document_id, "error")
-        # Don't commit — will retry on restart
+    return True
+
+
+def _handle(kafka_consumer: KafkaConsumer, message):
+    key = (message.topic, message.partition, message.offset)
+    lane = LANES[message.topic]
+    # Set if the message already failed for good and only its DLQ publish is left
+    error = _dlq_pending.pop(key, None)
+    if error is None:
+        try:
+            processed = process_event(message.value, traceparent_from_headers(message.headers), lane)
+            DOCUMENTS_PROCESSED.labels(lane=lane, outcome="ready" if processed else "deleted").inc()
+            _failures.pop(key, None)
+        except Exception as e:
+            attempts, first_failed_at = _failures.get(key, (0, time.time()))
+            attempts += 1
+            _failures[key] = (attempts, first_failed_at)
+            document_id = message.value.get("document_id")
+            print(f"Error processing document {document_id} (attempt {attempts}/{MAX_ATTEMPTS}): {e}")
+
+            if not isinstance(e, InvalidEventError) and attempts < MAX_ATTEMPTS:
+                DOCUMENTS_PROCESSED.labels(lane=lane, outcome="retry").inc()
+                scheduler.retry_later(message, min(RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), RETRY_MAX_BACKOFF_SECONDS))
+                return
+            error = e
+
+    if error is not None and not _dead_letter(message, error):
+        return
+
+    tracker.done(message)
+    _commit_progress(kafka_consumer)
+
+
+def _connect_with_retry() -> KafkaConsumer:
+    # Keep retrying in the background instead of failing startup
+    wait = 2
+    while True:
+        try:
+            kafka_consumer = get_consumer()
+            consumer_state.update(connected=True, last_error=None)
+            return kafka_consumer
+        except NoBrokersAvailable as e:
+            consumer_state.update(connected=False, last_error=str(e))
+            print(f"Kafka not ready, retrying in {wait}s")
+            time.sleep(wait)
+            wait = min(wait * 2, 30)
+
 
 def run_consumer():
+    kafka_consumer = _connect_with_retry()
     print("Embedding Service Consumer Started — Waiting for events...")
-    for message in consumer:
-        event = message.value
-        print(f"Received event for document {event.get('document_id')}")
-        process_event(event)
\ No newline at end of file
+    next_lag_update = 0.0
+    while True:
+        # Poll between every message so new interactive uploads are seen
+        # right away; block only when there is nothing to do
+        records = kafka_consumer.poll(timeout_ms=scheduler.poll_timeout_ms())
+        for messages in records.values():
+            for message in messages:
+                tracker.received(message)
+        scheduler.add(records)
+        scheduler.apply_flow_control(kafka_consumer)
+
+        if time.monotonic() >= next_lag_update:
+            next_lag_update = time.monotonic() + CONSUMER_LAG_INTERVAL_SECONDS
+            try:
+                _update_lag(kafka_consumer)
+            except Exception as e:
+                print(f"Could not read consumer lag: {e}")
+
+        message = scheduler.next_message()
+        if message is None:
+            continue
+        _handle(kafka_consumer, message)
@@ -1,7 +1,9 @@
+import os
 import sys
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import threading
 
 # Ensure local imports work when running as a script (python main.py)
@@ -16,9 +18,23 @@ if str(PARENT_DIR) not in sys.path:
 
 # Work whether executed as a module or script
 try:
-    from consumer import run_consumer
+    from consumer import consumer_state, run_consumer
+    from database import engine
+    from utils.clause_pipeline import summary_worker
+    from utils.embedding import chunk_cache, loaded_components, warm_up
+    from utils.metrics import instrument
+    from utils.vector_gc import gc_state, start_vector_gc
 except ImportError:
-    from .consumer import run_consumer  # type: ignore
+    from .consumer import consumer_state, run_consumer  # type: ignore
+    from .database import engine  # type: ignore
+    from .utils.clause_pipeline import summary_worker  # type: ignore
+    from .utils.embedding import chunk_cache, loaded_components, warm_up  # type: ignore
+    from .utils.metrics import instrument  # type: ignore
+    from .utils.vector_gc import gc_state, start_vector_gc  # type: ignore
+
+# Load the model / vector store in the background right after startup
+# (set to "false" to load on the first document instead)
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
 
 app = FastAPI(title="NyayaAI Embedding Service")
 
@@ -31,6 +47,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics at GET /metrics (consumer lag, chunks/sec, ...)
+instrument(app, engine)
+
 @app.on_event("startup")
 async def startup_event():
     # Run consumer in background thread
@@ -38,6 +57,15 @@ async def startup_event():
     consumer_thread.start()
     print("Kafka consumer thread started")
 
+    if WARM_UP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    # Summarize clauses still pending from before a restart (CLAUSE_PIPELINE only)
+    summary_worker.start()
+
+    # Drop the vectors of deleted documents; sweep and compact the store
+    start_vector_gc()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -47,6 +75,46 @@ async def shutdown_event():
 def health():
     return {"status": "healthy", "service": "embedding-service"}
 
+
+@app.get("/live")
+def live():
+    # Liveness: the process is up; never touches the model, Kafka or the vector store
+    return {"status": "alive", "service": "embedding-service"}
+
+
+@app.get("/ready")
+def ready():
+    # Readiness: model loaded, vector store open and Kafka consumer connected
+    components = loaded_components()
+    components["kafka_consumer"] = consumer_state["connected"]
+    is_ready = all(components.values())
+    body = {
+        "status": "ready" if is_ready else "starting",
+        "service": "embedding-service",
+        "loaded": components,
+        "kafka_error": consumer_state["last_error"],
+        "queue": {
+            "buffered": consumer_state["buffered"],
+            "retrying": consumer_state["retrying"],
+            "dead_lettered": consumer_state["dead_lettered"],
+            "lag": consumer_state["lag"],
+        },
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/stats")
+def stats():
+    # Share of chunks served from the chunk embedding cache instead of the model
+    return {"chunk_cache": chunk_cache.stats()}
+
+
+@app.get("/gc")
+def gc_report():
+    # Deletions handled and the last orphan sweep / compaction (utils/vector_gc.py)
+    return gc_state
+
+
 @app.get("/")
 def root():
     return {"message": "Embedding Service Running - Day 4 Complete"}
\ No newline at end of file
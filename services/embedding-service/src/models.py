@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, DateTime, Integer, String, Text
 from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
 
 Base = declarative_base()
 
@@ -7,4 +8,18 @@ class Document(Base):
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True)
     status = Column(String, default="uploaded")
-    # Add other fields if needed
\ No newline at end of file
+    # Add other fields if needed
+
+
+class ClauseSummary(Base):
+    """Pre-computed summary of one clause type in one document (owned by this service)."""
+    __tablename__ = "clause_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, nullable=False, index=True)
+    clause_type = Column(String, nullable=False)
+    chunk_indices = Column(Text, nullable=False)  # JSON list of chunk numbers
+    chunk_texts = Column(Text, nullable=True)  # JSON list of the texts to summarize
+    summary = Column(Text, nullable=True)  # Filled in by the background job
+    status = Column(String, default="pending")  # pending → ready → error
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,197 @@
+"""
+Chunk Embedding Cache
+
+Legal templates repeat most of their boilerplate (the same arbitration
+clause, the same stamp-duty paragraph) across documents that differ as a
+whole. Chunks are therefore cached by content: before a document is
+encoded, every chunk is looked up by the SHA-256 of its exact text, and
+only chunks never seen before go to the model.
+
+How it works:
+1. One SQLite file per model + engine (vectors of different engines are
+   close but not identical), shared by every worker that mounts
+   CHUNK_CACHE_DIR, holding key -> float32 blob and the time it was last used.
+2. Lookups and inserts go in batches of a whole store batch, one statement
+   each; hits refresh their last-used time, also in one statement.
+3. Above CHUNK_CACHE_MAX_ENTRIES the least recently used entries are
+   evicted, 5% at a time so eviction is not paid on every insert.
+
+Hit ratio: embedding_chunk_cache_lookups_total{result="hit"|"miss"} on
+/metrics, and `stats()` (GET /stats).
+
+Configuration (environment variables):
+- CHUNK_CACHE_DIR:         Directory of the cache file (default: ~/.cache/nyayaai-chunks)
+- CHUNK_CACHE_MAX_ENTRIES: Entries kept on disk (default: 200000, ~300 MB
+                           at 384 dimensions; 0 disables the cache)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from prometheus_client import Counter
+
+CHUNK_CACHE_DIR = os.getenv("CHUNK_CACHE_DIR", str(Path.home() / ".cache" / "nyayaai-chunks"))
+CHUNK_CACHE_MAX_ENTRIES = int(os.getenv("CHUNK_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_SLICE = 500
+
+LOOKUPS = Counter(
+    "embedding_chunk_cache_lookups_total",
+    "Chunk embedding cache lookups",
+    ["result"],  # hit | miss
+)
+
+
+class ChunkEmbeddingCache:
+    """
+    Persistent content-hash -> vector cache with LRU eviction.
+
+    Args:
+        cache_dir: Directory of the SQLite file ("" disables the cache)
+        namespace: Model + engine the vectors belong to
+        max_entries: Entries kept before the least recently used are evicted
+
+    Example:
+        >>> cache = ChunkEmbeddingCache("/tmp/cache", "all-MiniLM-L6-v2-torch")
+        >>> vectors = cache.get_many(chunks)  # None for every miss
+        >>> cache.put_many(new_chunks, new_vectors)
+    """
+
+    def __init__(self, cache_dir: str, namespace: str, max_entries: int = CHUNK_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.path: Optional[str] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+        if not cache_dir or max_entries <= 0:
+            return
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", namespace).strip("_")
+            self.path = os.path.join(cache_dir, f"chunk_embeddings_{safe}.sqlite3")
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key BLOB PRIMARY KEY, vector BLOB NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_used_at ON embeddings (used_at)")
+            conn.commit()
+            self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except (OSError, sqlite3.Error) as e:
+            print(f"Chunk embedding cache disabled: {e}")
+            self.path = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector for each text, or None where it was never encoded."""
+        if not self.enabled or not texts:
+            return [None] * len(texts)
+        keys = [self._key(t) for t in texts]
+        found = {}
+        try:
+            conn = self._conn()
+            for i in range(0, len(keys), _LOOKUP_SLICE):
+                part = keys[i:i + _LOOKUP_SLICE]
+                marks = ",".join("?" * len(part))
+                found.update(conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ))
+                hits = [k for k in part if k in found]
+                if hits:
+                    conn.execute(
+                        f"UPDATE embeddings SET used_at = ? WHERE key IN ({','.join('?' * len(hits))})",
+                        [time.time(), *hits],
+                    )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Chunk embedding cache read failed: {e}")
+        vectors = [
+            np.frombuffer(found[k], dtype=np.float32) if k in found else None
+            for k in keys
+        ]
+        hits = sum(v is not None for v in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        LOOKUPS.labels(result="hit").inc(hits)
+        LOOKUPS.labels(result="miss").inc(len(vectors) - hits)
+        return vectors
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Store freshly encoded vectors (float32), evicting old entries if full."""
+        if not self.enabled or not texts:
+            return
+        now = time.time()
+        rows = [
+            (self._key(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        try:
+            conn = self._conn()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)", rows
+            )
+            added = conn.total_changes - before
+            conn.commit()
+            with self._lock:
+                self._count += added
+                full = self._count > self.max_entries
+            if full:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Chunk embedding cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        # Least recently used first; 5% below the limit so this runs rarely
+        target = int(self.max_entries * 0.95)
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > target:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN"
+                " (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)",
+                (count - target,),
+            )
+            conn.commit()
+            count = target
+        with self._lock:
+            self._count = count
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
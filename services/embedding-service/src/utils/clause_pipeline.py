@@ -0,0 +1,242 @@
+"""
+Clause Pipeline - Pre-computed Clause Summaries
+
+Optional stage that runs after a document's embeddings are stored
+(enable with CLAUSE_PIPELINE=true):
+
+1. Classify: every chunk is matched to a clause type (rent, notice period,
+   lock-in, ...) by nearest centroid on the embeddings we already computed.
+   This is instant and happens during ingestion.
+2. Record: one `clause_summaries` row per clause type found, status "pending"
+   (the table is created by the upload service's migrations).
+3. Summarize: a single low-priority background worker asks the LLM for a
+   short summary of each clause. It only runs when the service has been idle
+   for CLAUSE_SUMMARY_IDLE_SECONDS (no document being embedded) and, if
+   CLAUSE_SUMMARY_HOURS is set (e.g. "22-7"), only during those hours, so
+   LLM load moves away from peak interactive time. It works through the
+   pending rows, so summaries cut short by a restart are done after it.
+
+The query service can then answer common questions ("What is the notice
+period?") from the stored summary without retrieval and generation.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import SessionLocal
+from models import ClauseSummary
+
+from .clause_types import ClauseClassifier
+from .embedding import get_model
+from .llm import DISCLAIMER, get_llm_backend
+
+CLAUSE_PIPELINE = os.getenv("CLAUSE_PIPELINE", "false").lower() == "true"
+CLAUSE_CHUNK_THRESHOLD = float(os.getenv("CLAUSE_CHUNK_THRESHOLD", "0.35"))
+CLAUSE_MAX_CHUNKS = int(os.getenv("CLAUSE_MAX_CHUNKS", "4"))  # chunks sent per summary
+CLAUSE_SUMMARY_IDLE_SECONDS = float(os.getenv("CLAUSE_SUMMARY_IDLE_SECONDS", "30"))
+CLAUSE_SUMMARY_HOURS = os.getenv("CLAUSE_SUMMARY_HOURS", "")  # e.g. "22-7", empty = any time
+
+# Summaries are always English: the query service returns them directly only
+# for English questions and otherwise lets the LLM answer from them
+SUMMARY_PROMPT = """
+You are NyayaAI. Summarize the following clause of a legal document for a common citizen in India.
+Clause type: {clause_type}
+
+{context}
+
+Write 2-4 short sentences in plain English. Mention amounts, dates and time periods exactly as written.
+Do not give legal advice.
+"""
+
+classifier = ClauseClassifier(
+    lambda texts: get_model().encode(texts, normalize_embeddings=True)
+)
+
+
+def classify_chunks(embeddings) -> List[Optional[str]]:
+    """Clause type (or None) for each chunk embedding."""
+    if not CLAUSE_PIPELINE or len(embeddings) == 0:
+        return [None] * len(embeddings)
+    return classifier.classify(embeddings, CLAUSE_CHUNK_THRESHOLD)
+
+
+def group_by_clause(clause_types: List[Optional[str]]) -> Dict[str, List[int]]:
+    groups: Dict[str, List[int]] = {}
+    for i, clause_type in enumerate(clause_types):
+        if clause_type:
+            groups.setdefault(clause_type, []).append(i)
+    return groups
+
+
+def summarize_clause(clause_type: str, chunks: List[str]) -> str:
+    prompt = SUMMARY_PROMPT.format(
+        clause_type=clause_type.replace("_", " "),
+        context="\n\n".join(chunks[:CLAUSE_MAX_CHUNKS]),
+    )
+    summary = get_llm_backend().chat([{"role": "user", "content": prompt}]).strip()
+    # The disclaimer is added when the summary is shown, not stored twice
+    return summary.replace(DISCLAIMER, "").strip()
+
+
+def _in_allowed_hours(now: datetime) -> bool:
+    if not CLAUSE_SUMMARY_HOURS:
+        return True
+    start, end = (int(h) for h in CLAUSE_SUMMARY_HOURS.split("-"))
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end  # window crosses midnight
+
+
+class ClauseSummaryWorker:
+    """
+    One background thread that summarizes clauses when the service is idle.
+
+    The `clause_summaries` table is the queue: the worker always takes the
+    oldest "pending" row, so rows left behind by a restart or a crash are
+    picked up again once the service is back. `submit()` only wakes it up.
+    Ingestion calls `mark_busy()` while embedding so summaries never compete
+    with it.
+    """
+
+    # Pending rows are also looked for this often without a wake-up
+    POLL_SECONDS = 60
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._last_activity = time.monotonic()
+
+    def mark_busy(self):
+        with self._lock:
+            self._busy += 1
+            self._last_activity = time.monotonic()
+
+    def mark_idle(self):
+        with self._lock:
+            self._busy = max(0, self._busy - 1)
+            self._last_activity = time.monotonic()
+
+    def _idle(self) -> bool:
+        with self._lock:
+            quiet_for = time.monotonic() - self._last_activity
+            return self._busy == 0 and quiet_for >= CLAUSE_SUMMARY_IDLE_SECONDS
+
+    def start(self):
+        """Start the worker thread (no-op unless CLAUSE_PIPELINE=true)."""
+        if not CLAUSE_PIPELINE or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="clause-summaries", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self):
+        """New pending rows were written: start the worker or wake it up."""
+        self.start()
+        self._wake.set()
+
+    def pending(self) -> int:
+        if not CLAUSE_PIPELINE:
+            return 0
+        db = SessionLocal()
+        try:
+            return db.query(ClauseSummary).filter(ClauseSummary.status == "pending").count()
+        except Exception:
+            return 0
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                job = _next_pending()
+            except Exception as e:
+                print(f"Could not read pending clause summaries: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.POLL_SECONDS)
+                continue
+
+            row_id, document_id, clause_type, chunks = job
+            # Wait for an idle moment before every LLM call
+            while not (self._idle() and _in_allowed_hours(datetime.now())):
+                time.sleep(5)
+            try:
+                if not chunks:
+                    raise ValueError("no clause text stored")
+                summary = summarize_clause(clause_type, chunks)
+                _save_summary(row_id, summary, "ready")
+            except Exception as e:
+                print(f"Clause summary failed for doc {document_id} ({clause_type}): {e}")
+                _save_summary(row_id, None, "error")
+
+
+summary_worker = ClauseSummaryWorker()
+
+
+def _next_pending() -> Optional[tuple]:
+    """(row id, document id, clause type, chunk texts) of the oldest pending row."""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(ClauseSummary)
+            .filter(ClauseSummary.status == "pending")
+            .order_by(ClauseSummary.id)
+            .first()
+        )
+        if row is None:
+            return None
+        return row.id, row.document_id, row.clause_type, json.loads(row.chunk_texts or "[]")
+    finally:
+        db.close()
+
+
+def _save_summary(row_id: int, summary: Optional[str], status: str):
+    db = SessionLocal()
+    try:
+        # Gone if the document was re-processed or deleted in the meantime
+        row = db.get(ClauseSummary, row_id)
+        if row:
+            row.summary = summary
+            row.status = status
+            db.commit()
+    finally:
+        db.close()
+
+
+def schedule_clause_summaries(document_id: int, chunks: List[str], clause_types: List[Optional[str]]):
+    """Record the clause types found in a document as pending summaries."""
+    if not CLAUSE_PIPELINE:
+        return
+    groups = group_by_clause(clause_types)
+    if not groups:
+        return
+
+    db = SessionLocal()
+    try:
+        # Re-processing a document replaces its previous summaries
+        db.query(ClauseSummary).filter(ClauseSummary.document_id == document_id).delete()
+        db.add_all([
+            ClauseSummary(
+                document_id=document_id,
+                clause_type=clause_type,
+                chunk_indices=json.dumps(indices),
+                chunk_texts=json.dumps([chunks[i] for i in indices[:CLAUSE_MAX_CHUNKS]]),
+                status="pending",
+            )
+            for clause_type, indices in groups.items()
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    summary_worker.submit()
@@ -0,0 +1,133 @@
+"""
+Clause Types - Nearest-Centroid Clause Classification
+
+Most questions about rent, employment and loan agreements are about the same
+dozen clause types. Each type is described by a few example phrases (English
+and Hindi). Their embeddings, averaged, form the type's "centroid". A chunk
+(or a question) belongs to the type whose centroid is most similar, if the
+similarity is high enough.
+
+No extra model is needed: the same MiniLM embeddings used for retrieval are
+reused, so classifying a chunk costs one matrix multiplication.
+
+Note: this file is kept identical in the embedding and query services.
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+CLAUSE_TYPES = {
+    "rent_payment": [
+        "monthly rent amount and due date for payment",
+        "the tenant shall pay rent on or before the fifth of every month",
+        "किराया राशि और भुगतान की तारीख",
+    ],
+    "notice_period": [
+        "notice period required to terminate the agreement",
+        "either party may terminate by giving one month's written notice",
+        "अनुबंध समाप्त करने के लिए नोटिस अवधि",
+    ],
+    "lock_in": [
+        "lock-in period during which the agreement cannot be terminated",
+        "neither party may terminate during the first eleven months",
+        "लॉक-इन अवधि",
+    ],
+    "security_deposit": [
+        "security deposit amount and refund conditions",
+        "the deposit shall be refunded without interest on vacating",
+        "सुरक्षा जमा राशि की वापसी",
+    ],
+    "penalty_late_fee": [
+        "penalty or late fee for delayed payment",
+        "interest charged on overdue amounts after the due date",
+        "देर से भुगतान पर जुर्माना",
+    ],
+    "termination": [
+        "grounds for termination of the agreement and consequences",
+        "the company may terminate employment for misconduct",
+        "अनुबंध समाप्ति की शर्तें",
+    ],
+    "jurisdiction_disputes": [
+        "jurisdiction of courts and dispute resolution",
+        "disputes shall be referred to arbitration under the Arbitration and Conciliation Act",
+        "विवाद समाधान और न्यायालय का क्षेत्राधिकार",
+    ],
+    "maintenance_repairs": [
+        "responsibility for maintenance and repairs of the premises",
+        "minor repairs shall be borne by the tenant and major repairs by the landlord",
+        "मरम्मत और रखरखाव की जिम्मेदारी",
+    ],
+    "rent_escalation_renewal": [
+        "rent increase, escalation and renewal of the agreement",
+        "the rent shall be increased by five percent on renewal",
+        "किराया वृद्धि और अनुबंध नवीनीकरण",
+    ],
+    "confidentiality_non_compete": [
+        "confidentiality obligations and non-compete restrictions",
+        "the employee shall not join a competitor for twelve months",
+        "गोपनीयता और प्रतिस्पर्धा निषेध",
+    ],
+    "salary_benefits": [
+        "salary, compensation, leave and employment benefits",
+        "the employee shall be entitled to annual leave and provident fund",
+        "वेतन, छुट्टी और लाभ",
+    ],
+    "loan_repayment_interest": [
+        "loan repayment schedule, EMI and interest rate",
+        "the borrower shall repay in equated monthly instalments at the agreed rate of interest",
+        "ऋण चुकौती, ईएमआई और ब्याज दर",
+    ],
+}
+
+
+class ClauseClassifier:
+    """
+    Assigns clause types to embedding vectors by nearest centroid.
+
+    Args:
+        encode_fn: Function turning a list of texts into unit-length vectors
+                   (the service's embedding model)
+
+    Example:
+        >>> classifier = ClauseClassifier(lambda t: model.encode(t, normalize_embeddings=True))
+        >>> classifier.classify(chunk_vectors, threshold=0.35)
+        ['rent_payment', None, 'notice_period', ...]
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray]):
+        self.encode_fn = encode_fn
+        self.names = list(CLAUSE_TYPES)
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @property
+    def centroids(self) -> np.ndarray:
+        # Computed once, on first use, with the same model as the chunks
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    rows = []
+                    for name in self.names:
+                        vectors = np.asarray(self.encode_fn(CLAUSE_TYPES[name]), dtype=np.float32)
+                        centroid = vectors.mean(axis=0)
+                        rows.append(centroid / np.linalg.norm(centroid))
+                    self._centroids = np.vstack(rows)
+        return self._centroids
+
+    def scores(self, vectors) -> np.ndarray:
+        """Cosine similarity of each vector to each clause type."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        return vectors @ self.centroids.T
+
+    def classify(self, vectors, threshold: float) -> List[Optional[str]]:
+        """Best clause type per vector, or None if nothing is similar enough."""
+        scores = self.scores(vectors)
+        best = scores.argmax(axis=1)
+        return [
+            self.names[j] if scores[i, j] >= threshold else None
+            for i, j in enumerate(best)
+        ]
@@ -0,0 +1,76 @@
+"""
+Dead-Letter Queue for Failed Embedding Jobs
+
+A message that still fails after EMBEDDING_MAX_ATTEMPTS tries is moved to the
+`document_uploaded.dlq` topic instead of being retried forever (blocking its
+partition) or silently dropped. Each dead letter keeps the original event
+plus what went wrong:
+
+    {
+        "event":   {...original document_uploaded event...},
+        "failure": {
+            "error": "...", "error_type": "ValueError", "attempts": 5,
+            "topic": "document_uploaded", "partition": 3, "offset": 1042,
+            "first_failed_at": "...", "failed_at": "..."
+        }
+    }
+
+Once the cause is fixed, `scripts/replay_dlq.py` publishes the events back
+to their original lane.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from kafka import KafkaProducer
+
+DLQ_TOPIC = os.getenv("EMBEDDING_DLQ_TOPIC", "document_uploaded.dlq")
+
+_producer: Optional[KafkaProducer] = None
+_producer_lock = threading.Lock()
+
+
+def _get_producer() -> KafkaProducer:
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = KafkaProducer(
+                    bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                    key_serializer=lambda k: str(k).encode("utf-8"),
+                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    acks="all",
+                    retries=3,
+                )
+    return _producer
+
+
+def publish_dead_letter(message, error: Exception, attempts: int, first_failed_at: float) -> bool:
+    """Send a failed message to the DLQ. Returns True once the broker has it."""
+    event = message.value
+    record = {
+        "event": event,
+        "failure": {
+            "error": str(error),
+            "error_type": type(error).__name__,
+            "attempts": attempts,
+            "topic": message.topic,
+            "partition": message.partition,
+            "offset": message.offset,
+            "first_failed_at": datetime.utcfromtimestamp(first_failed_at).isoformat(),
+            "failed_at": datetime.utcnow().isoformat(),
+        },
+    }
+    try:
+        # Wait for the ack: the original offset is committed only after this
+        # Original headers (trace context) travel with the dead letter
+        _get_producer().send(
+            DLQ_TOPIC, key=event.get("document_id"), value=record, headers=list(message.headers or [])
+        ).get(timeout=10)
+        return True
+    except Exception as e:
+        print(f"Could not publish to {DLQ_TOPIC}: {e}")
+        return False
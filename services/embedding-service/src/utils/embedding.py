@@ -1,14 +1,71 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
 import os
-
-# Load model once
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Use Docker path when in Docker, relative path for local dev
-CHROMA_PATH = "/app/chroma_db" if os.getenv("DOCKER_ENV") else "../../chroma_db"
-client = chromadb.PersistentClient(path=CHROMA_PATH)
+import threading
+
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+from .chunk_cache import CHUNK_CACHE_DIR, ChunkEmbeddingCache
+from .encoder import EMBEDDING_ENGINE, EMBEDDING_MODEL, encode_batches, load_encoder
+from .tracing import span
+from .vector_store import collection_writer, create_vector_store
+
+# chunks/sec = rate(embedding_chunks_total) / rate(embedding_encode_seconds_sum)
+CHUNKS_EMBEDDED = Counter("embedding_chunks_total", "Chunks encoded by the model (chunk cache misses)")
+ENCODE_SECONDS = Histogram(
+    "embedding_encode_seconds",
+    "Time to encode one document's chunks",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+VECTOR_STORE_ADD_SECONDS = Histogram(
+    "vector_store_add_seconds",
+    "Time to store one document's vectors",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# Vectors are written to the store every EMBEDDING_STORE_BATCH chunks while a
+# document is encoded, so memory stays bounded however long it is (with
+# VECTOR_STORE=segment the writes still form one segment per document, indexed
+# when it is complete; see collection_writer in utils/vector_store.py)
+EMBEDDING_STORE_BATCH = int(os.getenv("EMBEDDING_STORE_BATCH", "1024"))
+
+# The model and vector store are created once, on first use (or by warm_up()),
+# so importing this module is instant
+_model = None
+_store = None
+_lock = threading.Lock()
+
+# Vectors of chunks seen in earlier documents (see utils/chunk_cache.py)
+chunk_cache = ChunkEmbeddingCache(CHUNK_CACHE_DIR, f"{EMBEDDING_MODEL}-{EMBEDDING_ENGINE}")
+
+
+def get_model():
+    """Embedding engine chosen by EMBEDDING_ENGINE (torch, onnx or onnx-int8)."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = load_encoder()
+    return _model
+
+
+def get_store():
+    """Vector store chosen by VECTOR_STORE (chroma or segment)."""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = create_vector_store()
+    return _store
+
+
+def warm_up():
+    """Load the model and open the vector store before the first document arrives."""
+    get_store()
+    get_model().encode(["warm-up"], normalize_embeddings=True)
+
+
+def loaded_components() -> dict:
+    return {"embedding_model": _model is not None, "vector_store": _store is not None}
 
 
 def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50):
@@ -29,35 +86,100 @@ def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50):
 
 
 def get_collection(document_id: int):
-    return client.get_or_create_collection(name=f"doc_{document_id}")
+    return get_store().get_or_create_collection(document_id)
 
 
 def generate_and_store_embeddings(document_id: int, text: str):
+    """Chunk, embed and store a document; returns (chunks, clause type per chunk)."""
+    from .clause_pipeline import classify_chunks
+
     collection = get_collection(document_id)
 
-    chunks = chunk_text(text)
+    with span("chunk"):
+        chunks = chunk_text(text)
     if not chunks:
         print("No chunks generated.")
-        return
-
-    print(f"Generating embeddings for {len(chunks)} chunks...")
-    embeddings = model.encode(
-        chunks,
-        show_progress_bar=True,
-        normalize_embeddings=True
-    )
-
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
-    metadatas = [
-        {"source": "document", "document_id": document_id, "chunk_index": i}
-        for i in range(len(chunks))
-    ]
-
-    collection.add(
-        ids=ids,
-        documents=chunks,
-        embeddings=embeddings.tolist(),
-        metadatas=metadatas
-    )
-
-    print(f"Stored {len(chunks)} embeddings for document {document_id}")
\ No newline at end of file
+        return [], []
+
+    clause_types = [None] * len(chunks)
+    writer = collection_writer(collection)
+    pending_ids, pending_vectors = [], []
+    store_seconds = 0.0
+
+    def store():
+        # One write for everything encoded since the last one
+        nonlocal store_seconds
+        indices = [i for batch in pending_ids for i in batch]
+        embeddings = np.vstack(pending_vectors)
+        pending_ids.clear()
+        pending_vectors.clear()
+
+        # Optional clause tagging (see utils/clause_pipeline.py)
+        with span("clause_classify"):
+            for i, clause_type in zip(indices, classify_chunks(embeddings)):
+                clause_types[i] = clause_type
+
+        metadatas = []
+        for i in indices:
+            metadata = {"source": "document", "document_id": document_id, "chunk_index": i}
+            if clause_types[i]:
+                metadata["clause_type"] = clause_types[i]
+            metadatas.append(metadata)
+
+        # Pass the float32 array straight through: no per-float Python list copy
+        with span("vector_store.add", chunks=len(indices)) as s:
+            writer.add(
+                ids=[f"chunk_{i}" for i in indices],
+                documents=[chunks[i] for i in indices],
+                embeddings=embeddings,
+                metadatas=metadatas
+            )
+        store_seconds += s.duration_ms / 1000
+
+    def collect(indices, vectors):
+        pending_ids.append(indices)
+        pending_vectors.append(vectors)
+        if sum(map(len, pending_ids)) >= EMBEDDING_STORE_BATCH:
+            store()
+
+    try:
+        # Boilerplate seen in earlier documents comes from the chunk cache; each
+        # distinct novel text is encoded once, however often it repeats here
+        novel = {}  # text -> indices of the chunks with that text
+        with span("chunk_cache.lookup", chunks=len(chunks)):
+            for start in range(0, len(chunks), EMBEDDING_STORE_BATCH):
+                indices = range(start, min(start + EMBEDDING_STORE_BATCH, len(chunks)))
+                cached = chunk_cache.get_many([chunks[i] for i in indices])
+                hits = [(i, v) for i, v in zip(indices, cached) if v is not None]
+                for i, vector in zip(indices, cached):
+                    if vector is None:
+                        novel.setdefault(chunks[i], []).append(i)
+                if hits:
+                    collect([i for i, _ in hits], np.vstack([v for _, v in hits]))
+
+        # Length-sorted, memory-bounded batches (see utils/encoder.py), written
+        # to the store as they accumulate
+        texts = list(novel)
+        stored_before = store_seconds
+        with span("encode", chunks=len(texts)) as s:
+            for batch, vectors in encode_batches(get_model(), texts, normalize_embeddings=True):
+                batch_texts = [texts[j] for j in batch]
+                chunk_cache.put_many(batch_texts, vectors)
+                rows = [(i, row) for row, text in enumerate(batch_texts) for i in novel[text]]
+                collect([i for i, _ in rows], vectors[[row for _, row in rows]])
+            if pending_ids:
+                store()
+        encode_seconds = s.duration_ms / 1000 - (store_seconds - stored_before)
+        # The segment engine builds the document's segment (and index) here
+        with span("vector_store.finalize") as s:
+            writer.close()
+        store_seconds += s.duration_ms / 1000
+    except Exception:
+        writer.abort()
+        raise
+
+    ENCODE_SECONDS.observe(encode_seconds)
+    VECTOR_STORE_ADD_SECONDS.observe(store_seconds)
+    CHUNKS_EMBEDDED.inc(len(texts))
+
+    return chunks, clause_types
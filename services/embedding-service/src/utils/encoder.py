@@ -0,0 +1,290 @@
+"""
+Embedding Engines
+
+Turns text into embedding vectors. Three interchangeable engines are available,
+selected with the EMBEDDING_ENGINE environment variable:
+
+- "torch"     (default): PyTorch SentenceTransformer, the original path
+- "onnx":      ONNX Runtime with the same weights, no torch import needed
+- "onnx-int8": ONNX Runtime with dynamically quantized int8 weights
+               (smaller and faster on CPU, tiny accuracy loss)
+
+All engines produce the same kind of vector (mean pooling + L2 normalization,
+384 dimensions for all-MiniLM-L6-v2), so documents embedded with one engine
+can be searched with another. `scripts/benchmarks/bench_embedding_engines.py`
+checks the cosine similarity between engines stays within tolerance.
+
+Long documents are encoded with `encode_batches`: chunks are sorted by token
+length so each forward pass pads only to the longest of similar-length
+chunks, the batch size of each pass is chosen so its estimated activation
+memory stays under EMBEDDING_BATCH_MEMORY_MB (many short chunks or a few
+long ones), and vectors are yielded batch by batch so the caller can store
+them without holding the whole document's embeddings.
+`scripts/benchmarks/bench_document_encoding.py` measures chunks/sec and
+peak RSS against the plain document-order path.
+
+Note: this file is kept identical in the embedding and query services.
+"""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+EMBEDDING_ENGINE = os.getenv("EMBEDDING_ENGINE", "torch").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Where ONNX files are downloaded / quantized (reused across restarts)
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", str(Path.home() / ".cache" / "nyayaai-onnx"))
+
+# Optional: use an already exported ONNX model directory instead of downloading
+# (must contain model.onnx and tokenizer.json)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")
+
+# Same limit SentenceTransformer uses for all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "256"))
+
+# ONNX Runtime threads per session (0 = let ONNX Runtime decide)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+# encode_batches: activation memory allowed per forward pass, and a cap on
+# the batch size however short the chunks are
+EMBEDDING_BATCH_MEMORY_MB = float(os.getenv("EMBEDDING_BATCH_MEMORY_MB", "64"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "128"))
+
+# Attention heads assumed by the memory estimate (12 for MiniLM / BERT-base)
+ATTENTION_HEADS = 12
+
+# Texts tokenized at a time when measuring token lengths
+TOKENIZE_SLICE = 256
+
+
+class TorchEncoder:
+    """PyTorch SentenceTransformer (original engine)."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=normalize_embeddings,
+            show_progress_bar=show_progress_bar,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokens per text after truncation, special tokens included."""
+        lengths = []
+        # In slices: the tokenizer's output for a whole long document is large
+        for i in range(0, len(texts), TOKENIZE_SLICE):
+            encoded = self.model.tokenizer(
+                texts[i:i + TOKENIZE_SLICE],
+                truncation=True,
+                max_length=self.model.max_seq_length,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+            lengths.extend(len(ids) for ids in encoded["input_ids"])
+        return lengths
+
+
+def _onnx_model_dir(model_name: str) -> Path:
+    """Return a directory holding model.onnx + tokenizer.json, downloading if needed."""
+    if ONNX_MODEL_DIR:
+        return Path(ONNX_MODEL_DIR)
+
+    target = Path(ONNX_CACHE_DIR) / model_name.replace("/", "__")
+    if (target / "model.onnx").exists() and (target / "tokenizer.json").exists():
+        return target
+
+    from huggingface_hub import hf_hub_download
+
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    target.mkdir(parents=True, exist_ok=True)
+    # The sentence-transformers repos publish an exported model under onnx/
+    onnx_file = hf_hub_download(repo_id, "onnx/model.onnx")
+    tokenizer_file = hf_hub_download(repo_id, "tokenizer.json")
+    shutil.copyfile(onnx_file, target / "model.onnx")
+    shutil.copyfile(tokenizer_file, target / "tokenizer.json")
+    return target
+
+
+def _quantized_model(model_dir: Path) -> Path:
+    """Create (once) a dynamically quantized int8 copy of model.onnx."""
+    quantized = Path(ONNX_CACHE_DIR) / f"{model_dir.name}-int8.onnx"
+    if not quantized.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized.parent.mkdir(parents=True, exist_ok=True)
+        quantize_dynamic(
+            str(model_dir / "model.onnx"),
+            str(quantized),
+            weight_type=QuantType.QInt8,
+        )
+    return quantized
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime engine: tokenizer + transformer + mean pooling, without torch.
+
+    Args:
+        model_name: Sentence-transformers model name
+        quantize: Use dynamically quantized int8 weights
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, quantize: bool = False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        model_dir = _onnx_model_dir(model_name)
+        model_path = _quantized_model(model_dir) if quantize else model_dir / "model.onnx"
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens, like SentenceTransformer
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return (summed / counts).astype(np.float32)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokens per text after truncation, special tokens included."""
+        return [
+            len(e.ids) - e.attention_mask.count(0)
+            for i in range(0, len(texts), TOKENIZE_SLICE)
+            for e in self.tokenizer.encode_batch(texts[i:i + TOKENIZE_SLICE])
+        ]
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        vectors = np.vstack([
+            self._encode_batch(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ])
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.clip(norms, 1e-12, None)
+        return vectors
+
+
+def activation_bytes(batch_size: int, seq_len: int, dimension: int) -> int:
+    """
+    Rough float32 peak of one transformer layer for a padded batch: hidden
+    states, Q/K/V and the 4x feed-forward expansion (~8 x dimension per
+    token) plus ATTENTION_HEADS seq_len x seq_len attention score matrices.
+    """
+    return 4 * batch_size * seq_len * (8 * dimension + ATTENTION_HEADS * seq_len)
+
+
+def plan_batches(
+    lengths: List[int],
+    dimension: int,
+    memory_bytes: float,
+    max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+) -> List[List[int]]:
+    """
+    Group text indices into batches, shortest texts first.
+
+    Texts are sorted by token length, so a batch pads to its last (longest)
+    member; a batch is closed as soon as one more text would push its
+    estimated activation memory over `memory_bytes`.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for i in order:
+        if current and (
+            len(current) >= max_batch_size
+            or activation_bytes(len(current) + 1, lengths[i], dimension) > memory_bytes
+        ):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def encode_batches(
+    encoder,
+    texts: List[str],
+    normalize_embeddings: bool = True,
+    memory_mb: float = EMBEDDING_BATCH_MEMORY_MB,
+) -> Iterator[Tuple[List[int], np.ndarray]]:
+    """
+    Encode `texts` in length-sorted, memory-bounded batches.
+
+    Yields (indices into texts, float32 vectors) one batch at a time, in
+    length order rather than text order.
+    """
+    lengths = encoder.token_lengths(texts)
+    for indices in plan_batches(lengths, encoder.dimension, memory_mb * 1024 * 1024):
+        vectors = encoder.encode(
+            [texts[i] for i in indices],
+            batch_size=len(indices),  # one forward pass per planned batch
+            normalize_embeddings=normalize_embeddings,
+        )
+        yield indices, vectors
+
+
+def load_encoder(engine: str = EMBEDDING_ENGINE, model_name: str = EMBEDDING_MODEL):
+    """
+    Create the embedding engine named by `engine`.
+
+    Raises:
+        ValueError: If the engine name is unknown
+    """
+    if engine == "torch":
+        return TorchEncoder(model_name)
+    if engine == "onnx":
+        return OnnxEncoder(model_name)
+    if engine in ("onnx-int8", "int8"):
+        return OnnxEncoder(model_name, quantize=True)
+    raise ValueError(f"Unknown EMBEDDING_ENGINE '{engine}' (expected torch, onnx or onnx-int8)")
@@ -0,0 +1,174 @@
+"""
+Metrics - Prometheus /metrics Endpoint
+
+Every service exposes `GET /metrics` in the Prometheus text format.
+`instrument(app, engine)` adds:
+
+- http_request_duration_seconds{method, route, status}   latency histogram
+- http_requests_in_progress                              requests being served
+- db_pool_connections{state}                             SQLAlchemy pool usage
+  (size, checked_out, idle, overflow), read at scrape time
+
+Service-specific metrics (consumer lag, chunks embedded, vector search
+latency, LLM token rates, queue depths, ...) are defined next to the code
+they measure. Values that already live in the service (queue sizes, cache
+statistics) are exported with `gauge_callback`, which reads them only when
+Prometheus scrapes.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers; /metrics then aggregates all of them.
+
+Note: this file is kept identical in the auth, upload, embedding, query and
+response services.
+"""
+
+import os
+import time
+from typing import Callable, Dict, List, Sequence
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Buckets from 5 ms to 60 s: covers both DB lookups and LLM generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+
+
+class _CallbackCollector:
+    """Gauge whose value(s) are read from a function at scrape time."""
+
+    def __init__(self, name: str, documentation: str, fn: Callable, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = list(labelnames)
+
+    def collect(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} unavailable: {e}")
+            return
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        if self.labelnames:
+            for labels, value in values.items():
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                family.add_metric([str(label) for label in labels], float(value))
+        else:
+            family.add_metric([], float(values))
+        yield family
+
+
+_callbacks: List[_CallbackCollector] = []
+
+
+def gauge_callback(name: str, documentation: str, fn: Callable, labelnames: Sequence[str] = ()):
+    """
+    Export a value the service already tracks.
+
+    `fn` returns a number, or (with labelnames) a dict of label value(s) -> number.
+
+    Example:
+        >>> gauge_callback("publish_queue_depth", "Events waiting", lambda: q.qsize())
+    """
+    collector = _CallbackCollector(name, documentation, fn, labelnames)
+    _callbacks.append(collector)
+    if not PROMETHEUS_MULTIPROC_DIR:
+        REGISTRY.register(collector)
+
+
+def _pool_stats(engine) -> Dict[str, int]:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-progress requests per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            # The route template ("/documents/{doc_id}") is known only after routing
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=str(status["code"]),
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_body() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _callbacks:
+            registry.register(collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def instrument(app, engine=None):
+    """Add request metrics and a /metrics endpoint to a FastAPI app."""
+    from starlette.responses import Response
+
+    app.add_middleware(MetricsMiddleware)
+
+    if engine is not None:
+        gauge_callback(
+            "db_pool_connections",
+            "SQLAlchemy connection pool usage",
+            lambda: _pool_stats(engine),
+            ["state"],
+        )
+
+    async def metrics(request):
+        return Response(metrics_body(), media_type=CONTENT_TYPE_LATEST)
+
+    app.add_route("/metrics", metrics, include_in_schema=False)
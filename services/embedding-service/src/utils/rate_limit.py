@@ -0,0 +1,388 @@
+"""
+Rate Limiting - Per-User Token Buckets and Daily Quotas
+
+One user (or one runaway script) must not be able to flood `/upload`
+(extraction + embedding) or `/query` (LLM generation) and degrade the
+cluster for everyone. `rate_limit(app, limits)` adds an ASGI middleware
+that, before a request reaches its endpoint:
+
+1. Identifies the user from the bearer token's subject (no DB lookup; an
+   invalid token is limited by client address instead). Requests without
+   a token (probes, /metrics) are not limited.
+2. Takes `cost` tokens from the user's bucket for the route's class.
+   Buckets refill continuously; an empty bucket means 429 with Retry-After
+   (seconds until enough tokens are back). Costs are weighted by what the
+   route consumes, so one LLM query costs as much as ten document lists:
+
+       class    default bucket (RATE_LIMIT_<CLASS>=capacity:refill_per_second)
+       llm      60 tokens, 0.5/s    query = 10, batch query = 30
+       ingest   100 tokens, 0.5/s   upload = 10, bulk upload = 50
+       read     120 tokens, 4/s     everything else = 1
+
+3. Refuses the route with 429 if it draws on a daily quota the user has
+   used up (Retry-After: seconds until midnight UTC):
+
+       embedding_pages   QUOTA_EMBEDDING_PAGES_PER_DAY (a page is
+                         QUOTA_CHARS_PER_PAGE characters of extracted text)
+       llm_tokens        QUOTA_LLM_TOKENS_PER_DAY (prompt + completion)
+
+   Usage is charged after the fact: code serving the request calls
+   `record_usage(name, amount)` (utils/llm.py does for LLM tokens) and the
+   middleware adds the total to the user's quota when the response is done.
+   Background work charges with `usage_scope(key)` or `charge(...)`.
+
+Buckets and quota counters live in this process by default. With several
+replicas set RATE_LIMIT_REDIS_URL so they share one set of buckets and
+quotas (requires the `redis` package).
+
+Note: this file is kept identical in the upload, embedding, query and
+response services.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+QUOTAS = {
+    "embedding_pages": int(os.getenv("QUOTA_EMBEDDING_PAGES_PER_DAY", "2000")),
+    "llm_tokens": int(os.getenv("QUOTA_LLM_TOKENS_PER_DAY", "200000")),
+}  # 0 = unlimited
+QUOTA_CHARS_PER_PAGE = int(os.getenv("QUOTA_CHARS_PER_PAGE", "3000"))
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-prod")
+ALGORITHM = "HS256"
+
+
+def _bucket(name: str, default: str) -> Tuple[float, float]:
+    capacity, refill = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split(":")
+    return float(capacity), float(refill)
+
+
+# Route class -> (capacity, refill per second)
+ROUTE_CLASSES = {
+    "llm": _bucket("llm", "60:0.5"),
+    "ingest": _bucket("ingest", "100:0.5"),
+    "read": _bucket("read", "120:4"),
+}
+
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Requests refused with 429",
+    ["route_class", "reason"],  # reason: rate | quota
+)
+
+
+class RouteLimit(NamedTuple):
+    route_class: str
+    cost: float = 1
+    quota: Optional[str] = None  # daily quota the route draws on
+
+
+DEFAULT_LIMIT = RouteLimit("read", 1)
+
+
+def text_pages(text: str) -> int:
+    """Pages of extracted text, as counted against the embedding quota."""
+    return max(1, math.ceil(len(text or "") / QUOTA_CHARS_PER_PAGE))
+
+
+def user_key(subject: str) -> str:
+    """Bucket/quota key of an authenticated user (the token subject, i.e. email)."""
+    return f"user:{subject}"
+
+
+def _today() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def seconds_until_midnight() -> int:
+    now = datetime.utcnow()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, math.ceil((midnight - now).total_seconds()))
+
+
+# ==============================================================================
+# STORES
+# ==============================================================================
+
+class MemoryStore:
+    """Buckets and counters in this process (one set per replica)."""
+
+    blocking = False
+    MAX_BUCKETS = 100_000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+        self._counters: Dict[str, float] = {}
+        self._counters_day = _today()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, refill: float, cost: float) -> float:
+        """Take `cost` tokens. Returns 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / refill
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float):
+        # Buckets idle long enough to be full again carry no state
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+    def _roll_day(self):
+        today = _today()
+        if today != self._counters_day:
+            self._counters.clear()
+            self._counters_day = today
+
+    def add(self, key: str, amount: float) -> float:
+        with self._lock:
+            self._roll_day()
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+            return self._counters[key]
+
+    def get(self, key: str) -> float:
+        with self._lock:
+            self._roll_day()
+            return self._counters.get(key, 0.0)
+
+
+class RedisStore:
+    """Buckets and counters shared by every replica (RATE_LIMIT_REDIS_URL)."""
+
+    blocking = True
+
+    # Refill and take atomically, using the server clock so replicas agree
+    TAKE_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local capacity, refill, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / refill end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key: str, capacity: float, refill: float, cost: float) -> float:
+        return float(self._take(keys=[f"ratelimit:{key}"], args=[capacity, refill, cost]))
+
+    def add(self, key: str, amount: float) -> float:
+        name = f"quota:{_today()}:{key}"
+        pipe = self.client.pipeline()
+        pipe.incrbyfloat(name, amount)
+        pipe.expire(name, 2 * 86400)
+        return float(pipe.execute()[0])
+
+    def get(self, key: str) -> float:
+        return float(self.client.get(f"quota:{_today()}:{key}") or 0)
+
+
+store = RedisStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryStore()
+
+
+# ==============================================================================
+# QUOTAS
+# ==============================================================================
+
+def quota_used(key: str, quota: str) -> float:
+    return store.get(f"{quota}:{key}")
+
+
+def quota_remaining(key: str, quota: str) -> Optional[float]:
+    """What the user may still use today, or None if the quota is unlimited."""
+    limit = QUOTAS.get(quota, 0)
+    if not limit:
+        return None
+    try:
+        return max(0.0, limit - quota_used(key, quota))
+    except Exception as e:
+        # A rate limiter outage must not stop the service: allow
+        print(f"Could not read {quota} quota of {key}: {e}")
+        return None
+
+
+def charge(key: Optional[str], quota: str, amount: float):
+    if key and amount and QUOTAS.get(quota):
+        try:
+            store.add(f"{quota}:{key}", amount)
+        except Exception as e:
+            # Never fail the work that was already done because accounting failed
+            print(f"Could not charge {amount} {quota} to {key}: {e}")
+
+
+# Usage recorded while serving the current request (or background job)
+_usage: ContextVar[Optional[dict]] = ContextVar("rate_limit_usage", default=None)
+_usage_lock = threading.Lock()
+
+
+def record_usage(name: str, amount: float):
+    """Count `amount` of a quota against whoever the current request is for."""
+    usage = _usage.get()
+    if usage is not None and amount:
+        with _usage_lock:
+            usage[name] = usage.get(name, 0) + amount
+
+
+@contextmanager
+def usage_scope(key: Optional[str]):
+    """Charge usage recorded inside the block to `key` (for work outside a request)."""
+    usage: dict = {}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+        for name, amount in usage.items():
+            charge(key, name, amount)
+
+
+# ==============================================================================
+# MIDDLEWARE
+# ==============================================================================
+
+def _client_key(scope) -> Optional[str]:
+    """user:<subject> for a valid token, ip:<address> for an invalid one, None without."""
+    auth = ""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            auth = value.decode("latin-1")
+            break
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    from jose import JWTError, jwt
+
+    try:
+        subject = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        subject = None
+    if subject:
+        return user_key(subject)
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying `limits` ("METHOD /route/{template}" -> RouteLimit)."""
+
+    def __init__(self, app, router, limits: Dict[str, RouteLimit], default: RouteLimit = DEFAULT_LIMIT):
+        self.app = app
+        self.router = router
+        self.limits = limits
+        self.default = default
+
+    def _limit_for(self, scope) -> RouteLimit:
+        from starlette.routing import Match
+
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return self.limits.get(f"{scope['method']} {route.path}", self.default)
+        return self.default
+
+    def _check(self, key: str, limit: RouteLimit) -> Optional[Tuple[str, int, str]]:
+        """None if allowed, else (reason, retry_after, detail)."""
+        if limit.quota and quota_remaining(key, limit.quota) == 0:
+            return (
+                "quota",
+                seconds_until_midnight(),
+                f"Daily quota of {QUOTAS[limit.quota]} {limit.quota.replace('_', ' ')} used up",
+            )
+        capacity, refill = ROUTE_CLASSES[limit.route_class]
+        wait = store.take(f"{limit.route_class}:{key}", capacity, refill, min(limit.cost, capacity))
+        if wait > 0:
+            return "rate", math.ceil(wait), "Too many requests, slow down"
+        return None
+
+    def _charge(self, key: str, usage: dict):
+        for name, amount in usage.items():
+            charge(key, name, amount)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        key = _client_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.concurrency import run_in_threadpool
+        from starlette.responses import JSONResponse
+
+        limit = self._limit_for(scope)
+        try:
+            if store.blocking:
+                refused = await run_in_threadpool(self._check, key, limit)
+            else:
+                refused = self._check(key, limit)
+        except Exception as e:
+            # A rate limiter outage must not take the service down with it
+            print(f"Rate limit check failed, allowing request: {e}")
+            refused = None
+
+        if refused is not None:
+            reason, retry_after, detail = refused
+            RATE_LIMITED.labels(route_class=limit.route_class, reason=reason).inc()
+            response = JSONResponse(
+                {"detail": detail}, status_code=429, headers={"Retry-After": str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        # Endpoints (and their worker threads) see the same dict via the context
+        usage: dict = {}
+        token = _usage.set(usage)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _usage.reset(token)
+            if usage:
+                if store.blocking:
+                    await run_in_threadpool(self._charge, key, usage)
+                else:
+                    self._charge(key, usage)
+
+
+def rate_limit(app, limits: Dict[str, RouteLimit], default: RouteLimit = DEFAULT_LIMIT):
+    """
+    Add per-user rate limiting and quotas to a FastAPI app.
+
+    Call before adding CORS so 429 responses still carry CORS headers.
+
+    Example:
+        >>> rate_limit(app, {"POST /query": RouteLimit("llm", 10, quota="llm_tokens")})
+    """
+    app.add_middleware(RateLimitMiddleware, router=app.router, limits=limits, default=default)
@@ -0,0 +1,64 @@
+"""
+Document Status Events
+
+Every status change made by this service (processing, ready, error) is
+published to `document_status`, keyed by document_id:
+
+    {"document_id": 42, "status": "ready", "timestamp": "..."}
+
+Query-service replicas cache document ownership and status and drop an
+entry as soon as its document changes (utils/document_cache.py there), so a
+document becomes queryable the moment it is ready without every query
+reading the documents table.
+
+Publishing is best effort: the send is not waited for, and a failure is only
+logged. The query service's cache entries expire anyway (TTL), so a lost
+event delays a status change by at most DOCUMENT_CACHE_TTL_SECONDS there.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from kafka import KafkaProducer
+
+STATUS_TOPIC = os.getenv("DOCUMENT_STATUS_TOPIC", "document_status")
+
+_producer: Optional[KafkaProducer] = None
+_producer_lock = threading.Lock()
+
+
+def _get_producer() -> KafkaProducer:
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = KafkaProducer(
+                    bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                    key_serializer=lambda k: str(k).encode("utf-8"),
+                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    acks=1,
+                    linger_ms=5,
+                )
+    return _producer
+
+
+def _on_error(document_id: int, status: str, exc: Exception):
+    print(f"Could not publish status {status} of document {document_id}: {exc}")
+
+
+def publish_status(document_id: int, status: str):
+    """Announce a status change (returns without waiting for the broker)."""
+    event = {
+        "document_id": document_id,
+        "status": status,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    try:
+        future = _get_producer().send(STATUS_TOPIC, key=document_id, value=event)
+    except Exception as e:
+        _on_error(document_id, status, e)
+        return
+    future.add_errback(_on_error, document_id, status)
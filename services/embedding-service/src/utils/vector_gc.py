@@ -0,0 +1,225 @@
+"""
+Vector GC - Deleted Documents and Orphaned Collections
+
+    upload service ── DELETE /documents/{id} ──► document_deleted ──► here
+
+A background thread in every embedding worker:
+
+1. consumes `document_deleted` (consumer group "embedding-service-deletes",
+   so each deletion is handled once) and drops the document's collection
+   and clause summaries right away; a deletion that fails is retried up to
+   VECTOR_GC_MAX_ATTEMPTS times, then left to the sweep (if it runs)
+2. every VECTOR_GC_INTERVAL_SECONDS, sweeps what deletion events cannot
+   catch: collections whose document row no longer exists (a document
+   deleted while it was being embedded gets its collection re-created
+   after the event was handled; events lost before the outbox existed),
+   then compacts what can be compacted under live readers (see
+   vector_store.py; local Chroma files only offline, with
+   scripts/compact_chroma.py) and reports the space reclaimed
+
+The last report is served by GET /gc. Only one worker should sweep when
+several share a local store: set VECTOR_GC_INTERVAL_SECONDS=0 on the others.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from kafka import KafkaConsumer
+from kafka.errors import NoBrokersAvailable
+from prometheus_client import Counter
+
+from database import SessionLocal
+from models import ClauseSummary, Document
+
+from .clause_pipeline import CLAUSE_PIPELINE
+from .embedding import get_store
+
+DELETED_TOPIC = os.getenv("DOCUMENT_DELETED_TOPIC", "document_deleted")
+VECTOR_GC_INTERVAL_SECONDS = int(os.getenv("VECTOR_GC_INTERVAL_SECONDS", "3600"))  # 0 disables the sweep
+# A deletion event that keeps failing is skipped after this many tries
+VECTOR_GC_MAX_ATTEMPTS = int(os.getenv("VECTOR_GC_MAX_ATTEMPTS", "5"))
+
+COLLECTIONS_DELETED = Counter(
+    "vector_gc_collections_deleted_total",
+    "Document collections removed from the vector store",
+    ["reason"],  # deleted (event) | orphaned (sweep)
+)
+DELETIONS_SKIPPED = Counter(
+    "vector_gc_deletions_skipped_total",
+    "Deletion events given up after VECTOR_GC_MAX_ATTEMPTS failures (left to the sweep)",
+)
+BYTES_RECLAIMED = Counter(
+    "vector_gc_reclaimed_bytes_total",
+    "Disk space freed by vector store compaction",
+)
+
+# (topic, partition, offset) -> failed attempts of a deletion event
+_failures: Dict[tuple, int] = {}
+
+gc_state = {
+    "connected": False,
+    "last_error": None,
+    "deleted": 0,
+    "last_run": None,  # report of the last sweep
+}
+
+
+def delete_documents(document_ids: Iterable[int]) -> int:
+    """Drop the vectors and clause summaries of deleted documents. Returns collections removed."""
+    ids = sorted(set(document_ids))
+    if not ids:
+        return 0
+    store = get_store()
+    removed = 0
+    for document_id in ids:
+        # False if it was never embedded or is already gone; other errors
+        # propagate so the deletion is tried again
+        if store.delete_collection(document_id):
+            removed += 1
+
+    if CLAUSE_PIPELINE:
+        db = SessionLocal()
+        try:
+            db.query(ClauseSummary).filter(ClauseSummary.document_id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+    return removed
+
+
+def sweep() -> dict:
+    """Delete orphaned collections and compact the store. Returns a report."""
+    started = time.monotonic()
+    store = get_store()
+    bytes_before = store.disk_usage()
+
+    stored = store.document_ids()
+    db = SessionLocal()
+    try:
+        existing = set()
+        for start in range(0, len(stored), 1000):
+            batch = stored[start:start + 1000]
+            existing.update(i for (i,) in db.query(Document.id).filter(Document.id.in_(batch)))
+    finally:
+        db.close()
+    orphans = [i for i in stored if i not in existing]
+    removed = delete_documents(orphans)
+    COLLECTIONS_DELETED.labels(reason="orphaned").inc(removed)
+
+    compaction = store.compact()
+    bytes_after = store.disk_usage()
+    reclaimed = None
+    if bytes_before is not None and bytes_after is not None:
+        reclaimed = max(0, bytes_before - bytes_after)
+        BYTES_RECLAIMED.inc(reclaimed)
+
+    report = {
+        "finished_at": datetime.utcnow().isoformat(),
+        "duration_seconds": round(time.monotonic() - started, 2),
+        "collections": len(stored),
+        "orphaned_collections_deleted": removed,
+        "compaction": compaction,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_reclaimed": reclaimed,
+    }
+    gc_state["last_run"] = report
+    print(f"Vector GC: {removed} orphaned collections deleted, {reclaimed} bytes reclaimed")
+    return report
+
+
+def _connect() -> KafkaConsumer:
+    wait = 2
+    while True:
+        try:
+            consumer = KafkaConsumer(
+                DELETED_TOPIC,
+                bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                group_id="embedding-service-deletes",
+                enable_auto_commit=False,
+                auto_offset_reset="earliest",
+                value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+            )
+            gc_state.update(connected=True, last_error=None)
+            return consumer
+        except NoBrokersAvailable as e:
+            gc_state.update(connected=False, last_error=str(e))
+            print(f"Kafka not ready, deletion consumer retrying in {wait}s")
+            time.sleep(wait)
+            wait = min(wait * 2, 30)
+
+
+def _handle_deletions(consumer: KafkaConsumer, records: dict):
+    """
+    Handle one poll's deletion events, committing what succeeded.
+
+    A failed record is read again (its partition is rewound to it) until it
+    has failed VECTOR_GC_MAX_ATTEMPTS times; then it is skipped so it cannot
+    block its partition forever. The sweep still removes its collection,
+    since the document row is gone.
+    """
+    failed = None
+    for tp, batch in records.items():
+        for message in batch:
+            document_id = message.value.get("document_id")
+            if not document_id:
+                continue
+            key = (tp.topic, tp.partition, message.offset)
+            try:
+                removed = delete_documents([document_id])
+            except Exception as e:
+                attempts = _failures.get(key, 0) + 1
+                print(f"Deleting document {document_id} failed (attempt {attempts}/{VECTOR_GC_MAX_ATTEMPTS}): {e}")
+                if attempts < VECTOR_GC_MAX_ATTEMPTS:
+                    _failures[key] = attempts
+                    # The consumer's position is already past this record:
+                    # rewind so the next poll returns it (and the rest of
+                    # the batch) again instead of committing over it
+                    consumer.seek(tp, message.offset)
+                    failed = e
+                    break
+                _failures.pop(key, None)
+                DELETIONS_SKIPPED.inc()
+                print(f"Giving up on deleting document {document_id}; the sweep will remove its collection")
+                continue
+            _failures.pop(key, None)
+            COLLECTIONS_DELETED.labels(reason="deleted").inc(removed)
+            gc_state["deleted"] += removed
+    # Commits each partition's position: past what succeeded, at what is retried
+    consumer.commit()
+    if failed is not None:
+        raise failed
+
+
+def _run():
+    consumer = _connect()
+    next_sweep = time.monotonic() + 60  # let the model and store load first
+    while True:
+        try:
+            if VECTOR_GC_INTERVAL_SECONDS > 0 and time.monotonic() >= next_sweep:
+                try:
+                    sweep()
+                finally:
+                    next_sweep = time.monotonic() + VECTOR_GC_INTERVAL_SECONDS
+
+            records = consumer.poll(timeout_ms=1000)
+            if records:
+                _handle_deletions(consumer, records)
+        except Exception as e:
+            gc_state["last_error"] = str(e)
+            print(f"Vector GC error: {e}")
+            time.sleep(1)
+
+
+_thread: Optional[threading.Thread] = None
+
+
+def start_vector_gc():
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="vector-gc", daemon=True)
+        _thread.start()
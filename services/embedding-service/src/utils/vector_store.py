@@ -0,0 +1,812 @@
+"""
+Vector Store - Pluggable Storage for Document Embeddings
+
+Every document gets its own collection ("doc_<id>") of chunk embeddings.
+Services talk to collections through the same small interface Chroma uses:
+
+    collection.add(ids=..., documents=..., embeddings=..., metadatas=...)
+    collection.query(query_embeddings=..., n_results=..., include=...)
+
+Three engines are available, selected with the VECTOR_STORE environment variable:
+
+- "chroma" (default): chromadb.PersistentClient on the shared ./chroma_db volume
+- "chroma-http": A Chroma server reached over HTTP (CHROMA_HOST:CHROMA_PORT).
+    Services keep no index files or volumes of their own, so query replicas
+    are stateless and can run on any node. One pooled HTTP client is shared
+    per process, collection handles are cached, large add() calls are split
+    into batches, and transient network errors are retried with backoff.
+- "segment": Built-in engine with memory-mapped segment files:
+    * Each add() writes a new immutable segment directory
+      (vectors.npy + records.json [+ hnsw.bin]) and renames it into place
+      atomically, so readers never see half-written data and never block
+      the writer. A document stored in batches goes through
+      `collection_writer()`, which makes all of them one segment, indexed
+      once it is complete.
+    * Readers map vectors.npy with np.load(mmap_mode="r"): zero copy, and the
+      OS page cache is shared by every process reading the same document.
+    * Small segments are searched with an exact vectorized NumPy scan;
+      segments above SEGMENT_HNSW_THRESHOLD vectors also get an HNSW index
+      (hnswlib, optional) for approximate search.
+    * Vectors are stored as float32 or float16 (SEGMENT_DTYPE).
+    * Optional product quantization (SEGMENT_PQ): each vector is also stored
+      as SEGMENT_PQ_SUBSPACES one-byte codes (48 bytes instead of 1536).
+      Only the codes are read into memory; search ranks them, then re-scores
+      the best SEGMENT_PQ_RERANK × k candidates against the mapped full
+      vectors, touching only those rows.
+
+Embeddings are unit length, so the segment engine ranks by inner product and
+reports cosine distance (1 - similarity).
+
+Maintenance (used by the embedding service's garbage collector): every
+engine deletes collections (`delete_collection()` returns False if there was
+none), lists the document ids it holds (`document_ids()`), reports its size
+on disk (`disk_usage()`, None when the data lives on a Chroma server) and
+can `compact()` itself while in use: the segment engine deletes abandoned
+".tmp-*" writes. Chroma's files are open in every client, so the local
+Chroma engine is compacted offline instead (`compact_chroma_directory()`,
+run by scripts/compact_chroma.py while the services are stopped): it deletes
+HNSW directories left behind by deleted collections and VACUUMs
+chroma.sqlite3.
+
+Note: this file is kept identical in the embedding and query services.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+
+# Where collections live (same volume Chroma uses by default)
+if os.getenv("DOCKER_ENV"):
+    _DEFAULT_PATH = "/app/chroma_db"
+else:
+    _DEFAULT_PATH = "../../chroma_db"
+CHROMA_PATH = os.getenv("CHROMA_PATH", _DEFAULT_PATH)
+SEGMENT_PATH = os.getenv("SEGMENT_PATH", os.path.join(CHROMA_PATH, "segments"))
+
+# Chroma server (chroma-http engine)
+CHROMA_HOST = os.getenv("CHROMA_HOST", "vector-db" if os.getenv("DOCKER_ENV") else "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+VECTOR_STORE_BATCH_SIZE = int(os.getenv("VECTOR_STORE_BATCH_SIZE", "1000"))
+VECTOR_STORE_RETRIES = int(os.getenv("VECTOR_STORE_RETRIES", "3"))
+VECTOR_STORE_RETRY_BACKOFF = float(os.getenv("VECTOR_STORE_RETRY_BACKOFF", "0.5"))  # seconds
+
+# Segment engine tuning
+SEGMENT_DTYPE = os.getenv("SEGMENT_DTYPE", "float32")  # float32 or float16
+SEGMENT_HNSW_THRESHOLD = int(os.getenv("SEGMENT_HNSW_THRESHOLD", "20000"))
+SEGMENT_HNSW_M = int(os.getenv("SEGMENT_HNSW_M", "16"))
+SEGMENT_HNSW_EF_CONSTRUCTION = int(os.getenv("SEGMENT_HNSW_EF_CONSTRUCTION", "200"))
+SEGMENT_HNSW_EF_SEARCH = int(os.getenv("SEGMENT_HNSW_EF_SEARCH", "64"))
+SEGMENT_PQ = os.getenv("SEGMENT_PQ", "false").lower() == "true"
+SEGMENT_PQ_SUBSPACES = int(os.getenv("SEGMENT_PQ_SUBSPACES", "48"))  # must divide the dimension
+SEGMENT_PQ_RERANK = int(os.getenv("SEGMENT_PQ_RERANK", "10"))
+SEGMENT_PQ_MIN_VECTORS = int(os.getenv("SEGMENT_PQ_MIN_VECTORS", "1024"))  # smaller: exact scan
+
+
+def collection_name(document_id: int) -> str:
+    return f"doc_{document_id}"
+
+
+def document_id_of(name: str) -> Optional[int]:
+    """Inverse of collection_name(); None for collections that are not documents."""
+    match = re.fullmatch(r"doc_(\d+)", name)
+    return int(match.group(1)) if match else None
+
+
+def _names(collections) -> List[str]:
+    # chromadb returns Collection objects or (0.6.x) plain names
+    return [getattr(c, "name", c) for c in collections]
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed meanwhile
+    return total
+
+
+# ==============================================================================
+# CHROMA ENGINE
+# ==============================================================================
+
+class ChromaStore:
+    """Thin wrapper over chromadb.PersistentClient (the original engine)."""
+
+    name = "chroma"
+
+    def __init__(self, path: str = CHROMA_PATH):
+        import chromadb
+
+        self.path = Path(path)
+        self.client = chromadb.PersistentClient(path=path)
+
+    def get_collection(self, document_id: int):
+        return self.client.get_collection(name=collection_name(document_id))
+
+    def get_or_create_collection(self, document_id: int):
+        return self.client.get_or_create_collection(name=collection_name(document_id))
+
+    def delete_collection(self, document_id: int) -> bool:
+        try:
+            self.client.delete_collection(name=collection_name(document_id))
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            raise
+        return True
+
+    def document_ids(self) -> List[int]:
+        ids = (document_id_of(name) for name in _names(self.client.list_collections()))
+        return [i for i in ids if i is not None]
+
+    def disk_usage(self) -> Optional[int]:
+        return _dir_size(self.path)
+
+    def compact(self) -> dict:
+        # This process's client and the query service's have chroma.sqlite3
+        # and the segment directories open: deleting or rewriting them here
+        # could break live readers. Stop the services and run
+        # scripts/compact_chroma.py instead.
+        return {"vacuumed": False}
+
+
+def compact_chroma_directory(path: str) -> dict:
+    """
+    Delete orphaned HNSW directories, then VACUUM the SQLite catalog.
+
+    Offline only: no Chroma client may have `path` open while this runs.
+    """
+    root = Path(path)
+    bytes_before = _dir_size(root)
+    conn = sqlite3.connect(root / "chroma.sqlite3", timeout=60)
+    try:
+        segments = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        # Each vector segment keeps its HNSW files in a directory named by
+        # its id; deleting the collection leaves the directory behind
+        orphans = [
+            p for p in root.iterdir()
+            if p.is_dir() and re.fullmatch(r"[0-9a-f-]{36}", p.name) and p.name not in segments
+        ]
+        for orphan in orphans:
+            shutil.rmtree(orphan)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    bytes_after = _dir_size(root)
+    return {
+        "orphaned_dirs_removed": len(orphans),
+        "vacuumed": True,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_reclaimed": max(0, bytes_before - bytes_after),
+    }
+
+
+# ==============================================================================
+# CHROMA SERVER (HTTP) ENGINE
+# ==============================================================================
+
+def _transient_errors() -> tuple:
+    # Network-level failures worth retrying; "not found" and bad requests are not
+    errors = [ConnectionError, TimeoutError]
+    try:
+        import httpx
+
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, _transient_errors()):
+        return True
+    # chromadb reports an unreachable server as a ValueError
+    return isinstance(error, ValueError) and "could not connect" in str(error).lower()
+
+
+def is_not_found(error: Exception) -> bool:
+    """True if `error` means the collection does not exist (any engine)."""
+    try:
+        from chromadb.errors import NotFoundError
+
+        if isinstance(error, NotFoundError):
+            return True
+    except ImportError:
+        pass
+    # Older chromadb and the segment engine: "Collection doc_1 does not exist."
+    return "does not exist" in str(error)
+
+
+def with_retry(fn, *args, retries: int = VECTOR_STORE_RETRIES, **kwargs):
+    """Call fn, retrying transient network errors with exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not _is_transient(e):
+                raise
+            attempt += 1
+            if attempt > retries:
+                raise
+            wait = VECTOR_STORE_RETRY_BACKOFF * (2 ** (attempt - 1))
+            print(f"Vector store call failed ({e}), retrying in {wait:.1f}s ({attempt}/{retries})")
+            time.sleep(wait)
+
+
+class RemoteCollection:
+    """
+    Chroma collection handle that batches writes and retries network errors.
+
+    `on_missing` is called when the server says the collection no longer
+    exists (deleted by another service), so the store drops this handle.
+    """
+
+    def __init__(self, collection, on_missing=None):
+        self.collection = collection
+        self.on_missing = on_missing
+
+    def _call(self, fn, **kwargs):
+        try:
+            return with_retry(fn, **kwargs)
+        except Exception as e:
+            if self.on_missing is not None and is_not_found(e):
+                self.on_missing()
+            raise
+
+    def add(self, ids, documents, embeddings, metadatas=None):
+        # Split big documents into several requests to keep each one small
+        for i in range(0, len(ids), VECTOR_STORE_BATCH_SIZE):
+            j = i + VECTOR_STORE_BATCH_SIZE
+            self._call(
+                self.collection.add,
+                ids=list(ids[i:j]),
+                documents=list(documents[i:j]),
+                embeddings=embeddings[i:j],
+                metadatas=list(metadatas[i:j]) if metadatas is not None else None,
+            )
+
+    def query(self, query_embeddings, n_results: int = 10, include=None):
+        # Several query vectors go to the server in a single request
+        return self._call(
+            self.collection.query,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include or ["documents", "metadatas", "distances"],
+        )
+
+    def count(self) -> int:
+        return self._call(self.collection.count)
+
+
+class ChromaHttpStore:
+    """Chroma server over HTTP: no local index files, stateless replicas."""
+
+    name = "chroma-http"
+
+    def __init__(self, host: str = CHROMA_HOST, port: int = CHROMA_PORT):
+        import chromadb
+        from chromadb.config import Settings
+
+        # One client per process: its HTTP session pools connections
+        # and is shared by every request thread
+        self.client = with_retry(
+            chromadb.HttpClient,
+            host=host,
+            port=port,
+            settings=Settings(anonymized_telemetry=False),
+        )
+        self._collections: Dict[str, RemoteCollection] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, name: str, loader) -> RemoteCollection:
+        # Looking up a collection is a round trip; a handle is kept until the
+        # collection is deleted, here or (seen as "not found") by another service
+        with self._lock:
+            collection = self._collections.get(name)
+        if collection is None:
+            collection = RemoteCollection(with_retry(loader, name=name), lambda: self._forget(name))
+            with self._lock:
+                self._collections[name] = collection
+        return collection
+
+    def _forget(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def get_collection(self, document_id: int) -> RemoteCollection:
+        return self._cached(collection_name(document_id), self.client.get_collection)
+
+    def get_or_create_collection(self, document_id: int) -> RemoteCollection:
+        return self._cached(collection_name(document_id), self.client.get_or_create_collection)
+
+    def delete_collection(self, document_id: int) -> bool:
+        name = collection_name(document_id)
+        self._forget(name)
+        try:
+            with_retry(self.client.delete_collection, name=name)
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            raise
+        return True
+
+    def document_ids(self) -> List[int]:
+        ids = (document_id_of(name) for name in _names(with_retry(self.client.list_collections)))
+        return [i for i in ids if i is not None]
+
+    def disk_usage(self) -> Optional[int]:
+        return None  # on the server
+
+    def compact(self) -> dict:
+        # The server owns its files; run `chroma vacuum` there while it is stopped
+        return {"vacuumed": False}
+
+
+# ==============================================================================
+# SEGMENT ENGINE
+# ==============================================================================
+
+class _Segment:
+    """One immutable segment, memory-mapped on first use."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        with open(path / "records.json", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[dict] = records["metadatas"]
+        self.hnsw = None
+        if (path / "hnsw.bin").exists():
+            self.hnsw = _load_hnsw(path / "hnsw.bin", self.vectors.shape[1], len(self.ids))
+        self.pq_codes = None
+        if (path / "pq_codes.npy").exists():
+            # Codes are small: keep them in memory; full vectors stay mapped
+            self.pq_codes = np.load(path / "pq_codes.npy")
+            self.pq_codebooks = np.load(path / "pq_codebooks.npy")
+
+    def search(self, query: np.ndarray, k: int):
+        """Return (row indices, similarities) of the best k rows."""
+        k = min(k, len(self.ids))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.hnsw is not None:
+            self.hnsw.set_ef(max(SEGMENT_HNSW_EF_SEARCH, k))
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+        if self.pq_codes is not None:
+            # Rank by PQ codes, then re-score the best candidates exactly
+            approx = pq_scores(self.pq_codes, self.pq_codebooks, query)
+            candidates = _top_k(approx, k * max(1, SEGMENT_PQ_RERANK))
+            candidates.sort()  # sequential reads from the mapped file
+            scores = _exact_scores(self.vectors[candidates], query)
+            top = _top_k(scores, k)
+            return candidates[top], scores[top]
+
+        scores = _exact_scores(self.vectors, query)
+        top = _top_k(scores, k)
+        return top, scores[top]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+def _exact_scores(vectors: np.ndarray, query: np.ndarray, block: int = 65536) -> np.ndarray:
+    """Inner product of every row with the query, computed in float32."""
+    query = query.astype(np.float32, copy=False)
+    if vectors.dtype == np.float32:
+        # One matrix-vector product straight over the mapped file
+        return vectors @ query
+    # float16: convert block by block so memory stays bounded
+    return np.concatenate([
+        np.asarray(vectors[i:i + block], dtype=np.float32) @ query
+        for i in range(0, len(vectors), block)
+    ]) if len(vectors) else np.empty(0, dtype=np.float32)
+
+
+# ------------------------------------------------------------------------------
+# Product quantization
+# ------------------------------------------------------------------------------
+
+def train_pq(vectors: np.ndarray, subspaces: int = SEGMENT_PQ_SUBSPACES,
+             iterations: int = 12, sample: int = 20000, seed: int = 0) -> np.ndarray:
+    """
+    Learn PQ codebooks with k-means in each subspace.
+
+    Returns:
+        np.ndarray: Codebooks of shape (subspaces, centroids, dim // subspaces)
+    """
+    n, dim = vectors.shape
+    if dim % subspaces:
+        raise ValueError(f"SEGMENT_PQ_SUBSPACES={subspaces} must divide dimension {dim}")
+    rng = np.random.default_rng(seed)
+    train = np.asarray(vectors[rng.choice(n, size=min(n, sample), replace=False)], dtype=np.float32)
+    centroids = min(256, len(train))
+    dsub = dim // subspaces
+
+    codebooks = np.empty((subspaces, centroids, dsub), dtype=np.float32)
+    for m in range(subspaces):
+        x = train[:, m * dsub:(m + 1) * dsub]
+        c = x[rng.choice(len(x), size=centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _nearest(x, c)
+            counts = np.bincount(assign, minlength=centroids)
+            sums = np.zeros_like(c)
+            np.add.at(sums, assign, x)
+            filled = counts > 0  # empty clusters keep their old centroid
+            c[filled] = sums[filled] / counts[filled, None]
+        codebooks[m] = c
+    return codebooks
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||² = argmin (||c||² - 2 x·c)
+    return np.argmin((centroids ** 2).sum(axis=1) - 2.0 * (x @ centroids.T), axis=1)
+
+
+def pq_encode(vectors: np.ndarray, codebooks: np.ndarray, block: int = 65536) -> np.ndarray:
+    """Encode vectors as one uint8 centroid id per subspace."""
+    subspaces, _, dsub = codebooks.shape
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for i in range(0, len(vectors), block):
+        x = np.asarray(vectors[i:i + block], dtype=np.float32)
+        for m in range(subspaces):
+            codes[i:i + block, m] = _nearest(x[:, m * dsub:(m + 1) * dsub], codebooks[m])
+    return codes
+
+
+def pq_scores(codes: np.ndarray, codebooks: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Approximate inner products of a query with PQ-encoded vectors."""
+    subspaces, _, dsub = codebooks.shape
+    q = query.astype(np.float32, copy=False).reshape(subspaces, 1, dsub)
+    # table[m, j] = <query subvector m, centroid j of subspace m>
+    table = (codebooks * q).sum(axis=2)
+    return table[np.arange(subspaces), codes].sum(axis=1)
+
+
+def _load_hnsw(path: Path, dim: int, count: int):
+    try:
+        import hnswlib
+    except ImportError:
+        return None  # Fall back to exact scan
+    index = hnswlib.Index(space="ip", dim=dim)
+    index.load_index(str(path), max_elements=count)
+    return index
+
+
+def _build_hnsw(vectors: np.ndarray, path: Path) -> bool:
+    try:
+        import hnswlib
+    except ImportError:
+        print("hnswlib not installed - large segment will use exact search")
+        return False
+    index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+    index.init_index(
+        max_elements=len(vectors),
+        ef_construction=SEGMENT_HNSW_EF_CONSTRUCTION,
+        M=SEGMENT_HNSW_M,
+    )
+    index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(len(vectors)))
+    index.save_index(str(path))
+    return True
+
+
+class SegmentCollection:
+    """A document's collection: a directory of immutable segments."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._segments: Dict[str, _Segment] = {}
+        self._lock = threading.Lock()
+
+    def _segment_names(self) -> List[str]:
+        # Hidden (".tmp-*") directories are segments still being written
+        return sorted(
+            p.name for p in self.path.iterdir()
+            if p.is_dir() and p.name.startswith("seg_")
+        )
+
+    def segments(self) -> List[_Segment]:
+        names = self._segment_names()
+        with self._lock:
+            for name in names:
+                if name not in self._segments:
+                    self._segments[name] = _Segment(self.path / name)
+            for name in list(self._segments):
+                if name not in names:
+                    del self._segments[name]
+            return [self._segments[name] for name in names]
+
+    def count(self) -> int:
+        return sum(len(s.ids) for s in self.segments())
+
+    def add(self, ids, documents, embeddings, metadatas=None):
+        vectors = np.ascontiguousarray(embeddings, dtype=SEGMENT_DTYPE)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings must be a 2-D array with one row per id")
+        records = {
+            "ids": list(ids),
+            "documents": list(documents),
+            "metadatas": list(metadatas) if metadatas is not None else [{} for _ in ids],
+        }
+
+        # Write into a hidden directory, then rename: readers see all or nothing
+        tmp = self._new_tmp()
+        np.save(tmp / "vectors.npy", vectors)
+        self._publish(tmp, vectors, records)
+
+    def _new_tmp(self) -> Path:
+        tmp = self.path / f".tmp-{uuid.uuid4().hex}"
+        tmp.mkdir(parents=True)
+        return tmp
+
+    def _publish(self, tmp: Path, vectors: np.ndarray, records: dict):
+        """Add records and indexes to a written segment and rename it into place."""
+        with open(tmp / "records.json", "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        if len(vectors) >= SEGMENT_HNSW_THRESHOLD:
+            _build_hnsw(vectors, tmp / "hnsw.bin")
+        elif SEGMENT_PQ and len(vectors) >= SEGMENT_PQ_MIN_VECTORS:
+            codebooks = train_pq(vectors)
+            np.save(tmp / "pq_codebooks.npy", codebooks)
+            np.save(tmp / "pq_codes.npy", pq_encode(vectors, codebooks))
+        # Named when complete, so it sorts after every segment added before
+        os.replace(tmp, self.path / f"seg_{time.time_ns():020d}_{uuid.uuid4().hex[:8]}")
+
+    def writer(self) -> "SegmentWriter":
+        """Writer that turns many add() calls into one segment (see SegmentWriter)."""
+        return SegmentWriter(self)
+
+    @staticmethod
+    def _stale_ids(segments: List[_Segment]) -> List[Set[str]]:
+        """
+        Per segment, its chunk ids that a newer segment added again.
+
+        The newest copy of a chunk wins whatever its similarity: the older
+        ones are out of date and must never be returned.
+        """
+        stale: List[Set[str]] = [set() for _ in segments]
+        if len(segments) < 2:
+            return stale
+        newer: Set[str] = set()
+        for seg_no in range(len(segments) - 1, -1, -1):
+            ids = set(segments[seg_no].ids)
+            stale[seg_no] = ids & newer
+            newer |= ids
+        return stale
+
+    def query(self, query_embeddings, n_results: int = 10, include=None):
+        """Chroma-compatible query: returns lists of results per query vector."""
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        segments = self.segments()
+        stale = self._stale_ids(segments)
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in queries:
+            candidates = []
+            for seg_no, segment in enumerate(segments):
+                # Stale rows are skipped, so ask for enough to still fill n_results
+                rows, sims = segment.search(query, n_results + len(stale[seg_no]))
+                candidates.extend(
+                    (float(s), seg_no, int(r)) for r, s in zip(rows, sims)
+                    if segment.ids[r] not in stale[seg_no]
+                )
+            candidates.sort(key=lambda c: -c[0])
+            seen, best = set(), []
+            for sim, seg_no, row in candidates:
+                chunk_id = segments[seg_no].ids[row]
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                best.append((sim, segments[seg_no], row))
+                if len(best) == n_results:
+                    break
+
+            out["ids"].append([seg.ids[row] for _, seg, row in best])
+            out["documents"].append([seg.documents[row] for _, seg, row in best])
+            out["metadatas"].append([seg.metadatas[row] for _, seg, row in best])
+            out["distances"].append([1.0 - sim for sim, _, _ in best])
+
+        return {key: value for key, value in out.items() if key == "ids" or key in include}
+
+
+class SegmentWriter:
+    """
+    Builds ONE segment from many add() calls.
+
+    A long document is stored in batches while it is encoded. Written as a
+    segment each, its batches would never reach SEGMENT_HNSW_THRESHOLD (or
+    SEGMENT_PQ_MIN_VECTORS) and every query would scan them all. The writer
+    appends each batch's vectors to a file instead of keeping them in
+    memory; close() turns them into vectors.npy, builds the index for the
+    whole document and renames the segment into place (abort() drops it).
+    """
+
+    # Rows copied at a time from the append file into vectors.npy
+    COPY_ROWS = 65536
+
+    def __init__(self, collection: SegmentCollection):
+        self.collection = collection
+        self.tmp = collection._new_tmp()
+        self._file = open(self.tmp / "vectors.raw", "wb")
+        self._dim: Optional[int] = None
+        self._count = 0
+        self._records = {"ids": [], "documents": [], "metadatas": []}
+
+    def add(self, ids, documents, embeddings, metadatas=None):
+        vectors = np.ascontiguousarray(embeddings, dtype=SEGMENT_DTYPE)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings must be a 2-D array with one row per id")
+        if self._dim is not None and vectors.shape[1] != self._dim:
+            raise ValueError("all embeddings of a segment must have the same dimension")
+        self._dim = vectors.shape[1]
+        self._file.write(vectors.tobytes())
+        self._count += len(vectors)
+        self._records["ids"].extend(ids)
+        self._records["documents"].extend(documents)
+        self._records["metadatas"].extend(metadatas if metadatas is not None else [{} for _ in ids])
+
+    def close(self):
+        self._file.close()
+        if self._count == 0:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+            return
+        shape = (self._count, self._dim)
+        raw = np.memmap(self.tmp / "vectors.raw", dtype=SEGMENT_DTYPE, mode="r", shape=shape)
+        vectors = np.lib.format.open_memmap(self.tmp / "vectors.npy", mode="w+", dtype=SEGMENT_DTYPE, shape=shape)
+        for start in range(0, self._count, self.COPY_ROWS):
+            vectors[start:start + self.COPY_ROWS] = raw[start:start + self.COPY_ROWS]
+        vectors.flush()
+        del raw
+        os.remove(self.tmp / "vectors.raw")
+        self.collection._publish(self.tmp, vectors, self._records)
+
+    def abort(self):
+        self._file.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class _DirectWriter:
+    """Writer for engines that index incrementally (Chroma): add() goes straight through."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def add(self, **kwargs):
+        self.collection.add(**kwargs)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+def collection_writer(collection):
+    """
+    Writer for storing one document in several add() calls.
+
+    Call add() per batch, then close() once everything is added (abort() on
+    failure). The segment engine makes them one segment; other engines
+    write each add() as it comes.
+    """
+    if isinstance(collection, SegmentCollection):
+        return collection.writer()
+    return _DirectWriter(collection)
+
+
+class SegmentStore:
+    """Built-in engine: one directory of memory-mapped segments per document."""
+
+    name = "segment"
+
+    def __init__(self, path: str = SEGMENT_PATH):
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._collections: Dict[str, SegmentCollection] = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str) -> SegmentCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = SegmentCollection(self.root / name)
+            return self._collections[name]
+
+    def get_collection(self, document_id: int) -> SegmentCollection:
+        name = collection_name(document_id)
+        if not (self.root / name).is_dir():
+            raise ValueError(f"Collection {name} does not exist.")
+        return self._collection(name)
+
+    def get_or_create_collection(self, document_id: int) -> SegmentCollection:
+        name = collection_name(document_id)
+        (self.root / name).mkdir(parents=True, exist_ok=True)
+        return self._collection(name)
+
+    def delete_collection(self, document_id: int) -> bool:
+        name = collection_name(document_id)
+        with self._lock:
+            self._collections.pop(name, None)
+        try:
+            shutil.rmtree(self.root / name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def document_ids(self) -> List[int]:
+        ids = (document_id_of(p.name) for p in self.root.iterdir() if p.is_dir())
+        return [i for i in ids if i is not None]
+
+    def disk_usage(self) -> Optional[int]:
+        return _dir_size(self.root)
+
+    def compact(self, min_age_seconds: float = 3600) -> dict:
+        """Delete ".tmp-*" segments whose writer died (untouched for min_age_seconds)."""
+        cutoff = time.time() - min_age_seconds
+        removed = 0
+        for tmp in self.root.glob("*/.tmp-*"):
+            if not tmp.is_dir():
+                continue
+            try:
+                # A SegmentWriter appends to a file: the directory's own time stays old
+                touched = max([tmp.stat().st_mtime] + [p.stat().st_mtime for p in tmp.iterdir()])
+            except OSError:
+                continue  # published or removed meanwhile
+            if touched < cutoff:
+                shutil.rmtree(tmp, ignore_errors=True)
+                removed += 1
+        return {"abandoned_writes_removed": removed}
+
+
+# ==============================================================================
+# FACTORY
+# ==============================================================================
+
+_STORES = {
+    "chroma": ChromaStore,
+    "chroma-http": ChromaHttpStore,
+    "segment": SegmentStore,
+}
+
+
+def create_vector_store(engine: str = VECTOR_STORE):
+    """
+    Create the vector store named by `engine`.
+
+    Raises:
+        ValueError: If the engine name is unknown
+    """
+    store_cls = _STORES.get(engine)
+    if store_cls is None:
+        raise ValueError(
+            f"Unknown VECTOR_STORE '{engine}' (expected one of: {', '.join(_STORES)})"
+        )
+    return store_cls()
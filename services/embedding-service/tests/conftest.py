@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# Tests import the service's modules the way the Docker image does (src/ as the working directory)
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+os.environ.setdefault("DOCKER_ENV", "true")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,86 @@
+import json
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import ClauseSummary
+from utils import clause_pipeline
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'clauses.db'}")
+    ClauseSummary.__table__.create(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(clause_pipeline, "SessionLocal", factory)
+    monkeypatch.setattr(clause_pipeline, "CLAUSE_PIPELINE", True)
+    monkeypatch.setattr(clause_pipeline, "CLAUSE_SUMMARY_IDLE_SECONDS", 0)
+    monkeypatch.setattr(clause_pipeline, "CLAUSE_SUMMARY_HOURS", "")
+    yield factory
+    engine.dispose()
+
+
+def _wait_for(factory, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = factory()
+        try:
+            rows = db.query(ClauseSummary).order_by(ClauseSummary.id).all()
+        finally:
+            db.close()
+        if condition(rows):
+            return rows
+        time.sleep(0.05)
+    raise AssertionError("clause summaries were not processed in time")
+
+
+def test_pending_rows_from_before_a_restart_are_summarized(session_factory, monkeypatch):
+    calls = []
+
+    def summarize(clause_type, chunks):
+        calls.append((clause_type, chunks))
+        return f"{clause_type}: {len(chunks)} chunk(s)"
+
+    monkeypatch.setattr(clause_pipeline, "summarize_clause", summarize)
+
+    # Rows left "pending" by a process that died before summarizing them
+    db = session_factory()
+    db.add_all([
+        ClauseSummary(document_id=7, clause_type="rent", chunk_indices="[0]",
+                      chunk_texts=json.dumps(["Rent is Rs. 15,000."]), status="pending"),
+        ClauseSummary(document_id=7, clause_type="notice_period", chunk_indices="[2]",
+                      chunk_texts=None, status="pending"),
+    ])
+    db.commit()
+    db.close()
+
+    worker = clause_pipeline.ClauseSummaryWorker()
+    assert worker.pending() == 2
+    worker.start()
+
+    rows = _wait_for(session_factory, lambda rows: all(r.status != "pending" for r in rows))
+    assert [(r.clause_type, r.status, r.summary) for r in rows] == [
+        ("rent", "ready", "rent: 1 chunk(s)"),
+        ("notice_period", "error", None),  # no text to summarize
+    ]
+    assert calls == [("rent", ["Rent is Rs. 15,000."])]
+    assert worker.pending() == 0
+
+
+def test_scheduled_rows_keep_their_text(session_factory, monkeypatch):
+    monkeypatch.setattr(clause_pipeline, "CLAUSE_MAX_CHUNKS", 2)
+    monkeypatch.setattr(clause_pipeline.summary_worker, "submit", lambda: None)
+
+    chunks = ["a", "b", "c", "d"]
+    clause_pipeline.schedule_clause_summaries(3, chunks, ["rent", None, "rent", "rent"])
+
+    db = session_factory()
+    try:
+        row = db.query(ClauseSummary).one()
+    finally:
+        db.close()
+    assert row.status == "pending"
+    assert json.loads(row.chunk_indices) == [0, 2, 3]
+    assert json.loads(row.chunk_texts) == ["a", "c"]
@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+
+from kafka import TopicPartition
+
+import consumer
+from consumer import LaneScheduler, OffsetTracker
+
+BULK = TopicPartition("document_uploaded.bulk", 0)
+INTERACTIVE = TopicPartition("document_uploaded", 0)
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.paused = set()
+
+    def assignment(self):
+        return {BULK, INTERACTIVE}
+
+    def pause(self, *partitions):
+        self.paused.update(partitions)
+
+    def resume(self, *partitions):
+        self.paused.difference_update(partitions)
+
+
+def _message(tp, offset):
+    return SimpleNamespace(topic=tp.topic, partition=tp.partition, offset=offset, value={})
+
+
+def test_messages_waiting_to_retry_count_against_the_lane_buffer():
+    scheduler = LaneScheduler(weight=4, buffer_size=4)
+    kafka = FakeConsumer()
+
+    # Every fetched bulk message fails and waits for its retry
+    scheduler.add({BULK: [_message(BULK, i) for i in range(4)]})
+    while scheduler.has_work():
+        scheduler.retry_later(scheduler.next_message(), delay=60)
+    assert not any(scheduler.buffers.values())
+
+    scheduler.apply_flow_control(kafka)
+    assert scheduler.held("bulk") == 4
+    assert kafka.paused == {BULK}  # no more fetches while the retry heap is full
+
+    # Once the retries are due and taken again, the lane resumes
+    scheduler._retries = [(0, seq, message) for _, seq, message in scheduler._retries]
+    while scheduler.has_work():
+        scheduler.next_message()
+    scheduler.apply_flow_control(kafka)
+    assert scheduler.held("bulk") == 0
+    assert kafka.paused == set()
+
+
+def test_dropped_partitions_release_their_retries():
+    scheduler = LaneScheduler(weight=4, buffer_size=4)
+    scheduler.retry_later(_message(BULK, 0), delay=60)
+    scheduler.retry_later(_message(INTERACTIVE, 0), delay=60)
+
+    scheduler.drop([BULK])
+    assert scheduler.held("bulk") == 0
+    assert scheduler.held("interactive") == 1
+
+
+def test_offsets_are_committed_only_up_to_the_first_unfinished_message():
+    tracker = OffsetTracker()
+    messages = [_message(BULK, offset) for offset in (5, 6, 7)]
+    for message in messages:
+        tracker.received(message)
+
+    # Later messages finished first: offset 5 still blocks the commit
+    tracker.done(messages[1])
+    tracker.done(messages[2])
+    assert tracker.committable() == {}
+    assert tracker.position(BULK) == 5
+
+    tracker.done(messages[0])
+    offsets = tracker.committable()
+    assert {tp: meta.offset for tp, meta in offsets.items()} == {BULK: 8}
+    tracker.committed(offsets)
+    assert tracker.committable() == {}
+    assert tracker.committable(partitions={INTERACTIVE}) == {}
+
+
+def test_lanes_take_weight_interactive_messages_per_bulk_message():
+    scheduler = LaneScheduler(weight=2, buffer_size=50)
+    scheduler.add({
+        INTERACTIVE: [_message(INTERACTIVE, i) for i in range(5)],
+        BULK: [_message(BULK, i) for i in range(3)],
+    })
+
+    order = []
+    while scheduler.has_work():
+        order.append("I" if scheduler.next_message().topic == INTERACTIVE.topic else "B")
+    # Bulk is never starved, and takes over once interactive is empty
+    assert "".join(order) == "IIBIIBIB"
+
+
+class _Kafka(FakeConsumer):
+    def __init__(self):
+        super().__init__()
+        self.commits = []
+
+    def commit(self, offsets):
+        self.commits.append({tp: meta.offset for tp, meta in offsets.items()})
+
+
+def test_failed_dead_letter_publish_is_retried_without_reprocessing(monkeypatch):
+    processed, published, statuses = [], [], []
+
+    def process_event(event, traceparent=None, lane="interactive"):
+        processed.append(event["document_id"])
+        raise RuntimeError("extraction failed")
+
+    def publish_dead_letter(message, error, attempts, first_failed_at):
+        published.append(attempts)
+        return len(published) > 1  # broker down the first time
+
+    monkeypatch.setattr(consumer, "scheduler", LaneScheduler(weight=4, buffer_size=4))
+    monkeypatch.setattr(consumer, "tracker", OffsetTracker())
+    monkeypatch.setattr(consumer, "_failures", {})
+    monkeypatch.setattr(consumer, "_dlq_pending", {})
+    monkeypatch.setattr(consumer, "MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(consumer, "process_event", process_event)
+    monkeypatch.setattr(consumer, "publish_dead_letter", publish_dead_letter)
+    monkeypatch.setattr(consumer, "update_document_status", lambda document_id, status: statuses.append(status))
+
+    message = _message(BULK, 3)
+    message.value = {"document_id": 9}
+    message.headers = []
+    consumer.tracker.received(message)
+    kafka = _Kafka()
+
+    consumer._handle(kafka, message)
+    assert published == [1] and kafka.commits == []
+    assert consumer.scheduler.held("bulk") == 1  # waiting to publish again
+
+    consumer._handle(kafka, message)
+    assert processed == [9]  # processed once, only the publish was repeated
+    assert published == [1, 1]
+    assert statuses == ["error"]
+    assert kafka.commits == [{BULK: 4}]
+    assert consumer._failures == {} and consumer._dlq_pending == {}
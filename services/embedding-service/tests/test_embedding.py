@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from utils import embedding, vector_store
+from utils.chunk_cache import ChunkEmbeddingCache
+from utils.vector_store import SegmentStore
+
+
+class FakeEncoder:
+    """Random unit vectors; enough to exercise batching and storage."""
+
+    dimension = 16
+
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+
+    def token_lengths(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        vectors = self.rng.standard_normal((len(texts), self.dimension)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_long_document_becomes_one_hnsw_indexed_segment(tmp_path, monkeypatch):
+    store = SegmentStore(str(tmp_path))
+    chunks = [f"clause {i} of the agreement" for i in range(25_000)]
+    monkeypatch.setattr(embedding, "_store", store)
+    monkeypatch.setattr(embedding, "_model", FakeEncoder())
+    monkeypatch.setattr(embedding, "chunk_cache", ChunkEmbeddingCache("", "test"))
+    monkeypatch.setattr(embedding, "chunk_text", lambda text: chunks)
+    monkeypatch.setattr(vector_store, "SEGMENT_HNSW_THRESHOLD", 20_000)
+
+    embedding.generate_and_store_embeddings(42, "long document")
+
+    collection = store.get_collection(42)
+    segments = collection.segments()
+    assert len(segments) == 1  # not one per EMBEDDING_STORE_BATCH write
+    assert len(segments[0].ids) == 25_000
+    assert segments[0].hnsw is not None
+    assert not list(collection.path.glob(".tmp-*"))
+
+    # The stored rows line up with their chunks
+    row = segments[0].ids.index("chunk_123")
+    result = collection.query(query_embeddings=[segments[0].vectors[row]], n_results=1)
+    assert result["documents"] == [["clause 123 of the agreement"]]
+
+
+def test_failed_document_leaves_no_partial_segment(tmp_path, monkeypatch):
+    store = SegmentStore(str(tmp_path))
+
+    class Failing(FakeEncoder):
+        def encode(self, texts, **kwargs):
+            raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(embedding, "_store", store)
+    monkeypatch.setattr(embedding, "_model", Failing())
+    monkeypatch.setattr(embedding, "chunk_cache", ChunkEmbeddingCache("", "test"))
+    monkeypatch.setattr(embedding, "chunk_text", lambda text: ["a", "b"])
+
+    with pytest.raises(RuntimeError):
+        embedding.generate_and_store_embeddings(7, "document")
+    collection = store.get_collection(7)
+    assert collection.segments() == []
+    assert not list(collection.path.glob(".tmp-*"))
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from utils import encoder
+from utils.encoder import activation_bytes, encode_batches, plan_batches
+
+WORDS = ["notice", "period", "rent", "deposit", "tenant", "landlord", "court", "delhi",
+         "month", "penalty", "lock", "in", "agreement", "shall", "pay", "the", "of"]
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """A 2-layer, 32-dimension BERT with a word-level vocabulary, saved as a sentence-transformers model."""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("sentence_transformers")
+    from sentence_transformers import SentenceTransformer, models
+
+    path = tmp_path_factory.mktemp("tiny-model")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    tokenizer = transformers.BertTokenizerFast(vocab_file=str(path / "vocab.txt"))
+    torch.manual_seed(0)
+    config = transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=64,
+    )
+    transformers.BertModel(config).eval().save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+    transformer = models.Transformer(str(path), max_seq_length=32)
+    pooling = models.Pooling(32, pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling]).save(str(path / "st"))
+    return path
+
+
+def _manual_mean_pooling(path, texts):
+    """Reference: token embeddings of the raw transformer, averaged over real tokens, unit length."""
+    import torch
+    import transformers
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained(path)
+    model = transformers.AutoModel.from_pretrained(path).eval()
+    batch = tokenizer(texts, padding=True, return_tensors="pt")
+    with torch.no_grad():
+        tokens = model(**batch).last_hidden_state.numpy()
+    mask = batch["attention_mask"].numpy()[..., None]
+    pooled = (tokens * mask).sum(axis=1) / mask.sum(axis=1)
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+TEXTS = ["the tenant shall pay the rent", "notice period", "lock in period of the agreement shall"]
+
+
+def test_torch_encoder_mean_pools_and_normalizes(tiny_model):
+    model = encoder.TorchEncoder(str(tiny_model / "st"))
+    vectors = model.encode(TEXTS, normalize_embeddings=True)
+
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (3, 32)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+    np.testing.assert_allclose(vectors, _manual_mean_pooling(tiny_model, TEXTS), atol=1e-5)
+
+
+def test_onnx_engines_match_torch(tiny_model, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    torch = pytest.importorskip("torch")
+    import transformers
+
+    onnx_dir = tiny_model / "onnx"
+    onnx_dir.mkdir(exist_ok=True)
+    model = transformers.AutoModel.from_pretrained(tiny_model).eval()
+
+    class Exported(torch.nn.Module):
+        # Keyword arguments: BertModel.forward's positional order differs between versions
+        def __init__(self):
+            super().__init__()
+            self.bert = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.bert(input_ids=input_ids, attention_mask=attention_mask,
+                             token_type_ids=token_type_ids).last_hidden_state
+
+    ids = torch.ones((2, 5), dtype=torch.long)
+    try:
+        torch.onnx.export(
+            Exported().eval(), (ids, torch.ones_like(ids), torch.zeros_like(ids)), str(onnx_dir / "model.onnx"),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"}
+                          for name in ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")},
+            dynamo=False,
+        )
+    except Exception as e:  # exporter unavailable in this torch build
+        pytest.skip(f"ONNX export failed: {e}")
+    transformers.AutoTokenizer.from_pretrained(tiny_model).backend_tokenizer.save(str(onnx_dir / "tokenizer.json"))
+    monkeypatch.setattr(encoder, "ONNX_MODEL_DIR", str(onnx_dir))
+
+    onnx_vectors = encoder.OnnxEncoder(str(tiny_model)).encode(TEXTS, batch_size=2)
+    torch_vectors = encoder.TorchEncoder(str(tiny_model / "st")).encode(TEXTS)
+
+    np.testing.assert_allclose(np.linalg.norm(onnx_vectors, axis=1), 1, atol=1e-5)
+    cosine = (onnx_vectors * torch_vectors).sum(axis=1)
+    assert cosine.min() > 0.9999
+
+    # int8 weights trade a little accuracy (bench_embedding_engines.py checks the real model)
+    monkeypatch.setattr(encoder, "ONNX_CACHE_DIR", str(tiny_model / "onnx-cache"))
+    int8_vectors = encoder.load_encoder("onnx-int8", str(tiny_model)).encode(TEXTS)
+    assert (int8_vectors * torch_vectors).sum(axis=1).min() > 0.98
+
+
+def test_plan_batches_sorts_by_length_and_respects_limits():
+    lengths = [40, 5, 256, 12, 12, 100, 7, 256, 30, 64] * 5
+    memory = activation_bytes(8, 64, 384)
+    batches = plan_batches(lengths, 384, memory, max_batch_size=6)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    flat = [lengths[i] for batch in batches for i in batch]
+    assert flat == sorted(flat)
+    for batch in batches:
+        assert len(batch) <= 6
+        # A text too long for the budget on its own still gets a batch of one
+        if len(batch) > 1:
+            assert activation_bytes(len(batch), max(lengths[i] for i in batch), 384) <= memory
+
+
+def test_plan_batches_grows_batches_for_short_texts():
+    short = plan_batches([8] * 64, 384, activation_bytes(32, 256, 384), max_batch_size=128)
+    long = plan_batches([256] * 64, 384, activation_bytes(32, 256, 384), max_batch_size=128)
+
+    assert len(short) == 1
+    assert [len(b) for b in long] == [32, 32]
+
+
+def test_encode_batches_returns_every_text_once():
+    class FakeEncoder:
+        dimension = 4
+
+        def token_lengths(self, texts):
+            return [len(t.split()) + 2 for t in texts]
+
+        def encode(self, texts, batch_size, normalize_embeddings):
+            assert batch_size == len(texts)
+            return np.array([[len(t), 0, 0, 0] for t in texts], dtype=np.float32)
+
+    texts = ["a b c", "a", "a b c d e f", "a b"]
+    seen = {}
+    for indices, vectors in encode_batches(FakeEncoder(), texts, memory_mb=0.001):
+        for i, vector in zip(indices, vectors):
+            seen[i] = vector[0]
+    assert seen == {i: len(t) for i, t in enumerate(texts)}
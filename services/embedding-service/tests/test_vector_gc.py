@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from kafka import TopicPartition
+
+from utils import vector_gc
+
+TP = TopicPartition("document_deleted", 0)
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = 0
+        self.seeks = []
+
+    def commit(self):
+        self.commits += 1
+
+    def seek(self, tp, offset):
+        self.seeks.append((tp, offset))
+
+
+def _records(*document_ids, first_offset=10):
+    return {TP: [
+        SimpleNamespace(offset=first_offset + i, value={"document_id": document_id})
+        for i, document_id in enumerate(document_ids)
+    ]}
+
+
+@pytest.fixture(autouse=True)
+def no_failures(monkeypatch):
+    monkeypatch.setattr(vector_gc, "_failures", {})
+    monkeypatch.setattr(vector_gc, "VECTOR_GC_MAX_ATTEMPTS", 3)
+
+
+def test_failed_deletions_are_fetched_again_not_committed_over(monkeypatch):
+    deleted = []
+
+    def delete(ids):
+        if ids == [4]:
+            raise RuntimeError("vector store unavailable")
+        deleted.extend(ids)
+        return len(ids)
+
+    monkeypatch.setattr(vector_gc, "delete_documents", delete)
+    consumer = FakeConsumer()
+
+    with pytest.raises(RuntimeError):
+        vector_gc._handle_deletions(consumer, _records(3, 4, 5))
+    assert deleted == [3]  # 5 waits behind 4
+    assert consumer.seeks == [(TP, 11)]  # the commit stops at the failed record
+    assert consumer.commits == 1
+
+
+def test_handled_deletions_are_committed(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(vector_gc, "delete_documents", lambda ids: deleted.extend(ids) or len(ids))
+    consumer = FakeConsumer()
+
+    vector_gc._handle_deletions(consumer, _records(3, 4))
+    assert deleted == [3, 4]
+    assert consumer.commits == 1
+    assert consumer.seeks == []
+
+
+def test_deletion_that_keeps_failing_is_skipped(monkeypatch):
+    deleted = []
+
+    def delete(ids):
+        if ids == [4]:
+            raise RuntimeError("permission denied")
+        deleted.extend(ids)
+        return len(ids)
+
+    monkeypatch.setattr(vector_gc, "delete_documents", delete)
+    consumer = FakeConsumer()
+    skipped_before = vector_gc.DELETIONS_SKIPPED._value.get()
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            vector_gc._handle_deletions(consumer, _records(4, 5))
+    vector_gc._handle_deletions(consumer, _records(4, 5))  # third and last attempt
+
+    assert deleted == [5]
+    assert consumer.seeks == [(TP, 10), (TP, 10)]
+    assert vector_gc.DELETIONS_SKIPPED._value.get() == skipped_before + 1
+    assert vector_gc._failures == {}
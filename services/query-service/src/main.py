@@ -1,9 +1,11 @@
 import os
 import sys
+import threading
 from pathlib import Path
 
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -25,16 +27,41 @@ else:
 # Conditional imports based on environment
 if os.getenv("DOCKER_ENV"):
     # Docker: use absolute imports
-    from database import get_db
-    from models import Document, QueryHistory
-    from utils.rag import retrieve_relevant_chunks
-    from utils.llm import generate_answer
+    from database import SessionLocal, engine, get_db
+    from models import ClauseSummary, Document, QueryHistory
+    from utils.rag import retrieve_batch, retrieve_relevant_chunks
+    from utils.document_cache import document_cache
+    from utils.embedding import loaded_components, question_batcher, question_cache, warm_up
+    from utils.job_worker import job_worker_state, start_job_worker
+    from utils.clauses import CLAUSE_SUMMARY_MODE, in_summary_language, match_clause_type
+    from utils.llm import DISCLAIMER, generate_answer, generate_answers, stream_answer
+    from utils.metrics import gauge_callback, instrument
+    from utils.rate_limit import RouteLimit, rate_limit, usage_scope
+    from utils.tracing import TracingMiddleware, span, traced
 else:
     # Local: use relative imports
-    from .database import get_db
-    from .models import Document, QueryHistory
-    from .utils.rag import retrieve_relevant_chunks
-    from .utils.llm import generate_answer
+    from .database import SessionLocal, engine, get_db
+    from .models import ClauseSummary, Document, QueryHistory
+    from .utils.rag import retrieve_batch, retrieve_relevant_chunks
+    from .utils.document_cache import document_cache
+    from .utils.embedding import loaded_components, question_batcher, question_cache, warm_up
+    from .utils.job_worker import job_worker_state, start_job_worker
+    from .utils.clauses import CLAUSE_SUMMARY_MODE, in_summary_language, match_clause_type
+    from .utils.llm import DISCLAIMER, generate_answer, generate_answers, stream_answer
+    from .utils.metrics import gauge_callback, instrument
+    from .utils.rate_limit import RouteLimit, rate_limit, usage_scope
+    from .utils.tracing import TracingMiddleware, span, traced
+
+# Time spent validating the token and loading the user shows up as "auth"
+get_current_user = traced("auth")(get_current_user)
+
+
+# Load the model / vector store in the background right after startup
+# (set to "false" to load on the first query instead)
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+
+# Largest questions × documents grid accepted by /query/batch
+BATCH_QUERY_MAX_PAIRS = int(os.getenv("BATCH_QUERY_MAX_PAIRS", "200"))
 
 
 class QueryRequest(BaseModel):
@@ -42,8 +69,24 @@ class QueryRequest(BaseModel):
     question: str
 
 
+class BatchQueryRequest(BaseModel):
+    document_ids: list[int]
+    questions: list[str]
+
+
 app = FastAPI(title="NyayaAI Query Service")
 
+# Spans per stage + Server-Timing header (see utils/tracing.py)
+app.add_middleware(TracingMiddleware)
+
+# Per-user token buckets; LLM routes also draw on the daily token quota
+# (see utils/rate_limit.py)
+rate_limit(app, {
+    "POST /query": RouteLimit("llm", 10, quota="llm_tokens"),
+    "POST /query/stream": RouteLimit("llm", 10, quota="llm_tokens"),
+    "POST /query/batch": RouteLimit("llm", 30, quota="llm_tokens"),
+})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -52,14 +95,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics at GET /metrics (route latency, vector search, LLM
+# tokens/sec, requests in flight, ...)
+instrument(app, engine)
+gauge_callback(
+    "question_embedding_cache",
+    "Question embedding cache entries and lookups",
+    lambda: {key: question_cache.stats()[key] for key in ("size", "hits", "disk_hits", "misses")},
+    ["stat"],
+)
+gauge_callback(
+    "document_cache",
+    "Document ownership/status cache entries and lookups",
+    lambda: {key: document_cache.stats()[key] for key in ("size", "hits", "misses", "invalidations")},
+    ["stat"],
+)
+gauge_callback(
+    "question_encode_batch_size",
+    "Average number of questions encoded per model call",
+    lambda: question_batcher.stats()["avg_batch_size"],
+)
+
+
+@app.on_event("startup")
+async def startup_event():
+    if WARM_UP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    # Answers async query jobs submitted to the response service
+    start_job_worker(run_query_job)
+
+    # Drops cached document status when the embedding/upload services change it
+    document_cache.start()
+
+
+def load_documents(db: Session):
+    """Loader for the document cache: (user_id, status) by id, in one query."""
+    def load(document_ids):
+        rows = (
+            db.query(Document.id, Document.user_id, Document.status)
+            .filter(Document.id.in_(list(document_ids)))
+            .all()
+        )
+        return {row.id: (row.user_id, row.status) for row in rows}
+    return load
+
 
 def verify_document_ownership(document_id: int, user_id: int, db: Session):
-    doc = (
-        db.query(Document)
-        .filter(Document.id == document_id, Document.user_id == user_id)
-        .first()
-    )
-    if not doc:
+    # Cached per process; see utils/document_cache.py
+    doc = document_cache.get(document_id, load_documents(db))
+    if doc.user_id != user_id:
         raise HTTPException(status_code=404, detail="Document not found or access denied")
     if doc.status != "ready":
         raise HTTPException(
@@ -69,6 +154,29 @@ def verify_document_ownership(document_id: int, user_id: int, db: Session):
     return doc
 
 
+def find_clause_summary(document_id: int, question: str, db: Session):
+    """Pre-computed summary of the clause this question is about, if any."""
+    clause_type = match_clause_type(question)
+    if clause_type is None:
+        return None
+    try:
+        row = (
+            db.query(ClauseSummary)
+            .filter(
+                ClauseSummary.document_id == document_id,
+                ClauseSummary.clause_type == clause_type,
+                ClauseSummary.status == "ready",
+            )
+            .first()
+        )
+    except Exception as e:
+        # Table missing (clause pipeline never enabled) - use normal RAG
+        print(f"Clause summary lookup failed: {e}")
+        db.rollback()
+        return None
+    return row.summary if row and row.summary else None
+
+
 @app.post("/query")
 def ask_question(
     request: QueryRequest,
@@ -76,38 +184,213 @@ def ask_question(
     db: Session = Depends(get_db)
 ):
     # 1️⃣ Verify access & readiness
-    verify_document_ownership(request.document_id, current_user.id, db)
+    with span("db.ownership", document_id=request.document_id):
+        verify_document_ownership(request.document_id, current_user.id, db)
 
-    # 2️⃣ Retrieve relevant chunks
-    chunks = retrieve_relevant_chunks(request.document_id, request.question)
-    if not chunks:
-        return {"answer": "No relevant information found in the document."}
-
-    # 3️⃣ Generate answer
-    answer = generate_answer(request.question, chunks)
-
-    # 4️⃣ ✅ SAVE QUERY HISTORY (Stage 3)
-    history = QueryHistory(
-        document_id=request.document_id,
-        question=request.question,
-        answer=answer,
-    )
-    db.add(history)
-    db.commit()
-
-    # 5️⃣ Respond
+    return answer_question(request.document_id, request.question, db)
+
+
+def answer_question(document_id: int, question: str, db: Session) -> dict:
+    """Steps 2-5 of /query; also used by the async job worker (utils/job_worker.py)."""
+    # 2️⃣ Common clause questions can use a pre-computed summary
+    with span("clause_summary"):
+        summary = find_clause_summary(document_id, question, db)
+
+    if summary and CLAUSE_SUMMARY_MODE == "direct" and in_summary_language(question):
+        # Answer straight from the summary: no retrieval, no LLM call
+        chunks = [summary]
+        answer = f"{summary}\n\n{DISCLAIMER}"
+    else:
+        # 3️⃣ Retrieve relevant chunks
+        chunks = retrieve_relevant_chunks(document_id, question)
+        if summary:
+            # "seed" mode, or a direct-mode question in another language than
+            # the (English) summary: the summary leads the context
+            chunks = [summary] + chunks
+        if not chunks:
+            return {"answer": "No relevant information found in the document."}
+
+        # 4️⃣ Generate answer
+        answer = generate_answer(question, chunks)
+
+    # 5️⃣ ✅ SAVE QUERY HISTORY (Stage 3)
+    with span("db.history"):
+        history = QueryHistory(
+            document_id=document_id,
+            question=question,
+            answer=answer,
+        )
+        db.add(history)
+        db.commit()
+
+    # 6️⃣ Respond
     return {
-        "question": request.question,
+        "question": question,
         "answer": answer,
         "sources": len(chunks),
     }
 
 
+def run_query_job(job: dict) -> dict:
+    """Answer one async query job (see utils/job_worker.py)."""
+    db = SessionLocal()
+    try:
+        # The document may have been deleted or re-processed since the job was queued
+        verify_document_ownership(job["document_id"], job["user_id"], db)
+        # Tokens count against the quota of the user who submitted the job
+        with usage_scope(job.get("quota_key")):
+            return answer_question(job["document_id"], job["question"], db)
+    finally:
+        db.close()
+
+
+@app.post("/query/batch")
+def ask_questions_batch(
+    request: BatchQueryRequest,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Run a checklist of questions against many documents in one request
+    document_ids = list(dict.fromkeys(request.document_ids))
+    questions = list(dict.fromkeys(q for q in request.questions if q.strip()))
+    if not document_ids or not questions:
+        raise HTTPException(status_code=400, detail="Provide at least one document and one question")
+    if len(document_ids) * len(questions) > BATCH_QUERY_MAX_PAIRS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions × documents (max {BATCH_QUERY_MAX_PAIRS})"
+        )
+
+    # 1️⃣ Verify access for all documents (uncached ones with one query)
+    with span("db.ownership", documents=len(document_ids)):
+        docs = {
+            doc_id: doc
+            for doc_id, doc in document_cache.get_many(document_ids, load_documents(db)).items()
+            if doc.user_id == current_user.id
+        }
+    missing = [doc_id for doc_id in document_ids if doc_id not in docs]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Documents not found or access denied: {missing}"
+        )
+    ready_ids = [doc_id for doc_id in document_ids if docs[doc_id].status == "ready"]
+
+    # 2️⃣ Encode all questions once, search ready documents in parallel
+    chunks_by_doc = retrieve_batch(ready_ids, questions) if ready_ids else {}
+
+    # 3️⃣ Generate answers; identical question + context (e.g. the same
+    #    template uploaded twice) is sent to the LLM only once
+    prompts = {}
+    for doc_id in ready_ids:
+        for question, chunks in zip(questions, chunks_by_doc[doc_id]):
+            prompts.setdefault((question, tuple(chunks)), None)
+    keys = list(prompts)
+    for key, answer in zip(keys, generate_answers([(q, list(c)) for q, c in keys])):
+        prompts[key] = answer
+
+    # 4️⃣ Collect results and save history with one bulk insert
+    results, history_rows = [], []
+    for doc_id in document_ids:
+        if doc_id not in chunks_by_doc:
+            for question in questions:
+                results.append({
+                    "document_id": doc_id,
+                    "question": question,
+                    "error": f"Document not ready (status: {docs[doc_id].status})",
+                })
+            continue
+        for question, chunks in zip(questions, chunks_by_doc[doc_id]):
+            answer = prompts[(question, tuple(chunks))]
+            results.append({
+                "document_id": doc_id,
+                "question": question,
+                "answer": answer,
+                "sources": len(chunks),
+            })
+            if chunks:
+                history_rows.append({"document_id": doc_id, "question": question, "answer": answer})
+
+    if history_rows:
+        with span("db.history", rows=len(history_rows)):
+            db.bulk_insert_mappings(QueryHistory, history_rows)
+            db.commit()
+
+    return {"results": results}
+
+
+@app.post("/query/stream")
+def ask_question_stream(
+    request: QueryRequest,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Same flow as /query, but the answer is sent as plain text while it is
+    # generated. History is saved once the full answer has been streamed.
+    with span("db.ownership", document_id=request.document_id):
+        verify_document_ownership(request.document_id, current_user.id, db)
+
+    chunks = retrieve_relevant_chunks(request.document_id, request.question)
+
+    def answer_stream():
+        parts = []
+        for token in stream_answer(request.question, chunks):
+            parts.append(token)
+            yield token
+
+        if not chunks:
+            return
+
+        # Use a fresh session: the request-scoped one may already be closed
+        history_db = SessionLocal()
+        try:
+            history_db.add(QueryHistory(
+                document_id=request.document_id,
+                question=request.question,
+                answer="".join(parts).strip(),
+            ))
+            history_db.commit()
+        finally:
+            history_db.close()
+
+    return StreamingResponse(answer_stream(), media_type="text/plain; charset=utf-8")
+
+
 @app.get("/health")
 def health():
     return {"status": "healthy"}
 
 
+@app.get("/live")
+def live():
+    # Liveness: the process is up; never touches the model or the vector store
+    return {"status": "alive", "service": "query-service"}
+
+
+@app.get("/ready")
+def ready():
+    # Readiness: embedding model loaded and vector store open
+    components = loaded_components()
+    is_ready = all(components.values())
+    body = {
+        "status": "ready" if is_ready else "starting",
+        "service": "query-service",
+        "loaded": components,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/stats")
+def stats():
+    # Question-encoding efficiency: cache hit rate and average batch size
+    return {
+        "embedding_cache": question_cache.stats(),
+        "encode_batcher": question_batcher.stats(),
+        "job_worker": job_worker_state,
+        "document_cache": document_cache.stats(),
+    }
+
+
 @app.get("/")
 def root():
     return {"message": "Query Service Running - Stage 3 Complete!"}
\ No newline at end of file
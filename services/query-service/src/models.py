@@ -4,7 +4,7 @@ from datetime import datetime
 
 Base = declarative_base()
 
-__all__ = ["Base", "Document", "QueryHistory", "User"]
+__all__ = ["Base", "ClauseSummary", "Document", "QueryHistory", "User"]
 
 class User(Base):
     """User model for authentication - minimal copy from auth-service."""
@@ -29,4 +29,15 @@ class QueryHistory(Base):
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, nullable=False, index=True)
     question = Column(Text, nullable=False)
-    answer = Column(Text, nullable=False)
\ No newline at end of file
+    answer = Column(Text, nullable=False)
+
+
+class ClauseSummary(Base):
+    """Clause summaries written by the embedding service - read-only here."""
+    __tablename__ = "clause_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, nullable=False, index=True)
+    clause_type = Column(String, nullable=False)
+    summary = Column(Text, nullable=True)
+    status = Column(String, default="pending")
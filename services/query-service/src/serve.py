@@ -0,0 +1,165 @@
+"""
+Pre-fork Launcher
+
+`uvicorn --workers N` starts N fresh interpreters, and every one of them
+loads its own copy of the embedding model: memory and cold start grow with
+the worker count. This launcher loads the model once and forks the workers
+from it instead:
+
+1. The master imports the app, binds the port and loads the embedding model
+   (with one torch thread, so no OpenMP pool exists before the fork).
+2. `gc.freeze()` moves everything loaded so far out of the collector's
+   reach: collections in the workers would otherwise write to those objects
+   and un-share their pages.
+3. WEB_CONCURRENCY workers are forked; the model weights stay shared
+   copy-on-write, since inference only reads them. Each worker sets its own
+   torch thread count, then serves the shared socket with uvicorn and opens
+   everything else itself (vector store client, database connections, Kafka
+   listeners, cache connections).
+4. The master only supervises: a worker that dies is forked again from the
+   loaded model, without loading it again; SIGTERM/SIGINT stop all workers
+   gracefully.
+
+With the ONNX engines the model is not preloaded: an ONNX Runtime session
+starts its thread pool on creation, and threads do not survive a fork. Each
+worker loads its own session (ONNX_THREADS defaults to EMBEDDING_THREADS).
+
+`scripts/benchmarks/bench_worker_memory.py` compares RSS/PSS per worker
+with `uvicorn --workers`.
+
+Usage:
+    WEB_CONCURRENCY=4 python serve.py        # Docker (DOCKER_ENV set)
+    WEB_CONCURRENCY=4 python -m src.serve    # local, from services/query-service
+
+Configuration (environment variables):
+- WEB_CONCURRENCY:   Worker processes (default: 1, which serves in-process
+                     without a master, like plain uvicorn)
+- EMBEDDING_THREADS: torch / ONNX Runtime threads per worker (default: CPUs
+                     available / workers, at least 1)
+- HOST, PORT:        Address to bind (default: 0.0.0.0:8003)
+- PROMETHEUS_MULTIPROC_DIR: Set it with several workers (see utils/metrics.py)
+"""
+
+import gc
+import os
+import signal
+import time
+
+import uvicorn
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8003"))
+
+
+def _available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return os.cpu_count() or 1
+
+
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or max(1, _available_cpus() // WEB_CONCURRENCY)
+
+# Read by utils/encoder.py at import, so it must be set before the app is imported
+os.environ.setdefault("ONNX_THREADS", str(EMBEDDING_THREADS))
+
+
+def _load_app():
+    if os.getenv("DOCKER_ENV"):
+        from database import engine
+        from main import app
+        from utils.embedding import get_model
+        from utils.encoder import EMBEDDING_ENGINE
+    else:
+        from .database import engine
+        from .main import app
+        from .utils.embedding import get_model
+        from .utils.encoder import EMBEDDING_ENGINE
+    return app, engine, get_model, EMBEDDING_ENGINE
+
+
+def _set_torch_threads(threads: int):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def _run_worker(config: uvicorn.Config, sock, engine, embedding_engine: str):
+    """Body of a forked worker; never returns to the master's loop."""
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if embedding_engine == "torch":
+            _set_torch_threads(EMBEDDING_THREADS)
+        # Pooled connections belong to the master; the worker opens its own
+        engine.dispose(close=False)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed: {e}")
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def main():
+    app, engine, get_model, embedding_engine = _load_app()
+    config = uvicorn.Config(app, host=HOST, port=PORT)
+
+    if WEB_CONCURRENCY <= 1:
+        uvicorn.Server(config).run()
+        return
+
+    sock = config.bind_socket()
+    if embedding_engine == "torch":
+        started = time.perf_counter()
+        _set_torch_threads(1)
+        get_model()
+        print(f"Embedding model loaded in {time.perf_counter() - started:.1f}s, "
+              f"forking {WEB_CONCURRENCY} workers with {EMBEDDING_THREADS} torch thread(s) each")
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock, engine, embedding_engine)
+        workers.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(WEB_CONCURRENCY):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(pid)
+        if not stopping:
+            print(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), starting a new one")
+            time.sleep(1)
+            if not stopping:
+                spawn()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Dynamic Micro-Batching for Question Encoding
+
+Every /query request has to turn its question into an embedding. Encoding
+one question at a time wastes the CPU: a batch of 1 barely uses SIMD, and
+concurrent requests fight over torch's intra-op threads.
+
+The micro-batcher fixes this:
+1. Requests put their question in a shared queue and wait
+2. A single worker thread collects questions arriving within a few
+   milliseconds of each other (up to a maximum batch size)
+3. The whole batch is encoded in one forward pass
+4. Each waiting request gets its own vector back
+
+Configuration (environment variables):
+- ENCODE_BATCHING:      "true" to enable (default), "false" to encode directly
+- ENCODE_MAX_BATCH:     Maximum questions per forward pass (default: 32)
+- ENCODE_MAX_DELAY_MS:  How long to wait for more questions (default: 5 ms)
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence
+
+ENCODE_BATCHING = os.getenv("ENCODE_BATCHING", "true").lower() == "true"
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", "32"))
+ENCODE_MAX_DELAY_MS = float(os.getenv("ENCODE_MAX_DELAY_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Collects single items from many threads and processes them in batches.
+
+    Args:
+        batch_fn: Function taking a list of items and returning one result
+                  per item (e.g. a list of vectors or a 2-D array)
+        max_batch: Maximum number of items per call to batch_fn
+        max_delay_ms: How long to wait after the first item for more to arrive
+
+    Example:
+        >>> batcher = MicroBatcher(lambda qs: model.encode(qs), max_batch=16)
+        >>> vector = batcher.submit("What is the notice period?")
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List], Sequence],
+        max_batch: int = ENCODE_MAX_BATCH,
+        max_delay_ms: float = ENCODE_MAX_DELAY_MS,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay_ms) / 1000.0
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Simple counters for monitoring / benchmarks
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        # Start the worker lazily so importing this module costs nothing
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, name="encode-batcher", daemon=True
+                    )
+                    self._worker.start()
+
+    def submit(self, item, timeout: Optional[float] = None):
+        """Queue one item and block until its result is ready."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self) -> List[tuple]:
+        # Block for the first item, then gather more until the batch is full
+        # or the delay window closes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Window closed: still take whatever is already waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                # Every waiting request sees the error instead of hanging
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000.0,
+        }
@@ -0,0 +1,45 @@
+"""
+Clause Summaries - Answering Common Questions Without Generation
+
+The embedding service can pre-compute a short summary of each common clause
+type (rent, notice period, lock-in, ...) in a document while the system is
+idle (see embedding-service utils/clause_pipeline.py).
+
+When a question clearly matches one clause type, /query uses that summary:
+- "direct" mode: return the summary as the answer (no retrieval, no LLM).
+                 Summaries are written in English, so questions in another
+                 language (e.g. Hindi) are answered as in "seed" mode and the
+                 LLM replies in the question's language
+- "seed" mode:   add the summary to the retrieved context
+- "off":         ignore summaries (default; enable with the embedding pipeline)
+
+Configuration (environment variables):
+- CLAUSE_SUMMARY_MODE:    off (default), direct or seed
+- CLAUSE_MATCH_THRESHOLD: how similar a question must be to a clause type (0.6)
+"""
+
+import os
+from typing import Optional
+
+from .clause_types import ClauseClassifier
+from .embedding import encode_question, encode_questions
+
+CLAUSE_SUMMARY_MODE = os.getenv("CLAUSE_SUMMARY_MODE", "off").lower()
+CLAUSE_MATCH_THRESHOLD = float(os.getenv("CLAUSE_MATCH_THRESHOLD", "0.6"))
+
+classifier = ClauseClassifier(encode_questions)
+
+
+def in_summary_language(question: str) -> bool:
+    """True if the question is in English, the language summaries are written in."""
+    # Any letter outside ASCII (Devanagari, ...) means another language
+    return not any(c.isalpha() and not c.isascii() for c in question)
+
+
+def match_clause_type(question: str) -> Optional[str]:
+    """Clause type the question is about, or None if it is not clearly one."""
+    if CLAUSE_SUMMARY_MODE == "off":
+        return None
+    # The question embedding is cached, so retrieval later reuses it for free
+    return classifier.classify(encode_question(question), CLAUSE_MATCH_THRESHOLD)[0]
+
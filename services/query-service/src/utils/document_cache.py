@@ -0,0 +1,192 @@
+"""
+Document Access Cache
+
+Every query checks that the document belongs to the user and is ready. A
+ready document's owner and status almost never change, so instead of
+reading the documents table on every request, each process keeps:
+
+    document_id -> (user_id, status, version)
+
+- Ready documents are kept for DOCUMENT_CACHE_TTL_SECONDS.
+- Documents that are not ready (uploaded, processing, error) or do not
+  exist are cached too ("negative" entries), but only for
+  DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS, so clients polling a document that is
+  still being embedded do not hit the database on every poll either.
+- A listener thread follows the `document_status` events published by the
+  embedding service and the `document_deleted` events published by the
+  upload service, and drops the entry of every document that changes. A
+  document is therefore queryable as soon as it is ready, and a deleted one
+  stops being answered at once, not after the TTL.
+
+`version` counts invalidations: a lookup that read the database while an
+event for the same document arrived is not cached, since what it read may
+already be out of date. The listener reads from the end of the topics
+without a consumer group: every replica needs every event. Until it is
+connected, ready entries also live only DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS.
+
+Configuration (environment variables):
+- DOCUMENT_CACHE_TTL_SECONDS:          ready documents (default: 300, 0 disables the cache)
+- DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS: other documents (default: 5)
+- DOCUMENT_CACHE_SIZE:                 max entries (default: 50000)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from kafka import KafkaConsumer
+from kafka.errors import NoBrokersAvailable
+
+DOCUMENT_CACHE_TTL_SECONDS = float(os.getenv("DOCUMENT_CACHE_TTL_SECONDS", "300"))
+DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "50000"))
+
+STATUS_TOPICS = [
+    os.getenv("DOCUMENT_STATUS_TOPIC", "document_status"),
+    os.getenv("DOCUMENT_DELETED_TOPIC", "document_deleted"),
+]
+
+
+class DocumentAccess(NamedTuple):
+    user_id: Optional[int]  # None: no such document
+    status: Optional[str]
+    version: int
+
+
+# Loads (user_id, status) for the given ids; missing ids are absent from the result
+Loader = Callable[[Iterable[int]], Dict[int, Tuple[int, str]]]
+
+
+class DocumentCache:
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[int, Tuple[float, DocumentAccess]]" = OrderedDict()
+        # Version of each recently invalidated document; older ones were
+        # forgotten and count as `_floor`
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = {"connected": False, "last_error": None, "invalidations": 0}
+        self._hits = 0
+        self._misses = 0
+
+    def _version(self, document_id: int) -> int:
+        return self._versions.get(document_id, self._floor)
+
+    def _ttl_for(self, access: DocumentAccess) -> float:
+        if access.status == "ready" and self.state["connected"]:
+            return self.ttl
+        return min(self.ttl, self.negative_ttl)
+
+    def get_many(self, document_ids: Iterable[int], load: Loader) -> Dict[int, DocumentAccess]:
+        """Access info for every id, reading only uncached ones with one `load` call."""
+        now = time.monotonic()
+        found: Dict[int, DocumentAccess] = {}
+        missing = []
+        with self._lock:
+            for document_id in dict.fromkeys(document_ids):
+                entry = self._entries.get(document_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(document_id)
+                    found[document_id] = entry[1]
+                else:
+                    missing.append(document_id)
+            self._hits += len(found)
+            self._misses += len(missing)
+            versions = {document_id: self._version(document_id) for document_id in missing}
+        if not missing:
+            return found
+
+        rows = load(missing)
+        with self._lock:
+            now = time.monotonic()
+            for document_id in missing:
+                user_id, status = rows.get(document_id, (None, None))
+                access = DocumentAccess(user_id, status, versions[document_id])
+                found[document_id] = access
+                # An event arrived while we were reading: what we read may be stale
+                if self.ttl <= 0 or self._version(document_id) != versions[document_id]:
+                    continue
+                self._entries[document_id] = (now + self._ttl_for(access), access)
+                self._entries.move_to_end(document_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return found
+
+    def get(self, document_id: int, load: Loader) -> DocumentAccess:
+        return self.get_many([document_id], load)[document_id]
+
+    def invalidate(self, document_id: int):
+        with self._lock:
+            self._entries.pop(document_id, None)
+            self._clock += 1
+            self._versions[document_id] = self._clock
+            self._versions.move_to_end(document_id)
+            while len(self._versions) > self.maxsize:
+                _, forgotten = self._versions.popitem(last=False)
+                self._floor = max(self._floor, forgotten)
+            self.state["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                **self.state,
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+    # -- invalidation listener ------------------------------------------
+
+    def start(self):
+        if self.ttl > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="document-cache", daemon=True)
+            self._thread.start()
+
+    def _connect(self) -> KafkaConsumer:
+        wait = 2
+        while True:
+            try:
+                consumer = KafkaConsumer(
+                    *STATUS_TOPICS,
+                    bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                    group_id=None,  # every replica reads every event
+                    auto_offset_reset="latest",
+                    value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+                )
+                self.state.update(connected=True, last_error=None)
+                return consumer
+            except NoBrokersAvailable as e:
+                self.state.update(connected=False, last_error=str(e))
+                print(f"Kafka not ready, document cache listener retrying in {wait}s")
+                time.sleep(wait)
+                wait = min(wait * 2, 30)
+
+    def _run(self):
+        consumer = self._connect()
+        while True:
+            try:
+                records = consumer.poll(timeout_ms=1000)
+                for batch in records.values():
+                    for message in batch:
+                        document_id = message.value.get("document_id")
+                        if document_id:
+                            self.invalidate(document_id)
+            except Exception as e:
+                self.state["last_error"] = str(e)
+                print(f"Document cache listener error: {e}")
+                time.sleep(1)
+
+
+document_cache = DocumentCache(
+    DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL_SECONDS, DOCUMENT_CACHE_NEGATIVE_TTL_SECONDS
+)
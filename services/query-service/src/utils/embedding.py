@@ -1,18 +1,82 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-import os
+import threading
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from .batching import ENCODE_BATCHING, MicroBatcher
+from .embedding_cache import QueryEmbeddingCache, normalize_question
+from .encoder import EMBEDDING_ENGINE, EMBEDDING_MODEL, load_encoder
+from .vector_store import create_vector_store
+
+# The model and vector store are created on first use (or by warm_up()),
+# not at import time, so the service starts accepting traffic immediately
+_model = None
+_store = None
+_lock = threading.Lock()
+
+
+def get_model():
+    """Embedding engine chosen by EMBEDDING_ENGINE (torch, onnx or onnx-int8)."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = load_encoder()
+    return _model
+
+
+def get_store():
+    """Vector store chosen by VECTOR_STORE (chroma or segment)."""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = create_vector_store()
+    return _store
+
+
+def warm_up():
+    """Load the model and open the vector store ahead of the first query."""
+    get_store()
+    encode_questions(["warm-up"])
+
+
+def loaded_components() -> dict:
+    return {"embedding_model": _model is not None, "vector_store": _store is not None}
 
-# Use absolute path for Docker, relative for local dev
-if os.getenv("DOCKER_ENV"):
-    CHROMA_PATH = "/app/chroma_db"
-else:
-    CHROMA_PATH = "../../chroma_db"
-    
-client = chromadb.PersistentClient(path=CHROMA_PATH)
 
 def get_collection(document_id: int):
-    collection_name = f"doc_{document_id}"
-    return client.get_collection(name=collection_name)
\ No newline at end of file
+    return get_store().get_collection(document_id)
+
+
+def encode_questions(questions: list[str]):
+    """Encode several questions in one forward pass (unit-length vectors)."""
+    return get_model().encode(questions, normalize_embeddings=True)
+
+
+# Questions from concurrent requests are grouped into a single forward pass
+question_batcher = MicroBatcher(encode_questions)
+
+
+# Repeated questions skip the model entirely
+question_cache = QueryEmbeddingCache(namespace=f"{EMBEDDING_MODEL}-{EMBEDDING_ENGINE}")
+
+
+def _encode_uncached(question: str):
+    if ENCODE_BATCHING:
+        return question_batcher.submit(question)
+    return encode_questions([question])[0]
+
+
+def encode_question(question: str) -> list[float]:
+    """Encode one question, using the cache and sharing the forward pass with concurrent requests."""
+    return question_cache.get_or_compute(question, _encode_uncached).tolist()
+
+
+def encode_question_batch(questions: list[str]) -> list[list[float]]:
+    """Encode many questions at once: cached ones are reused, the rest share one forward pass."""
+    vectors = [question_cache.get(q) for q in questions]
+    missing = sorted({normalize_question(q) for q, v in zip(questions, vectors) if v is None})
+    if missing:
+        encoded = dict(zip(missing, encode_questions(missing)))
+        for i, q in enumerate(questions):
+            if vectors[i] is None:
+                vectors[i] = question_cache.put(q, encoded[normalize_question(q)])
+    return [v.tolist() for v in vectors]
@@ -0,0 +1,265 @@
+"""
+Query Embedding Cache
+
+Users often ask the same question again: the frontend resubmits, and the same
+checklist question is asked against many documents. Encoding it again costs
+15–30 ms of CPU every time, so we remember recent question embeddings.
+
+How it works:
+1. The question is normalized (Unicode NFC, lower case, single spaces) so
+   "Notice  period?" and "notice period?" share one entry. NFC matters for
+   Hindi, where the same text can be typed with different code points.
+2. An in-memory LRU keeps the most recent vectors as compact float32 arrays.
+3. An optional on-disk tier (SQLite file) is shared by all workers/replicas
+   that mount the same directory, so a question encoded once is reused.
+   Above QUERY_CACHE_DISK_MAX_ENTRIES the least recently used questions are
+   evicted, 5% at a time. A hit refreshes the last-used time only when it
+   is older than QUERY_CACHE_TOUCH_SECONDS, so repeated hits stay read-only.
+   A locked or broken file counts as a miss.
+
+Configuration (environment variables):
+- QUERY_CACHE_SIZE:             Max entries kept in memory (default: 10000, 0 disables)
+- QUERY_CACHE_DIR:              Directory for the shared on-disk tier (default: off)
+- QUERY_CACHE_DISK_MAX_ENTRIES: Max entries kept on disk (default: 200000,
+                                ~350 MB at 384 dimensions)
+- QUERY_CACHE_TOUCH_SECONDS:    How stale a disk entry's last-used time may get
+                                before a hit refreshes it (default: 3600)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", "")
+QUERY_CACHE_DISK_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_DISK_MAX_ENTRIES", "200000"))
+QUERY_CACHE_TOUCH_SECONDS = float(os.getenv("QUERY_CACHE_TOUCH_SECONDS", "3600"))
+
+
+def normalize_question(text: str) -> str:
+    """Normalize a question so trivially different spellings share a cache key."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.casefold().split())
+
+
+class _DiskTier:
+    """Tiny SQLite key → float32 blob store shared between processes, LRU-bounded."""
+
+    def __init__(
+        self,
+        directory: str,
+        namespace: str,
+        max_entries: int = QUERY_CACHE_DISK_MAX_ENTRIES,
+        touch_seconds: float = QUERY_CACHE_TOUCH_SECONDS,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"query_embeddings_{namespace}.sqlite3")
+        self.max_entries = max_entries
+        self.touch_seconds = touch_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Connections must not cross a fork either (serve.py): workers open their own
+        os.register_at_fork(after_in_child=self._forget_connections)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, used_at REAL NOT NULL DEFAULT 0)"
+        )
+        # Files written before eviction existed have no last-used time
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+        if "used_at" not in columns:
+            conn.execute("ALTER TABLE embeddings ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_used_at ON embeddings (used_at)")
+        conn.commit()
+        # Entries this process knows of; other processes add too, so eviction recounts
+        self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT vector, used_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Query embedding disk cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        # Eviction only needs a rough order: skip the write (and its lock)
+        # while the last-used time is recent enough
+        now = time.time()
+        if now - row[1] >= self.touch_seconds:
+            try:
+                conn.execute("UPDATE embeddings SET used_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            except sqlite3.Error as e:
+                # The vector is still good; the next hit refreshes it
+                conn.rollback()
+                print(f"Query embedding disk cache touch failed: {e}")
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray):
+        conn = self._conn()
+        cursor = conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+            (key, vector.tobytes(), time.time()),
+        )
+        conn.commit()
+        with self._lock:
+            self._count += cursor.rowcount
+            full = self._count > self.max_entries
+        if full:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        # Least recently used first; 5% below the limit so this runs rarely
+        target = int(self.max_entries * 0.95)
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > target:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN"
+                " (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)",
+                (count - target,),
+            )
+            conn.commit()
+            count = target
+        with self._lock:
+            self._count = count
+
+    def size(self) -> int:
+        with self._lock:
+            return self._count
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of question embeddings with an optional disk tier.
+
+    Args:
+        max_size: Maximum number of vectors kept in memory
+        cache_dir: Directory for the shared on-disk tier ("" = memory only)
+        namespace: Separates caches of different models on disk
+        disk_max_entries: Maximum number of vectors kept in the disk tier
+
+    Example:
+        >>> cache = QueryEmbeddingCache(max_size=1000)
+        >>> vec = cache.get_or_compute("What is the rent?", encode_fn)
+    """
+
+    def __init__(
+        self,
+        max_size: int = QUERY_CACHE_SIZE,
+        cache_dir: str = QUERY_CACHE_DIR,
+        namespace: str = "all-MiniLM-L6-v2",
+        disk_max_entries: int = QUERY_CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[_DiskTier] = None
+        if cache_dir and max_size > 0:
+            try:
+                self._disk = _DiskTier(cache_dir, namespace, disk_max_entries)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Query embedding disk cache disabled: {e}")
+
+        # Hit-rate metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(normalized: str) -> str:
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, question: str) -> Optional[np.ndarray]:
+        """Return the cached vector for a question, or None."""
+        if self.max_size <= 0:
+            return None
+        key = self._key(normalize_question(question))
+
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, question: str, vector) -> np.ndarray:
+        """Store a vector for a question (as float32) and return it."""
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.max_size <= 0:
+            return vector
+        key = self._key(normalize_question(question))
+        self._remember(key, vector)
+        if self._disk is not None:
+            try:
+                self._disk.put(key, vector)
+            except sqlite3.Error as e:
+                print(f"Query embedding disk cache write failed: {e}")
+        return vector
+
+    def get_or_compute(self, question: str, encode_fn: Callable[[str], object]) -> np.ndarray:
+        """
+        Return the cached vector, or encode the normalized question and cache it.
+
+        The normalized text is encoded (not the raw text) so every spelling
+        that maps to the same key gets exactly the same vector.
+        """
+        vector = self.get(question)
+        if vector is None:
+            vector = self.put(question, encode_fn(normalize_question(question)))
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "disk_tier": self._disk.path if self._disk else None,
+            "disk_size": self._disk.size() if self._disk else 0,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,146 @@
+"""
+Job Worker - Answers Async Query Jobs
+
+The response service accepts questions as jobs (POST /query there returns a
+job id at once) and publishes them to the `query_requested` topic. Every
+query-service replica runs this worker: it consumes jobs, answers them with
+the same code path as the synchronous /query endpoint, and publishes the
+result to `query_completed`, where the response service stores it and
+pushes it to waiting clients.
+
+Jobs are answered QUERY_JOB_CONCURRENCY at a time; offsets are committed
+after the results of a whole poll batch are published, so a crash replays
+unanswered jobs, and a batch whose results could not be published is read
+again. A job that waited longer than QUERY_JOB_MAX_AGE_SECONDS is
+not answered (its client has given up or resubmitted); an error result is
+published instead.
+
+Example event:
+    {"job_id": "9f1c...", "user_id": 7, "document_id": 42,
+     "question": "What is the notice period?", "submitted_at": "2024-05-01T10:00:00"}
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+
+from .tracing import span
+
+QUERY_JOB_WORKER = os.getenv("QUERY_JOB_WORKER", "true").lower() == "true"
+QUERY_JOBS_TOPIC = os.getenv("QUERY_JOBS_TOPIC", "query_requested")
+QUERY_RESULTS_TOPIC = os.getenv("QUERY_RESULTS_TOPIC", "query_completed")
+QUERY_JOB_CONCURRENCY = int(os.getenv("QUERY_JOB_CONCURRENCY", "4"))
+QUERY_JOB_MAX_AGE_SECONDS = float(os.getenv("QUERY_JOB_MAX_AGE_SECONDS", "300"))
+
+# Reported by GET /stats
+job_worker_state = {
+    "enabled": QUERY_JOB_WORKER,
+    "connected": False,
+    "last_error": None,
+    "answered": 0,
+    "failed": 0,
+}
+
+_thread: Optional[threading.Thread] = None
+
+
+def _age_seconds(event: dict) -> float:
+    try:
+        return (datetime.utcnow() - datetime.fromisoformat(event["submitted_at"])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _answer(handle_job: Callable[[dict], dict], event: dict) -> dict:
+    job_id = event.get("job_id")
+    result = {"job_id": job_id, "completed_at": None}
+    try:
+        if not job_id or not event.get("document_id") or not event.get("question"):
+            raise ValueError("Invalid job: missing job_id, document_id or question")
+        if _age_seconds(event) > QUERY_JOB_MAX_AGE_SECONDS:
+            raise TimeoutError("Job waited too long in the queue")
+        with span("query_job", job_id=job_id, document_id=event["document_id"]):
+            answer = handle_job(event)
+        result.update(status="done", answer=answer["answer"], sources=answer.get("sources", 0))
+        job_worker_state["answered"] += 1
+    except Exception as e:
+        # HTTPException (document deleted or no longer ready) carries its reason in .detail
+        result.update(status="error", error=str(getattr(e, "detail", None) or e))
+        job_worker_state["failed"] += 1
+    result["completed_at"] = datetime.utcnow().isoformat()
+    return result
+
+
+def _connect():
+    from kafka import KafkaConsumer, KafkaProducer
+    from kafka.errors import NoBrokersAvailable
+
+    bootstrap_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+    wait = 2
+    while True:
+        try:
+            consumer = KafkaConsumer(
+                QUERY_JOBS_TOPIC,
+                bootstrap_servers=bootstrap_servers,
+                group_id="query-job-workers",
+                enable_auto_commit=False,
+                auto_offset_reset="earliest",
+                value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+                max_poll_records=QUERY_JOB_CONCURRENCY * 2,
+            )
+            producer = KafkaProducer(
+                bootstrap_servers=bootstrap_servers,
+                key_serializer=lambda k: str(k).encode("utf-8"),
+                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                acks="all",
+                linger_ms=5,
+            )
+            job_worker_state.update(connected=True, last_error=None)
+            return consumer, producer
+        except NoBrokersAvailable as e:
+            job_worker_state.update(connected=False, last_error=str(e))
+            print(f"Kafka not ready, job worker retrying in {wait}s")
+            time.sleep(wait)
+            wait = min(wait * 2, 30)
+
+
+def _run(handle_job: Callable[[dict], dict]):
+    consumer, producer = _connect()
+    pool = ThreadPoolExecutor(max_workers=QUERY_JOB_CONCURRENCY, thread_name_prefix="query-job")
+    while True:
+        records = {}
+        try:
+            records = consumer.poll(timeout_ms=1000)
+            messages = [m for batch in records.values() for m in batch]
+            if not messages:
+                continue
+            results = pool.map(lambda m: _answer(handle_job, m.value), messages)
+            for result in results:
+                producer.send(QUERY_RESULTS_TOPIC, key=result["job_id"], value=result)
+            producer.flush()
+            consumer.commit()
+        except Exception as e:
+            # The consumer's position is already past this batch: rewind so the
+            # next poll returns its jobs again instead of committing over them
+            for tp, batch in records.items():
+                consumer.seek(tp, batch[0].offset)
+            job_worker_state["last_error"] = str(e)
+            print(f"Query job worker error: {e}")
+            time.sleep(1)
+
+
+def start_job_worker(handle_job: Callable[[dict], dict]):
+    """
+    Start the worker thread (no-op if QUERY_JOB_WORKER=false or already running).
+
+    `handle_job(event)` answers one job and returns the /query response body.
+    """
+    global _thread
+    if not QUERY_JOB_WORKER or _thread is not None:
+        return
+    _thread = threading.Thread(target=_run, args=(handle_job,), name="query-job-worker", daemon=True)
+    _thread.start()
@@ -1,10 +1,10 @@
-"""  
+"""
 LLM (Large Language Model) - Answer Generation
 
 This module implements the "Generation" part of RAG:
 1. Takes relevant document chunks (from retrieval)
 2. Combines them with the user's question
-3. Sends to AI (Ollama) with proper prompting
+3. Sends to AI (through a pluggable LLM backend) with proper prompting
 4. Returns a natural language answer
 
 The AI is instructed to:
@@ -12,18 +12,64 @@ The AI is instructed to:
 - Support both Hindi and English
 - Always include legal disclaimer
 - Be factual and avoid giving legal advice
+
+Available backends (selected with the LLM_BACKEND environment variable):
+- "ollama": Local Ollama server (default)
+- "openai": Any OpenAI-compatible endpoint (llama.cpp server, vLLM, OpenAI)
+- "mock":   Deterministic fake model for load tests without a real LLM
+
+Every backend reports Prometheus metrics: requests in flight (what the
+query pods' autoscaler scales on), request latency, prompt and completion
+token counts, and tokens/sec for prompt evaluation and generation (exact
+timings from Ollama; measured around the call for the other backends).
+
+Note: this file is kept identical in the embedding and query services
+(the embedding service uses it for background clause summaries).
 """
 
-import ollama
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from typing import Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .rate_limit import record_usage
+from .tracing import span
 
 # ==============================================================================
-# OLLAMA CONFIGURATION
+# LLM CONFIGURATION
 # ==============================================================================
+# Which backend to use: "ollama", "openai" or "mock"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama").lower()
+
+# Model name sent to the backend (Ollama tag or OpenAI-compatible model id)
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.2:3b")  # 3B model (faster, smaller)
+
 # Ollama is a local LLM server (alternative to OpenAI)
 # It runs models like Llama 3.2 on your own machine
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-ollama_client = ollama.Client(host=OLLAMA_HOST)
+
+# OpenAI-compatible servers (llama.cpp server, vLLM) expose /v1 endpoints
+# Local servers usually ignore the API key, but the client requires one
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://localhost:8080/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "not-needed")
+
+# Generation settings shared by all backends
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))  # Low = focused, factual
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "8192"))  # Context window (≈ 6000 words)
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))  # Max answer length
+
+# How many requests a batch may send to the backend at the same time
+# Servers with continuous batching (vLLM, llama.cpp --parallel) benefit from more
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "4"))
+
+# Mock backend: simulated delay per generated token (milliseconds)
+MOCK_LLM_TOKEN_LATENCY_MS = float(os.getenv("MOCK_LLM_TOKEN_LATENCY_MS", "0"))
 
 # ==============================================================================
 # SYSTEM PROMPT - Defines AI's behavior and personality
@@ -41,29 +87,363 @@ Always end your answer with this disclaimer (in both languages):
 This is not legal advice. Please consult a qualified lawyer."
 """
 
+DISCLAIMER = "यह कानूनी सलाह नहीं है। कृपया किसी योग्य वकील से परामर्श लें।\nThis is not legal advice. Please consult a qualified lawyer."
+
+NO_CONTEXT_ANSWER = "No relevant information found in the document."
+
+
+# ==============================================================================
+# METRICS
+# ==============================================================================
+
+LLM_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight",
+    "LLM requests waiting for an answer",
+    multiprocess_mode="livesum",
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds",
+    "Time for one LLM request",
+    ["backend"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens processed by the LLM",
+    ["backend", "kind"],  # kind: prompt | completion
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second",
+    "LLM speed per request: prompt evaluation and generation",
+    ["backend", "phase"],  # phase: prompt_eval | eval
+    buckets=(1, 2.5, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+
+
+def _record_usage(backend: str, prompt_tokens: int, completion_tokens: int,
+                  prompt_seconds: float = 0.0, eval_seconds: float = 0.0):
+    LLM_TOKENS.labels(backend=backend, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(backend=backend, kind="completion").inc(completion_tokens)
+    # Counted against the daily token quota of the user being served
+    record_usage("llm_tokens", prompt_tokens + completion_tokens)
+    if prompt_tokens and prompt_seconds > 0:
+        LLM_TOKENS_PER_SECOND.labels(backend=backend, phase="prompt_eval").observe(prompt_tokens / prompt_seconds)
+    if completion_tokens and eval_seconds > 0:
+        LLM_TOKENS_PER_SECOND.labels(backend=backend, phase="eval").observe(completion_tokens / eval_seconds)
+
+
+@contextmanager
+def _in_flight(requests: int = 1):
+    LLM_IN_FLIGHT.inc(requests)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LLM_IN_FLIGHT.dec(requests)
+        LLM_REQUEST_SECONDS.labels(backend=LLM_BACKEND).observe(time.perf_counter() - start)
+
+
+# ==============================================================================
+# LLM BACKENDS
+# ==============================================================================
+
+class LLMBackend:
+    """
+    Common interface for all LLM backends.
+
+    Every backend takes chat messages ({'role': ..., 'content': ...}) and
+    returns the assistant's reply. Subclasses implement `chat` and `stream`;
+    `chat_batch` sends several conversations concurrently so servers with
+    continuous batching can process them together.
+    """
+
+    name = "base"
+
+    def chat(self, messages: List[dict]) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def chat_batch(self, batch: List[List[dict]]) -> List[str]:
+        if len(batch) <= 1:
+            return [self.chat(messages) for messages in batch]
+
+        workers = max(1, min(LLM_BATCH_CONCURRENCY, len(batch)))
+        # Each call runs in a copy of the caller's context so token usage is
+        # still recorded for the request being served
+        contexts = [copy_context() for _ in batch]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda ctx, messages: ctx.run(self.chat, messages), contexts, batch))
+
+
+class OllamaBackend(LLMBackend):
+    """Local Ollama server (https://ollama.com)."""
+
+    name = "ollama"
+
+    def __init__(self, host: str = OLLAMA_HOST, model: str = LLM_MODEL):
+        import ollama
+
+        self.client = ollama.Client(host=host)
+        self.model = model
+        self.options = {
+            'temperature': LLM_TEMPERATURE,
+            'num_ctx': LLM_NUM_CTX,
+        }
+
+    def _record(self, response):
+        # Ollama reports token counts and timings (in nanoseconds) with the
+        # final response
+        _record_usage(
+            self.name,
+            response.get('prompt_eval_count') or 0,
+            response.get('eval_count') or 0,
+            (response.get('prompt_eval_duration') or 0) / 1e9,
+            (response.get('eval_duration') or 0) / 1e9,
+        )
+
+    def chat(self, messages: List[dict]) -> str:
+        response = self.client.chat(
+            model=self.model,
+            messages=messages,
+            options=self.options,
+        )
+        self._record(response)
+        return response['message']['content']
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        for part in self.client.chat(
+            model=self.model,
+            messages=messages,
+            options=self.options,
+            stream=True,
+        ):
+            if part.get('done'):
+                self._record(part)
+            token = part['message']['content']
+            if token:
+                yield token
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Any server speaking the OpenAI Chat Completions API.
+
+    Works with llama.cpp server, vLLM (CPU or GPU) and OpenAI itself.
+    Servers with continuous batching answer concurrent requests together,
+    which gives much higher throughput than one-at-a-time generation.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: str = OPENAI_BASE_URL,
+        api_key: str = OPENAI_API_KEY,
+        model: str = LLM_MODEL,
+    ):
+        from openai import OpenAI
+
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.model = model
+
+    def chat(self, messages: List[dict]) -> str:
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=LLM_MAX_TOKENS,
+        )
+        if response.usage:
+            # No separate prompt timing: the whole call counts as generation
+            _record_usage(self.name, response.usage.prompt_tokens, response.usage.completion_tokens,
+                          eval_seconds=time.perf_counter() - start)
+        return response.choices[0].message.content or ""
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=LLM_MAX_TOKENS,
+            stream=True,
+            # The server sends the token counts in a last chunk without choices
+            stream_options={"include_usage": True},
+        )
+        start = time.perf_counter()
+        usage, streamed = None, 0
+        for chunk in response:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                streamed += 1
+                yield token
+        if usage:
+            _record_usage(self.name, usage.prompt_tokens, usage.completion_tokens,
+                          eval_seconds=time.perf_counter() - start)
+        else:
+            # Server without usage reporting: one chunk is about one token,
+            # the prompt is estimated in words
+            prompt_tokens = sum(len(m['content'].split()) for m in messages)
+            _record_usage(self.name, prompt_tokens, streamed, eval_seconds=time.perf_counter() - start)
+
+
+class MockBackend(LLMBackend):
+    """
+    Deterministic fake LLM for load testing without a model.
+
+    The same messages always produce the same answer. The answer quotes the
+    start of the retrieved context so the full RAG path is exercised, and
+    an optional per-token delay simulates generation speed.
+    """
+
+    name = "mock"
+
+    def __init__(self, token_latency_ms: float = MOCK_LLM_TOKEN_LATENCY_MS):
+        self.token_latency = token_latency_ms / 1000.0
+
+    def _tokens(self, messages: List[dict]) -> List[str]:
+        user_prompt = messages[-1]['content'] if messages else ""
+        digest = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()[:12]
+        excerpt = " ".join(user_prompt.split()[:40])
+        answer = f"[mock-{digest}] Based on the document: {excerpt}\n\n{DISCLAIMER}"
+        # Keep whitespace attached so joined tokens rebuild the exact answer
+        return [word + " " for word in answer.split(" ")]
+
+    def chat(self, messages: List[dict]) -> str:
+        return "".join(self.stream(messages)).rstrip(" ")
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        tokens = self._tokens(messages)
+        start = time.perf_counter()
+        for token in tokens:
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
+        prompt_tokens = sum(len(m['content'].split()) for m in messages)
+        _record_usage(self.name, prompt_tokens, len(tokens), eval_seconds=time.perf_counter() - start)
+
+
+_BACKENDS = {
+    "ollama": OllamaBackend,
+    "openai": OpenAICompatibleBackend,
+    "mock": MockBackend,
+}
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend() -> LLMBackend:
+    """
+    Return the configured LLM backend (created once, on first use).
+
+    Raises:
+        ValueError: If LLM_BACKEND names an unknown backend
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_cls = _BACKENDS.get(LLM_BACKEND)
+                if backend_cls is None:
+                    raise ValueError(
+                        f"Unknown LLM_BACKEND '{LLM_BACKEND}' "
+                        f"(expected one of: {', '.join(_BACKENDS)})"
+                    )
+                _backend = backend_cls()
+    return _backend
+
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    """Replace the active backend (used by benchmarks and load tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ==============================================================================
+# PROMPT HELPERS
+# ==============================================================================
+
+def build_messages(question: str, context_chunks: List[str]) -> List[dict]:
+    """
+    Build the chat messages sent to the LLM for one question.
+
+    Args:
+        question: The user's question (in Hindi or English)
+        context_chunks: Relevant text chunks from the document
+
+    Returns:
+        list[dict]: System message followed by the user prompt
+    """
+    # Combine all chunks into a single context string
+    # Separate chunks with double newlines for readability
+    context = "\n\n".join(context_chunks)
+
+    # Create the user prompt with question and context
+    # This gives AI both the question and relevant document sections
+    user_prompt = f"""
+Question: {question}
+
+Relevant sections from the document:
+{context}
+
+Explain in simple language. Be step-by-step if needed.
+"""
+
+    return [
+        # System message defines the AI's role and behavior
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        # User message contains the actual question and context
+        {'role': 'user', 'content': user_prompt},
+    ]
+
+
+def _with_disclaimer(answer: str) -> str:
+    # Safety check - ensure disclaimer is present
+    # If AI forgot to include it, we add it
+    answer = answer.strip()
+    if DISCLAIMER not in answer:
+        answer += f"\n\n{DISCLAIMER}"
+    return answer
+
+
+def _error_message(e: Exception) -> str:
+    return f"Error generating answer: {str(e)} (Is the '{LLM_BACKEND}' LLM backend running? For Ollama, try 'ollama serve' in another terminal)"
+
+
+# ==============================================================================
+# ANSWER GENERATION
+# ==============================================================================
 
 def generate_answer(question: str, context_chunks: list[str]) -> str:
     """
     Generate a natural language answer using AI.
-    
+
     This function implements RAG (Retrieval-Augmented Generation) by:
     1. Taking relevant chunks retrieved from the document
     2. Combining them into a context
     3. Sending to AI with the user's question
     4. Returning the AI-generated answer
-    
+
     The AI is given:
     - System prompt (defines its role and behavior)
     - User's question
     - Relevant document chunks as context
-    
+
     Args:
         question: The user's question (in Hindi or English)
         context_chunks: Relevant text chunks from the document (from RAG retrieval)
-    
+
     Returns:
         str: AI-generated answer with legal disclaimer
-    
+
     Example:
         >>> chunks = ["Section 1: Tenant must pay rent...", "Section 2: Landlord must..."]
         >>> answer = generate_answer("What are my responsibilities?", chunks)
@@ -71,52 +451,74 @@ def generate_answer(question: str, context_chunks: list[str]) -> str:
     """
     # Handle edge case: no relevant chunks found
     if not context_chunks:
-        return "No relevant information found in the document."
+        return NO_CONTEXT_ANSWER
 
-    # Step 1: Combine all chunks into a single context string
-    # Separate chunks with double newlines for readability
-    context = "\n\n".join(context_chunks)
-    
-    # Step 2: Create the user prompt with question and context
-    # This gives AI both the question and relevant document sections
-    user_prompt = f"""
-Question: {question}
+    try:
+        with span("llm", backend=LLM_BACKEND, model=LLM_MODEL), _in_flight():
+            answer = get_llm_backend().chat(build_messages(question, context_chunks))
+        return _with_disclaimer(answer)
+    except Exception as e:
+        return _error_message(e)
 
-Relevant sections from the document:
-{context}
 
-Explain in simple language. Be step-by-step if needed.
-"""
+def generate_answers(items: List[tuple]) -> List[str]:
+    """
+    Generate answers for several (question, context_chunks) pairs at once.
+
+    Requests are sent to the backend concurrently (up to
+    LLM_BATCH_CONCURRENCY at a time) so batching servers can combine them.
+
+    Args:
+        items: List of (question, context_chunks) tuples
+
+    Returns:
+        list[str]: One answer per item, in the same order
+    """
+    answers: List[Optional[str]] = [None] * len(items)
+    pending = []
+    for i, (question, context_chunks) in enumerate(items):
+        if not context_chunks:
+            answers[i] = NO_CONTEXT_ANSWER
+        else:
+            pending.append((i, build_messages(question, context_chunks)))
+
+    if pending:
+        try:
+            with span("llm", backend=LLM_BACKEND, model=LLM_MODEL, requests=len(pending)), \
+                    _in_flight(len(pending)):
+                replies = get_llm_backend().chat_batch([messages for _, messages in pending])
+            for (i, _), reply in zip(pending, replies):
+                answers[i] = _with_disclaimer(reply)
+        except Exception as e:
+            for i, _ in pending:
+                answers[i] = _error_message(e)
+
+    return answers
 
-    # Step 3: Call Ollama AI to generate answer
+
+def stream_answer(question: str, context_chunks: List[str]) -> Iterator[str]:
+    """
+    Generate an answer token by token (for streaming HTTP responses).
+
+    The disclaimer is appended at the end if the model did not include it,
+    exactly like `generate_answer`.
+
+    Yields:
+        str: Pieces of the answer as they are generated
+    """
+    if not context_chunks:
+        yield NO_CONTEXT_ANSWER
+        return
+
+    parts = []
     try:
-        response = ollama_client.chat(
-            model='llama3.2:3b',  # 3 billion parameter model (faster, smaller)
-                                   # Can use 'llama3.2' for larger 7B model if needed
-            messages=[
-                # System message defines the AI's role and behavior
-                {'role': 'system', 'content': SYSTEM_PROMPT},
-                # User message contains the actual question and context
-                {'role': 'user', 'content': user_prompt}
-            ],
-            options={
-                'temperature': 0.3,  # Low temperature = more focused, less creative
-                                      # Good for factual legal answers
-                'num_ctx': 8192,  # Context window size (how much text AI can see)
-                                  # 8192 tokens ≈ 6000 words
-            }
-        )
-        
-        # Extract the answer text from response
-        answer = response['message']['content'].strip()
-        
-        # Step 4: Safety check - ensure disclaimer is present
-        # If AI forgot to include it, we add it
-        disclaimer = "यह कानूनी सलाह नहीं है। कृपया किसी योग्य वकील से परामर्श लें।\nThis is not legal advice. Please consult a qualified lawyer."
-        if disclaimer not in answer:
-            answer += f"\n\n{disclaimer}"
-        
-        return answer
-    
+        with _in_flight():
+            for token in get_llm_backend().stream(build_messages(question, context_chunks)):
+                parts.append(token)
+                yield token
     except Exception as e:
-        return f"Error generating answer: {str(e)} (Is Ollama running? Try 'ollama serve' in another terminal)"
\ No newline at end of file
+        yield _error_message(e)
+        return
+
+    if DISCLAIMER not in "".join(parts):
+        yield f"\n\n{DISCLAIMER}"
@@ -10,8 +10,25 @@ This module implements the "Retrieval" part of RAG:
 This ensures AI answers are grounded in actual document content.
 """
 
-from typing import List
-from .embedding import model, get_collection
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from prometheus_client import Histogram
+
+from .embedding import encode_question, encode_question_batch, get_collection
+from .tracing import span
+from .vector_store import is_not_found
+
+# How many documents are searched at the same time in a batch query
+VECTOR_SEARCH_CONCURRENCY = int(os.getenv("VECTOR_SEARCH_CONCURRENCY", "8"))
+
+VECTOR_SEARCH_SECONDS = Histogram(
+    "vector_search_seconds",
+    "Vector store (Chroma) query latency",
+    ["kind"],  # single: one question, batch: several questions in one call
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
 
 
 def retrieve_relevant_chunks(
@@ -54,20 +71,28 @@ def retrieve_relevant_chunks(
     
     # Step 2: Convert the question to an embedding
     # We use the same model (SentenceTransformer) that was used to embed document chunks
-    # normalize_embeddings=True ensures embeddings are unit vectors for cosine similarity
-    question_embedding = model.encode(
-        [question], 
-        normalize_embeddings=True
-    ).tolist()[0]
+    # Embeddings are unit vectors for cosine similarity; concurrent questions
+    # are encoded together in one batch (see utils/batching.py)
+    with span("encode"):
+        question_embedding = encode_question(question)
     
     # Step 3: Search ChromaDB for similar chunks
     # ChromaDB uses cosine similarity to find chunks with similar embeddings
     # The more similar the embedding, the more relevant the chunk
-    results = collection.query(
-        query_embeddings=[question_embedding],  # Our question as a vector
-        n_results=top_k,  # Return top 5 most similar chunks
-        include=["documents", "metadatas", "distances"]  # What data to return
-    )
+    with span("vector_search", document_id=document_id, top_k=top_k) as s:
+        try:
+            results = collection.query(
+                query_embeddings=[question_embedding],  # Our question as a vector
+                n_results=top_k,  # Return top 5 most similar chunks
+                include=["documents", "metadatas", "distances"]  # What data to return
+            )
+        except Exception as e:
+            # Deleted since the handle was looked up (document deletion)
+            if not is_not_found(e):
+                raise
+            print(f"Collection gone for doc {document_id}: {e}")
+            return []
+    VECTOR_SEARCH_SECONDS.labels(kind="single").observe(s.duration_ms / 1000)
     
     # Step 4: Extract the actual text chunks from results
     chunks = results["documents"][0]
@@ -76,4 +101,66 @@ def retrieve_relevant_chunks(
     # For example: only return chunks with distance < 0.5
     # But for now we return all top_k chunks
     
-    return chunks
\ No newline at end of file
+    return chunks
+
+
+def retrieve_for_questions(
+    document_id: int,
+    question_embeddings: List[List[float]],
+    top_k: int = 5
+) -> List[List[str]]:
+    """
+    Find relevant chunks in one document for several questions at once.
+
+    All question vectors are sent to the vector store in a single query.
+
+    Returns:
+        List[List[str]]: One list of chunks per question (empty lists if the
+        document has no collection)
+    """
+    try:
+        collection = get_collection(document_id)
+    except Exception as e:
+        print(f"Collection not found for doc {document_id}: {e}")
+        return [[] for _ in question_embeddings]
+
+    with span("vector_search", document_id=document_id, questions=len(question_embeddings)) as s:
+        try:
+            results = collection.query(
+                query_embeddings=question_embeddings,
+                n_results=top_k,
+                include=["documents"]
+            )
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+            print(f"Collection gone for doc {document_id}: {e}")
+            return [[] for _ in question_embeddings]
+    VECTOR_SEARCH_SECONDS.labels(kind="batch").observe(s.duration_ms / 1000)
+    return results["documents"]
+
+
+def retrieve_batch(
+    document_ids: List[int],
+    questions: List[str],
+    top_k: int = 5
+) -> Dict[int, List[List[str]]]:
+    """
+    Retrieve chunks for every (document, question) pair.
+
+    1. All questions are encoded once (cached questions skip the model)
+    2. Each document is searched with all question vectors in one call
+    3. Documents are searched in parallel
+
+    Returns:
+        dict: document_id -> one list of chunks per question (same order)
+    """
+    with span("encode", questions=len(questions)):
+        question_embeddings = encode_question_batch(questions)
+    workers = max(1, min(VECTOR_SEARCH_CONCURRENCY, len(document_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            lambda doc_id: retrieve_for_questions(doc_id, question_embeddings, top_k),
+            document_ids,
+        )
+        return dict(zip(document_ids, results))
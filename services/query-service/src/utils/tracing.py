@@ -0,0 +1,302 @@
+"""
+Tracing - OpenTelemetry-Style Spans
+
+A small, dependency-free tracer that follows the OpenTelemetry data model:
+
+- A span is one timed stage (auth, encode, vector search, LLM call, ...)
+  with a trace id, a span id, its parent's span id and attributes.
+- Context travels between services in the W3C `traceparent` format: as an
+  HTTP header, and as a Kafka message header from the upload service to the
+  embedding consumer, so one trace covers "upload" to "embeddings ready".
+- Finished spans are exported by a background thread (TRACE_EXPORTER):
+    none     spans are only used for Server-Timing (default)
+    console  one line per span on stdout
+    file     OTLP/JSON lines appended to TRACE_FILE; the OpenTelemetry
+             Collector's `otlpjsonfile` receiver (or any JSON tool) reads them
+
+`TracingMiddleware` starts a root span per HTTP request and adds a
+`Server-Timing` header listing the time spent in each stage, visible in the
+browser's network panel:
+
+    Server-Timing: auth;dur=2.1, db.ownership;dur=1.4, encode;dur=11.0,
+                   vector_search;dur=3.2, llm;dur=812.5, total;dur=833.0
+
+Example:
+    >>> with span("vector_search", document_id=42):
+    ...     results = collection.query(...)
+
+Note: this file is kept identical in the upload, embedding and query services.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "nyayaai")
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")  # none | console | file
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[dict] = None, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: Exception):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+# Per-request list of (span name, duration) used for the Server-Timing header
+_timings: contextvars.ContextVar = contextvars.ContextVar("server_timings", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent, or None if invalid."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, start_ns: Optional[int] = None, **attributes):
+    """
+    Time a block as a child of the current span (or of `parent`, a traceparent
+    received from another service). `start_ns` back-dates the span, e.g. to
+    when a document was uploaded.
+    """
+    remote = parse_traceparent(parent)
+    current = _current.get()
+    if remote:
+        trace_id, parent_id, sampled = remote
+    elif current:
+        trace_id, parent_id, sampled = current.trace_id, current.span_id, current.sampled
+    else:
+        trace_id, parent_id = "%032x" % random.getrandbits(128), None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+
+    s = Span(name, trace_id, parent_id, sampled, attributes, start_ns)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.record_error(e)
+        raise
+    finally:
+        s.end()
+        _current.reset(token)
+        _finish(s)
+
+
+def traced(name: str):
+    """Decorator form of `span`; keeps the signature, so FastAPI dependencies can be wrapped."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        wrapper.__signature__ = inspect.signature(func)
+        return wrapper
+    return decorator
+
+
+def current_traceparent() -> Optional[str]:
+    current = _current.get()
+    return current.traceparent if current else None
+
+
+def kafka_headers(traceparent: Optional[str] = None) -> List[Tuple[str, bytes]]:
+    """Kafka message headers carrying the current (or given) trace context."""
+    value = traceparent or current_traceparent()
+    return [("traceparent", value.encode("ascii"))] if value else []
+
+
+def traceparent_from_headers(headers) -> Optional[str]:
+    """traceparent from Kafka message headers (a list of (key, bytes)), if present."""
+    for key, value in headers or []:
+        if key == "traceparent" and value:
+            return value.decode("ascii", errors="ignore")
+    return None
+
+
+# ==============================================================================
+# EXPORT
+# ==============================================================================
+
+class _Exporter:
+    """Writes finished spans from a background thread, so requests never wait on I/O."""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, s: Span):
+        if self.kind == "none":
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            pass  # Drop spans rather than slow the service down
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(0.5)  # gather what arrives meanwhile
+            while not self._queue.empty() and len(batch) < 1000:
+                batch.append(self._queue.get_nowait())
+            try:
+                if self.kind == "console":
+                    for s in batch:
+                        status = f" error={s.error}" if s.error else ""
+                        print(f"[trace {s.trace_id[:8]}] {SERVICE_NAME} {s.name} {s.duration_ms:.1f}ms "
+                              f"{s.attributes}{status}")
+                elif self.kind == "file":
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(_otlp_json(batch)) + "\n")
+            except Exception as e:
+                print(f"Trace export failed: {e}")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_json(spans: List[Span]) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for a batch of spans."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "nyayaai.tracing"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                    }
+                    for s in spans
+                ],
+            }],
+        }]
+    }
+
+
+_exporter = _Exporter(TRACE_EXPORTER, TRACE_FILE)
+
+
+def _finish(s: Span):
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((s.name, s.duration_ms))
+    if s.sampled:
+        _exporter.export(s)
+
+
+# ==============================================================================
+# HTTP
+# ==============================================================================
+
+class TracingMiddleware:
+    """
+    ASGI middleware: one root span per request (continuing an incoming
+    `traceparent` header) and a `Server-Timing` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"traceparent", b"").decode("ascii", errors="ignore")
+        timings: List[Tuple[str, float]] = []
+        timings_token = _timings.set(timings)
+
+        with span(f"{scope['method']} {scope['path']}", parent=incoming or None) as root:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                    route = scope.get("route")
+                    if route is not None:
+                        root.name = f"{scope['method']} {route.path}"  # low-cardinality name
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", server_timing(timings, root.duration_ms).encode("ascii")),
+                        (b"traceparent", root.traceparent.encode("ascii")),
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                _timings.reset(timings_token)
+
+
+def server_timing(timings: List[Tuple[str, float]], total_ms: float) -> str:
+    """Server-Timing header value: total time per stage name, plus the request total."""
+    per_stage: Dict[str, float] = {}
+    for name, duration in timings:
+        per_stage[name] = per_stage.get(name, 0.0) + duration
+    parts = [f"{name};dur={duration:.1f}" for name, duration in per_stage.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
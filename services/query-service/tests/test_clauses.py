@@ -0,0 +1,12 @@
+from utils.clauses import in_summary_language
+
+
+def test_english_questions_can_use_the_summary_directly():
+    assert in_summary_language("What is the notice period?")
+    assert in_summary_language("Is there a lock-in period of 11 months? (Rs. 45,000)")
+
+
+def test_other_languages_are_answered_by_the_llm():
+    assert not in_summary_language("इस अनुबंध की नोटिस अवधि क्या है?")
+    # Mixed questions too: the answer has to follow the question's language
+    assert not in_summary_language("notice period क्या है?")
@@ -0,0 +1,87 @@
+import sqlite3
+
+import numpy as np
+
+from utils.embedding_cache import QueryEmbeddingCache, _DiskTier
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    tier = _DiskTier(str(tmp_path), "test", max_entries=20, touch_seconds=0)
+    for i in range(20):
+        tier.put(f"q{i}", np.full(4, i, dtype=np.float32))
+    assert tier.get("q0") is not None  # q0 is now the most recently used
+
+    tier.put("q20", np.zeros(4, dtype=np.float32))
+
+    assert tier.size() == 19
+    assert tier.get("q0") is not None
+    assert tier.get("q1") is None
+    assert tier.get("q20") is not None
+
+
+def test_disk_tier_upgrades_files_without_last_used_time(tmp_path):
+    path = tmp_path / "query_embeddings_test.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    conn.execute("INSERT INTO embeddings VALUES (?, ?)", ("old", np.ones(4, dtype=np.float32).tobytes()))
+    conn.commit()
+    conn.close()
+
+    tier = _DiskTier(str(tmp_path), "test", max_entries=10)
+
+    assert tier.size() == 1
+    assert tier.get("old").tolist() == [1, 1, 1, 1]
+
+
+def test_disk_hits_fill_memory_tier(tmp_path):
+    first = QueryEmbeddingCache(max_size=10, cache_dir=str(tmp_path), namespace="test")
+    first.put("Notice period?", np.arange(4))
+    second = QueryEmbeddingCache(max_size=10, cache_dir=str(tmp_path), namespace="test")
+
+    assert second.get("notice  PERIOD?").tolist() == [0, 1, 2, 3]
+    assert second.stats()["disk_hits"] == 1
+    assert second.stats()["disk_size"] == 1
+
+
+def test_recent_disk_hits_do_not_write(tmp_path):
+    tier = _DiskTier(str(tmp_path), "test", max_entries=10, touch_seconds=3600)
+    tier.put("q", np.ones(4, dtype=np.float32))
+    conn = tier._conn()
+    conn.execute("UPDATE embeddings SET used_at = 1")
+    conn.commit()
+
+    assert tier.get("q") is not None  # stale: refreshed
+    used_at = conn.execute("SELECT used_at FROM embeddings").fetchone()[0]
+    assert used_at > 1
+
+    changes = conn.total_changes
+    assert tier.get("q") is not None  # recent: read only
+    assert conn.total_changes == changes
+
+
+def test_locked_disk_tier_degrades_to_miss(tmp_path):
+    cache = QueryEmbeddingCache(max_size=10, cache_dir=str(tmp_path), namespace="test")
+    cache.put("Notice period?", np.arange(4))
+    cache.clear()
+    cache._disk.touch_seconds = 0
+    cache._disk._conn().execute("PRAGMA busy_timeout = 0")
+
+    # Another process holds the write lock: the hit is still served
+    other = sqlite3.connect(cache._disk.path)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        assert cache.get("notice period?").tolist() == [0, 1, 2, 3]
+    finally:
+        other.rollback()
+        other.close()
+
+    # An unreadable file is a miss, not an error
+    cache.clear()
+    cache._disk._local.conn = _LockedConnection()
+    assert cache.get("notice period?") is None
+    assert cache.stats()["misses"] == 1
+
+
+class _LockedConnection:
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+from kafka import TopicPartition
+
+from utils import job_worker
+
+TP = TopicPartition("query_requested", 0)
+
+
+class Stop(BaseException):
+    """Ends the worker's endless loop."""
+
+
+class FakeConsumer:
+    """Hands out a partition's records from its position, like Kafka does."""
+
+    def __init__(self, events, polls):
+        self.records = [SimpleNamespace(offset=i, value=event) for i, event in enumerate(events)]
+        self.position = 0
+        self.committed = 0
+        self.polls = polls
+
+    def poll(self, timeout_ms=0):
+        if self.polls == 0:
+            raise Stop()
+        self.polls -= 1
+        batch = self.records[self.position:]
+        self.position = len(self.records)
+        return {TP: batch} if batch else {}
+
+    def seek(self, tp, offset):
+        assert tp == TP
+        self.position = offset
+
+    def commit(self):
+        self.committed = self.position
+
+
+class FlakyProducer:
+    def __init__(self, failures):
+        self.failures = failures
+        self.pending, self.sent = [], []
+
+    def send(self, topic, key, value):
+        self.pending.append(value["job_id"])
+
+    def flush(self):
+        if self.failures:
+            self.failures -= 1
+            self.pending.clear()
+            raise RuntimeError("broker unavailable")
+        self.sent.extend(self.pending)
+        self.pending.clear()
+
+
+def test_jobs_of_a_failed_flush_are_answered_again(monkeypatch):
+    events = [{"job_id": job_id, "document_id": 1, "question": "Rent?"} for job_id in ("a", "b")]
+    consumer, producer = FakeConsumer(events, polls=2), FlakyProducer(failures=1)
+    monkeypatch.setattr(job_worker, "_connect", lambda: (consumer, producer))
+    monkeypatch.setattr(job_worker.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(Stop):
+        job_worker._run(lambda event: {"answer": event["job_id"]})
+
+    assert producer.sent == ["a", "b"]
+    assert consumer.committed == 2
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from utils import llm
+
+
+def _chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _FakeCompletions:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.kwargs = None
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        return iter(self.chunks)
+
+
+def _backend(chunks):
+    backend = llm.OpenAICompatibleBackend.__new__(llm.OpenAICompatibleBackend)
+    backend.model = "test"
+    backend.client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions(chunks)))
+    return backend
+
+
+def _recorded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm, "_record_usage", lambda backend, prompt, completion, **kw: calls.append((prompt, completion)))
+    return calls
+
+
+def test_openai_stream_records_reported_usage(monkeypatch):
+    calls = _recorded(monkeypatch)
+    usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+    backend = _backend([_chunk("a"), _chunk("b"), _chunk("c"), _chunk(usage=usage)])
+
+    assert list(backend.stream([{"role": "user", "content": "hi"}])) == ["a", "b", "c"]
+    assert backend.client.chat.completions.kwargs["stream_options"] == {"include_usage": True}
+    assert calls == [(12, 3)]
+
+
+def test_openai_stream_estimates_usage_without_report(monkeypatch):
+    calls = _recorded(monkeypatch)
+    backend = _backend([_chunk("a"), _chunk(""), _chunk("b")])
+
+    assert list(backend.stream([{"role": "user", "content": "two words"}])) == ["a", "b"]
+    assert calls == [(2, 2)]
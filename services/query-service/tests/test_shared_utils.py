@@ -0,0 +1,24 @@
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+SERVICES = Path(__file__).resolve().parents[2]
+
+
+def _shared_copies():
+    """Copies of every utils module whose docstring says it is kept identical, by file name."""
+    copies = defaultdict(list)
+    for path in sorted(SERVICES.glob("*/src/utils/*.py")):
+        if "this file is kept identical" in path.read_text(encoding="utf-8"):
+            copies[path.name].append(path)
+    return copies
+
+
+@pytest.mark.parametrize("name", sorted(_shared_copies()))
+def test_shared_utils_are_byte_identical(name):
+    paths = _shared_copies()[name]
+    assert len(paths) > 1, f"{name} says it is shared but has one copy"
+    reference = paths[0].read_bytes()
+    differing = [str(p.relative_to(SERVICES)) for p in paths[1:] if p.read_bytes() != reference]
+    assert not differing, f"{name} differs from {paths[0].relative_to(SERVICES)} in: {differing}"
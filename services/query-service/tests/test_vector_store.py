@@ -0,0 +1,139 @@
+import pytest
+
+from utils import rag, vector_store
+from utils.vector_store import (
+    ChromaHttpStore,
+    ChromaStore,
+    SegmentStore,
+    compact_chroma_directory,
+    is_not_found,
+    with_retry,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_RETRY_BACKOFF", 0)
+
+
+def _failing(errors, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_with_retry_retries_unreachable_chroma_server():
+    fn, calls = _failing([ValueError("Could not connect to a Chroma server. Are you sure it is running?")])
+    assert with_retry(fn, retries=2) == "ok"
+    assert len(calls) == 2
+
+
+def test_with_retry_does_not_retry_other_errors():
+    fn, calls = _failing([ValueError("Collection doc_1 does not exist.")])
+    with pytest.raises(ValueError):
+        with_retry(fn, retries=2)
+    assert len(calls) == 1
+
+
+def test_not_found_errors():
+    from chromadb.errors import NotFoundError
+
+    assert is_not_found(NotFoundError("Collection [doc_1] does not exists"))
+    assert is_not_found(ValueError("Collection doc_1 does not exist."))
+    assert not is_not_found(ValueError("Could not connect to a Chroma server."))
+
+
+class _DeletedCollection:
+    def query(self, **kwargs):
+        from chromadb.errors import NotFoundError
+
+        raise NotFoundError("Collection [doc_7] does not exists")
+
+
+class _Client:
+    def __init__(self):
+        self.lookups = 0
+
+    def get_collection(self, name):
+        self.lookups += 1
+        return _DeletedCollection()
+
+
+def _http_store():
+    store = ChromaHttpStore.__new__(ChromaHttpStore)
+    store.client = _Client()
+    store._collections = {}
+    store._lock = vector_store.threading.Lock()
+    return store
+
+
+def test_http_store_drops_handles_of_deleted_collections():
+    store = _http_store()
+    collection = store.get_collection(7)
+    assert store.get_collection(7) is collection  # cached
+
+    with pytest.raises(Exception):
+        collection.query(query_embeddings=[[0.0]], n_results=1)
+
+    store.get_collection(7)
+    assert store.client.lookups == 2
+
+
+def test_rag_returns_no_chunks_for_deleted_collection(monkeypatch):
+    store = _http_store()
+    monkeypatch.setattr(rag, "get_collection", store.get_collection)
+    monkeypatch.setattr(rag, "encode_question", lambda q: [0.0])
+    monkeypatch.setattr(rag, "encode_question_batch", lambda qs: [[0.0] for _ in qs])
+
+    assert rag.retrieve_relevant_chunks(7, "notice period?") == []
+    assert rag.retrieve_batch([7], ["a", "b"]) == {7: [[], []]}
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda path: SegmentStore(str(path)),
+    lambda path: ChromaStore(str(path)),
+])
+def test_delete_collection_reports_whether_anything_was_removed(tmp_path, make_store):
+    store = make_store(tmp_path)
+    store.get_or_create_collection(5).add(
+        ids=["5_0"], documents=["rent"], embeddings=[[1.0, 0.0]], metadatas=[{"document_id": 5}],
+    )
+
+    assert store.delete_collection(5) is True
+    assert store.delete_collection(5) is False  # already gone
+    assert store.delete_collection(6) is False  # never embedded
+    assert store.document_ids() == []
+
+
+def test_chroma_files_are_only_compacted_offline(tmp_path):
+    store = ChromaStore(str(tmp_path))
+    store.get_or_create_collection(5).add(ids=["5_0"], documents=["rent"], embeddings=[[1.0, 0.0]])
+    store.delete_collection(5)
+    files = sorted(p.name for p in tmp_path.iterdir())
+
+    # Live clients have these files open: the store itself leaves them alone
+    assert store.compact() == {"vacuumed": False}
+    assert sorted(p.name for p in tmp_path.iterdir()) == files
+
+    report = compact_chroma_directory(str(tmp_path))
+    assert report["orphaned_dirs_removed"] == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["chroma.sqlite3"]
+
+
+def test_re_added_chunk_returns_its_newest_copy(tmp_path):
+    collection = SegmentStore(str(tmp_path)).get_or_create_collection(9)
+    # First version: chunk_0 points exactly at the query
+    collection.add(ids=["chunk_0", "chunk_1"], documents=["old rent", "deposit"],
+                   embeddings=[[1.0, 0.0], [0.0, 1.0]])
+    # Re-added with new text and a vector that scores lower than the stale one
+    collection.add(ids=["chunk_0"], documents=["new rent"], embeddings=[[0.6, 0.8]])
+
+    result = collection.query(query_embeddings=[[1.0, 0.0]], n_results=2)
+    assert result["ids"] == [["chunk_0", "chunk_1"]]
+    assert result["documents"] == [["new rent", "deposit"]]
+    assert result["distances"][0][0] == pytest.approx(0.4)
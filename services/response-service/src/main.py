@@ -0,0 +1,288 @@
+"""
+NyayaAI Response Service
+
+Asynchronous front door for questions:
+- POST /query returns a job id at once instead of holding the connection
+  open while the LLM generates the answer
+- Query-service workers consume the jobs from Kafka (`query_requested`)
+  and publish answers to `query_completed`
+- Results are stored with a TTL; clients fetch them (GET /jobs/{id}) or
+  get them pushed as soon as they are ready (GET /jobs/{id}/events, SSE)
+- A retried submission with the same Idempotency-Key attaches to the
+  in-flight job instead of asking the question twice
+
+Technology: FastAPI, SQLAlchemy, Kafka, Server-Sent Events
+"""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+# ==============================================================================
+# PATH SETUP
+# ==============================================================================
+# Ensure this service's source directory is first in the Python import path
+SRC_DIR = Path(__file__).resolve().parent
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+# ==============================================================================
+# PREVENT MODEL CONFLICTS BETWEEN SERVICES
+# ==============================================================================
+import sys as _sys
+_existing_models = _sys.modules.get("models")
+if _existing_models and getattr(_existing_models, "__file__", "").replace("\\", "/") != str(SRC_DIR / "models.py").replace("\\", "/"):
+    del _sys.modules["models"]
+
+# ==============================================================================
+# IMPORT LOCAL MODULES (RESPONSE-SERVICE SPECIFIC)
+# ==============================================================================
+from database import SessionLocal, engine, get_db  # Database connection
+from models import Document, QueryJob  # Database models
+
+# Auth handling (Docker vs local)
+if os.getenv("DOCKER_ENV"):
+    from auth_dependency import User, get_current_user  # type: ignore
+else:
+    try:
+        BASE_DIR = Path(__file__).resolve().parents[3]
+    except IndexError:
+        BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+
+    from shared.auth import User, get_current_user  # type: ignore
+
+from utils.job_queue import publish_job, results
+from utils.job_store import IdempotencyConflict, create_or_attach, get_job, job_body
+from utils.metrics import gauge_callback, instrument
+from utils.rate_limit import RouteLimit, rate_limit, user_key
+
+# How often an open /events stream re-reads the job (results stored by another
+# replica) and sends a heartbeat comment (keeps proxies from closing it)
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "2"))
+JOB_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("JOB_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# ------------------------------------------------------------------
+# APP INIT
+# ------------------------------------------------------------------
+# Only the jobs table belongs to this service; documents is the upload service's
+QueryJob.__table__.create(bind=engine, checkfirst=True)
+
+app = FastAPI(title="NyayaAI Response Service")
+
+# Submitting a job costs as much as a synchronous query (same "llm" bucket and
+# daily token quota); polling and streaming results are cheap reads
+rate_limit(app, {"POST /query": RouteLimit("llm", 10, quota="llm_tokens")})
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+    ],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Prometheus metrics at GET /metrics
+instrument(app, engine)
+gauge_callback(
+    "query_job_results",
+    "Worker results handled by the result listener since startup",
+    lambda: {"stored": results.state["stored"], "purged": results.state["purged"]},
+    ["outcome"],
+)
+gauge_callback(
+    "query_job_streams_waiting",
+    "Open /jobs/{id}/events streams waiting for a result",
+    lambda: results.stats()["streams_waiting"],
+)
+
+
+@app.on_event("startup")
+def start_result_listener():
+    # Store worker results and purge expired ones in the background
+    results.start()
+
+
+class QueryRequest(BaseModel):
+    document_id: int
+    question: str
+
+
+# ------------------------------------------------------------------
+# HELPERS
+# ------------------------------------------------------------------
+def verify_document_ownership(document_id: int, user_id: int, db: Session):
+    doc = (
+        db.query(Document)
+        .filter(Document.id == document_id, Document.user_id == user_id)
+        .first()
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found or access denied")
+    if doc.status != "ready":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Document not ready (status: {doc.status})"
+        )
+    return doc
+
+
+def job_links(job: QueryJob) -> dict:
+    return {
+        "result_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# ------------------------------------------------------------------
+# ROUTES
+# ------------------------------------------------------------------
+@app.post("/query", status_code=status.HTTP_202_ACCEPTED)
+def submit_question(
+    request: QueryRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    # 1️⃣ Fail fast on documents the workers could not answer from
+    verify_document_ownership(request.document_id, current_user.id, db)
+
+    # 2️⃣ New job, or the one a previous attempt with this key created
+    try:
+        job, publish = create_or_attach(
+            db, current_user.id, request.document_id, request.question, idempotency_key
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # 3️⃣ Hand it to the query workers
+    if publish:
+        # The worker charges the tokens it uses to this user's quota
+        publish_job(job, quota_key=user_key(current_user.email))
+
+    # A retry of a job that is already answered gets the answer directly
+    if job.status == "done":
+        return JSONResponse(job_body(job), status_code=200)
+    return {"job_id": job.id, "status": job.status, **job_links(job)}
+
+
+@app.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {**job_body(job), **job_links(job)}
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events: one `status` event, then a `result` event (done or
+    error) as soon as the answer is stored, then the stream closes.
+    """
+    user_id = current_user.id
+
+    def load() -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            job = get_job(db, job_id, user_id)
+            return job_body(job) if job is not None else None
+        finally:
+            db.close()
+
+    body = await run_in_threadpool(load)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def stream():
+        ready = results.subscribe(job_id)
+        try:
+            current = body
+            yield sse("status", {"job_id": job_id, "status": current["status"]})
+            idle = 0.0
+            while current is not None and current["status"] == "queued":
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=JOB_EVENTS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    idle += JOB_EVENTS_POLL_SECONDS
+                    if idle >= JOB_EVENTS_HEARTBEAT_SECONDS:
+                        idle = 0.0
+                        yield ": heartbeat\n\n"
+                ready.clear()
+                current = await run_in_threadpool(load)
+            if current is None:
+                yield sse("result", {"job_id": job_id, "status": "error", "error": "Job expired"})
+            else:
+                yield sse("result", current)
+        finally:
+            results.unsubscribe(job_id, ready)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/health")
+def health():
+    return {"status": "healthy"}
+
+
+@app.get("/live")
+def live():
+    # Liveness: the process is up
+    return {"status": "alive", "service": "response-service"}
+
+
+@app.get("/ready")
+def ready():
+    # Readiness: database reachable and the result listener connected to Kafka
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        database_ok = True
+    except Exception:
+        database_ok = False
+    components = {"database": database_ok, "kafka": results.state["connected"]}
+    is_ready = all(components.values())
+    body = {
+        "status": "ready" if is_ready else "starting",
+        "service": "response-service",
+        "loaded": components,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/stats")
+def stats():
+    return {"result_listener": results.stats()}
+
+
+@app.get("/")
+def root():
+    return {"service": "NyayaAI Response Service", "status": "running"}
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+
+class QueryJob(Base):
+    """
+    A question answered asynchronously.
+
+    Created by POST /query, answered by a query-service worker, and kept
+    until expires_at (JOB_RESULT_TTL_SECONDS after completion) so the client
+    can fetch the result.
+    """
+    __tablename__ = "query_jobs"
+    __table_args__ = (
+        # A retried submission with the same key attaches to the same job
+        UniqueConstraint("user_id", "idempotency_key", name="uq_query_jobs_idempotency"),
+    )
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, nullable=False, index=True)
+    document_id = Column(Integer, nullable=False)
+    question = Column(Text, nullable=False)
+    idempotency_key = Column(String(255), nullable=True)
+
+    status = Column(String, default="queued")  # queued → done | error
+    answer = Column(Text, nullable=True)
+    sources = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class Document(Base):
+    # Read-only view of the upload service's documents table (ownership checks)
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    status = Column(String)
@@ -0,0 +1,187 @@
+"""
+Job Queue - Kafka Between the Response Service and the Query Workers
+
+    POST /query ──► query_requested ──► query-service workers
+                                              │ (utils/job_worker.py there)
+    GET /jobs/{id}[/events] ◄── query_jobs ◄── query_completed
+
+- `publish_job` sends a job to `query_requested` without waiting for the
+  broker; if the send fails, the job is marked failed so a retry with the
+  same Idempotency-Key re-queues it.
+- `results` consumes `query_completed` (consumer group "response-service",
+  so each result is stored once however many replicas run), stores the
+  result and wakes the /jobs/{id}/events streams waiting in this process.
+  A batch that could not be stored (database down) is read again.
+  Streams on other replicas notice the stored result on their next poll
+  (JOB_EVENTS_POLL_SECONDS).
+- The same thread deletes expired results every JOB_PURGE_INTERVAL_SECONDS.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from kafka import KafkaConsumer, KafkaProducer
+from kafka.errors import NoBrokersAvailable
+
+from database import SessionLocal
+from models import QueryJob
+from utils.job_store import purge_expired, store_result
+
+QUERY_JOBS_TOPIC = os.getenv("QUERY_JOBS_TOPIC", "query_requested")
+QUERY_RESULTS_TOPIC = os.getenv("QUERY_RESULTS_TOPIC", "query_completed")
+JOB_PURGE_INTERVAL_SECONDS = int(os.getenv("JOB_PURGE_INTERVAL_SECONDS", "60"))
+
+bootstrap_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+
+_producer: Optional[KafkaProducer] = None
+_producer_lock = threading.Lock()
+
+
+def _get_producer() -> KafkaProducer:
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = KafkaProducer(
+                    bootstrap_servers=bootstrap_servers,
+                    key_serializer=lambda k: str(k).encode("utf-8"),
+                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    acks="all",
+                    retries=3,
+                    linger_ms=5,
+                )
+    return _producer
+
+
+def _on_send_error(job_id: str, exc: Exception):
+    print(f"Could not publish query job {job_id}: {exc}")
+    db = SessionLocal()
+    try:
+        store_result(db, {"job_id": job_id, "status": "error", "error": "Could not queue the job, please retry"})
+    finally:
+        db.close()
+    results.notify(job_id)
+
+
+def publish_job(job: QueryJob, quota_key: Optional[str] = None):
+    """Queue a job for the query workers (returns before the broker acknowledges)."""
+    event = {
+        "job_id": job.id,
+        "user_id": job.user_id,
+        "document_id": job.document_id,
+        "question": job.question,
+        "submitted_at": job.created_at.isoformat(),
+        "quota_key": quota_key,  # see utils/rate_limit.py
+    }
+    try:
+        future = _get_producer().send(QUERY_JOBS_TOPIC, key=job.id, value=event)
+    except Exception as e:
+        _on_send_error(job.id, e)
+        return
+    future.add_errback(_on_send_error, job.id)
+
+
+class ResultListener:
+    """Consumes `query_completed` and wakes the streams waiting for each job."""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = {"connected": False, "stored": 0, "purged": 0, "last_error": None}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="query-results", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, job_id: str) -> asyncio.Event:
+        """Event set when the job's result arrives at this replica (call from async code)."""
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, job_id: str, event: asyncio.Event):
+        with self._lock:
+            waiters = self._waiters.get(job_id, set())
+            waiters.difference_update({w for w in waiters if w[1] is event})
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    def notify(self, job_id: str):
+        with self._lock:
+            waiters = list(self._waiters.get(job_id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _connect(self) -> KafkaConsumer:
+        wait = 2
+        while True:
+            try:
+                consumer = KafkaConsumer(
+                    QUERY_RESULTS_TOPIC,
+                    bootstrap_servers=bootstrap_servers,
+                    group_id="response-service",
+                    enable_auto_commit=False,
+                    auto_offset_reset="earliest",
+                    value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+                )
+                self.state.update(connected=True, last_error=None)
+                return consumer
+            except NoBrokersAvailable as e:
+                self.state.update(connected=False, last_error=str(e))
+                print(f"Kafka not ready, result listener retrying in {wait}s")
+                time.sleep(wait)
+                wait = min(wait * 2, 30)
+
+    def _purge(self):
+        db = SessionLocal()
+        try:
+            self.state["purged"] += purge_expired(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        consumer = self._connect()
+        next_purge = time.monotonic()
+        while True:
+            records = {}
+            try:
+                if time.monotonic() >= next_purge:
+                    self._purge()
+                    next_purge = time.monotonic() + JOB_PURGE_INTERVAL_SECONDS
+
+                records = consumer.poll(timeout_ms=1000)
+                messages = [m for batch in records.values() for m in batch]
+                if not messages:
+                    continue
+                db = SessionLocal()
+                try:
+                    stored = [m.value.get("job_id") for m in messages if store_result(db, m.value)]
+                finally:
+                    db.close()
+                consumer.commit()
+                self.state["stored"] += len(stored)
+                for job_id in stored:
+                    self.notify(job_id)
+            except Exception as e:
+                # The consumer's position is already past this batch: rewind so
+                # the next poll returns its results again instead of committing over them
+                for tp, batch in records.items():
+                    consumer.seek(tp, batch[0].offset)
+                self.state["last_error"] = str(e)
+                print(f"Result listener error: {e}")
+                time.sleep(1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waiting = sum(len(w) for w in self._waiters.values())
+        return {**self.state, "streams_waiting": waiting}
+
+
+results = ResultListener()
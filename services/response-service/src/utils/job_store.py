@@ -0,0 +1,174 @@
+"""
+Job Store - Query Jobs and Their Results
+
+Jobs live in the `query_jobs` table so every response-service replica sees
+the same state and a result survives a restart:
+
+    queued ──(worker answers)──► done
+       └──(worker fails / JOB_TIMEOUT_SECONDS pass)──► error
+
+Results are kept for JOB_RESULT_TTL_SECONDS after completion, then deleted
+by `purge_expired` (run periodically by utils/job_queue.py).
+
+Idempotency: a submission carrying an Idempotency-Key that the user has
+already used attaches to that job instead of creating a new one. Only a job
+that failed or timed out is re-queued; one that is queued or done is
+returned as it is, so a client retrying after a network error never has the
+question answered twice.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import QueryJob
+
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different question."""
+
+
+def _is_stale(job: QueryJob, now: datetime) -> bool:
+    return job.status == "queued" and job.created_at < now - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+
+
+def _requeue(job: QueryJob, now: datetime):
+    job.status = "queued"
+    job.answer = job.sources = job.error = None
+    job.created_at = now
+    job.completed_at = job.expires_at = None
+
+
+def create_or_attach(
+    db: Session,
+    user_id: int,
+    document_id: int,
+    question: str,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[QueryJob, bool]:
+    """
+    Create a job, or return the one already submitted with this key.
+
+    Returns (job, publish): `publish` is True when the job has to be sent
+    to the workers (new, or a failed/timed-out job being retried).
+    """
+    now = datetime.utcnow()
+    if idempotency_key:
+        job = (
+            db.query(QueryJob)
+            .filter(QueryJob.user_id == user_id, QueryJob.idempotency_key == idempotency_key)
+            .first()
+        )
+        if job is not None:
+            return _attach(db, job, document_id, question, now)
+
+    job = QueryJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        document_id=document_id,
+        question=question,
+        idempotency_key=idempotency_key,
+        created_at=now,
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Two retries of the same request raced; the other one created the job
+        db.rollback()
+        job = (
+            db.query(QueryJob)
+            .filter(QueryJob.user_id == user_id, QueryJob.idempotency_key == idempotency_key)
+            .one()
+        )
+        return _attach(db, job, document_id, question, now)
+    return job, True
+
+
+def _attach(db: Session, job: QueryJob, document_id: int, question: str, now: datetime) -> Tuple[QueryJob, bool]:
+    if job.document_id != document_id or job.question != question:
+        raise IdempotencyConflict("Idempotency-Key was already used for a different question")
+    if job.status == "error" or _is_stale(job, now):
+        _requeue(job, now)
+        db.commit()
+        return job, True
+    return job, False
+
+
+def get_job(db: Session, job_id: str, user_id: int) -> Optional[QueryJob]:
+    """The user's job, or None. A job no worker answered in time is reported as failed."""
+    now = datetime.utcnow()
+    job = db.query(QueryJob).filter(QueryJob.id == job_id, QueryJob.user_id == user_id).first()
+    if job is None or (job.expires_at is not None and job.expires_at < now):
+        return None
+    if _is_stale(job, now):
+        store_result(db, {"job_id": job.id, "status": "error", "error": "Timed out waiting for a worker"})
+        db.refresh(job)
+    return job
+
+
+def store_result(db: Session, result: dict) -> bool:
+    """
+    Save a worker's result (a `query_completed` event). Returns False if the
+    job is unknown or already has a result (duplicate delivery, late answer).
+    """
+    now = datetime.utcnow()
+    updated = (
+        db.query(QueryJob)
+        .filter(QueryJob.id == result.get("job_id"), QueryJob.status == "queued")
+        .update(
+            {
+                QueryJob.status: "done" if result.get("status") == "done" else "error",
+                QueryJob.answer: result.get("answer"),
+                QueryJob.sources: result.get("sources"),
+                QueryJob.error: result.get("error"),
+                QueryJob.completed_at: now,
+                QueryJob.expires_at: now + timedelta(seconds=JOB_RESULT_TTL_SECONDS),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated > 0
+
+
+def purge_expired(db: Session) -> int:
+    """Delete jobs whose result TTL has passed. Returns how many were deleted."""
+    now = datetime.utcnow()
+    abandoned = now - timedelta(seconds=JOB_TIMEOUT_SECONDS + JOB_RESULT_TTL_SECONDS)
+    deleted = (
+        db.query(QueryJob)
+        .filter(
+            (QueryJob.expires_at < now)
+            # Never answered and never fetched again
+            | ((QueryJob.status == "queued") & (QueryJob.created_at < abandoned))
+        )
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def job_body(job: QueryJob) -> dict:
+    body = {
+        "job_id": job.id,
+        "status": job.status,
+        "document_id": job.document_id,
+        "question": job.question,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+    }
+    if job.status == "done":
+        body.update(answer=job.answer, sources=job.sources)
+    elif job.status == "error":
+        body["error"] = job.error
+    if job.completed_at:
+        body["completed_at"] = job.completed_at.isoformat()
+        body["expires_at"] = job.expires_at.isoformat()
+    return body
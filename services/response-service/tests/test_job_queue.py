@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+from kafka import TopicPartition
+
+from utils import job_queue
+
+TP = TopicPartition("query_completed", 0)
+
+
+class Stop(BaseException):
+    """Ends the listener's endless loop."""
+
+
+class FakeConsumer:
+    """Hands out a partition's records from its position, like Kafka does."""
+
+    def __init__(self, results, polls):
+        self.records = [SimpleNamespace(offset=i, value=result) for i, result in enumerate(results)]
+        self.position = 0
+        self.committed = 0
+        self.polls = polls
+
+    def poll(self, timeout_ms=0):
+        if self.polls == 0:
+            raise Stop()
+        self.polls -= 1
+        batch = self.records[self.position:]
+        self.position = len(self.records)
+        return {TP: batch} if batch else {}
+
+    def seek(self, tp, offset):
+        assert tp == TP
+        self.position = offset
+
+    def commit(self):
+        self.committed = self.position
+
+
+def test_results_of_a_failed_store_are_redelivered(monkeypatch):
+    stored, failures = [], [RuntimeError("database unavailable")]
+
+    def store_result(db, result):
+        if failures:
+            raise failures.pop()
+        stored.append(result["job_id"])
+        return True
+
+    consumer = FakeConsumer([{"job_id": "a", "status": "done"}, {"job_id": "b", "status": "done"}], polls=2)
+    listener = job_queue.ResultListener()
+    monkeypatch.setattr(listener, "_connect", lambda: consumer)
+    monkeypatch.setattr(listener, "_purge", lambda: None)
+    monkeypatch.setattr(job_queue, "store_result", store_result)
+    monkeypatch.setattr(job_queue, "SessionLocal", lambda: SimpleNamespace(close=lambda: None))
+    monkeypatch.setattr(job_queue.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(Stop):
+        listener._run()
+
+    assert stored == ["a", "b"]
+    assert consumer.committed == 2
+    assert listener.state["stored"] == 2
@@ -0,0 +1,32 @@
+"""add document queue position
+
+Revision ID: 3f9c2a71b5d4
+Revises: de48e1b7ca88
+Create Date: 2026-10-19 10:12:04.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a71b5d4'
+down_revision: Union[str, Sequence[str], None] = 'de48e1b7ca88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('queue_lane', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('queue_partition', sa.Integer(), nullable=True))
+    op.add_column('documents', sa.Column('queue_offset', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'queue_offset')
+    op.drop_column('documents', 'queue_partition')
+    op.drop_column('documents', 'queue_lane')
@@ -0,0 +1,44 @@
+"""add clause_summaries table
+
+Revision ID: 5e7b2c9d4f18
+Revises: c42d7f9e1b03
+Create Date: 2026-10-20 10:12:04.518377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7b2c9d4f18'
+down_revision: Union[str, Sequence[str], None] = 'c42d7f9e1b03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Written by the embedding service's clause pipeline, read by the query service
+    op.create_table(
+        'clause_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('clause_type', sa.String(), nullable=False),
+        sa.Column('chunk_indices', sa.Text(), nullable=False),
+        sa.Column('chunk_texts', sa.Text(), nullable=True),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_clause_summaries_id'), 'clause_summaries', ['id'], unique=False)
+    op.create_index(op.f('ix_clause_summaries_document_id'), 'clause_summaries', ['document_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_clause_summaries_document_id'), table_name='clause_summaries')
+    op.drop_index(op.f('ix_clause_summaries_id'), table_name='clause_summaries')
+    op.drop_table('clause_summaries')
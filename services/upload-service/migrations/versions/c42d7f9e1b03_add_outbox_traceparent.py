@@ -0,0 +1,28 @@
+"""add outbox traceparent
+
+Revision ID: c42d7f9e1b03
+Revises: 8b1e4d0c6a27
+Create Date: 2026-10-19 17:05:36.671204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c42d7f9e1b03'
+down_revision: Union[str, Sequence[str], None] = '8b1e4d0c6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('outbox_events', sa.Column('traceparent', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('outbox_events', 'traceparent')
@@ -8,6 +8,8 @@ This service handles document uploads and management:
 - Publish events to Kafka for processing by Embedding Service
 - Track document processing status
 - Manage query history for each document
+- Delete documents (their vectors follow via a `document_deleted` event)
+  and garbage-collect orphaned files and database space
 
 Technology: FastAPI, SQLAlchemy, Kafka, File Processing
 """
@@ -17,10 +19,13 @@ import sys
 import uuid
 from datetime import datetime
 from pathlib import Path
+from typing import List
 
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, status
+from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 # ==============================================================================
 # PATH SETUP
@@ -60,8 +65,23 @@ else:
 
     from shared.auth import User, get_current_user  # type: ignore
 
+from utils.bulk_ingest import create_job, get_job, jobs, save_part, start_job
+from utils.cleanup import StorageGC, delete_documents
 from utils.extraction import extract_text
-from utils.kafka_producer import publish_document_uploaded
+from utils.kafka_producer import LANE_TOPICS, publisher
+from utils.metrics import gauge_callback, instrument
+from utils.outbox import add_document_event, relay
+from utils.rate_limit import RouteLimit, rate_limit, record_usage, text_pages, user_key
+from utils.queue_status import (
+    QueueFullError,
+    check_backpressure,
+    estimate_position,
+    queue_overview,
+)
+from utils.tracing import TracingMiddleware, span, traced
+
+# Time spent validating the token and loading the user shows up as "auth"
+get_current_user = traced("auth")(get_current_user)
 
 # ------------------------------------------------------------------
 # APP INIT
@@ -70,6 +90,18 @@ Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="NyayaAI Upload Service")
 
+# Spans per stage + Server-Timing header (see utils/tracing.py)
+app.add_middleware(TracingMiddleware)
+
+# Per-user token buckets; uploads also draw on the daily embedding page quota
+# (see utils/rate_limit.py)
+rate_limit(app, {
+    "POST /upload": RouteLimit("ingest", 10, quota="embedding_pages"),
+    "POST /upload/bulk": RouteLimit("ingest", 50, quota="embedding_pages"),
+    "DELETE /documents/{doc_id}": RouteLimit("ingest", 1),
+    "POST /documents/delete": RouteLimit("ingest", 10),
+})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -81,12 +113,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics at GET /metrics: route latency, DB pool and the
+# queues between an upload and Kafka
+instrument(app, engine)
+gauge_callback(
+    "upload_queue_depth",
+    "Upload events not yet acknowledged by Kafka, by stage",
+    lambda: {
+        "outbox_unpublished": relay.pending(),
+        "outbox_in_flight": relay.stats()["in_flight"],
+        "publisher_waiting": publisher.stats()["waiting"],
+    },
+    ["stage"],
+)
+gauge_callback(
+    "kafka_publisher_events",
+    "Events handled by the Kafka publisher since startup",
+    lambda: {k: v for k, v in publisher.stats().items() if k not in ("waiting", "connected")},
+    ["outcome"],
+)
+gauge_callback(
+    "bulk_jobs",
+    "Bulk upload jobs held in memory, by status",
+    lambda: {status: sum(1 for job in list(jobs.values()) if job.status == status)
+             for status in ("receiving", "queued", "unpacking", "processing", "done", "error")},
+    ["status"],
+)
+
+@app.on_event("startup")
+def start_publisher():
+    # Connect to Kafka in the background so the first upload does not wait for
+    # it, and start publishing outbox events (including any left from before)
+    publisher.start()
+    relay.start()
+    storage_gc.start()  # orphaned files and database space (utils/cleanup.py)
+
+
+@app.on_event("shutdown")
+def stop_publisher():
+    publisher.flush(timeout=10)
+
 # ------------------------------------------------------------------
 # UPLOAD DIRECTORY
 # ------------------------------------------------------------------
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Orphaned files and database space are reclaimed in the background
+storage_gc = StorageGC(UPLOAD_DIR)
+
+# Its last run is reported on /metrics only (internal network), never to users
+gauge_callback(
+    "upload_gc_last_run_timestamp_seconds",
+    "When the last storage GC run finished (0 until the first one)",
+    lambda: storage_gc.last_run_at or 0,
+)
+gauge_callback(
+    "upload_gc_orphaned_files_removed",
+    "Orphaned upload files removed by the last storage GC run",
+    lambda: (storage_gc.last_run or {}).get("orphaned_files", {}).get("removed", 0),
+)
+gauge_callback(
+    "upload_gc_database_bytes",
+    "Database size before and after the last storage GC VACUUM",
+    storage_gc.database_sizes,
+    ["when"],
+)
+
 # ------------------------------------------------------------------
 # HELPERS
 # ------------------------------------------------------------------
@@ -111,9 +204,26 @@ def verify_document_ownership(doc_id: int, user_id: int, db: Session):
 @app.post("/upload", status_code=status.HTTP_201_CREATED)
 async def upload_document(
     file: UploadFile = File(...),
+    priority: str = Query("interactive", description="interactive or bulk"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    if priority not in LANE_TOPICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid priority. Use one of: {', '.join(LANE_TOPICS)}",
+        )
+
+    # Refuse bulk imports early (before reading the file) while the bulk lane is backed up
+    try:
+        await run_in_threadpool(check_backpressure, priority)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
     allowed_types = [
         "application/pdf",
         "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
@@ -126,7 +236,8 @@ async def upload_document(
             detail="Invalid file type. Only PDF, DOCX, and TXT allowed.",
         )
 
-    content = await file.read()
+    with span("upload.read"):
+        content = await file.read()
 
     if len(content) > 20 * 1024 * 1024:
         raise HTTPException(
@@ -138,10 +249,13 @@ async def upload_document(
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
-    with open(file_path, "wb") as f:
-        f.write(content)
+    with span("upload.save_file", bytes=len(content)):
+        with open(file_path, "wb") as f:
+            f.write(content)
 
-    extracted_text = extract_text(file_path, file.filename)
+    with span("extract_text"):
+        extracted_text = extract_text(file_path, file.filename)
+    record_usage("embedding_pages", text_pages(extracted_text))
 
     document = Document(
         user_id=current_user.id,
@@ -151,27 +265,72 @@ async def upload_document(
         status="uploaded",
     )
 
-    db.add(document)
-    db.commit()
-    db.refresh(document)
+    with span("db.insert"):
+        db.add(document)
+        db.flush()  # assigns document.id
 
-    event = {
-        "document_id": document.id,
-        "user_id": current_user.id,
-        "filename": document.filename,
-        "extracted_text": extracted_text,
-        "timestamp": datetime.utcnow().isoformat(),
-    }
+        event = {
+            "document_id": document.id,
+            "user_id": current_user.id,
+            "filename": document.filename,
+            "extracted_text": extracted_text,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
 
-    publish_document_uploaded(event)
+        # The event is committed together with the document; the outbox relay
+        # publishes it in the background, so the request never waits for Kafka.
+        # It carries this request's trace context to the embedding service.
+        add_document_event(db, event, lane=priority)
+        db.commit()
+        db.refresh(document)
+    relay.wake()
 
     return {
         "document_id": document.id,
         "filename": document.filename,
         "status": "uploaded",
+        "priority": priority,
         "message": "Document uploaded and queued for processing",
     }
 
+# ------------------------------------------------------------------
+# BULK UPLOAD (MULTIPART BATCH OR ZIP)
+# ------------------------------------------------------------------
+@app.post("/upload/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def upload_bulk(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user),
+):
+    try:
+        await run_in_threadpool(check_backpressure, "bulk")
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    job = create_job(current_user.id, UPLOAD_DIR, quota_key=user_key(current_user.email))
+    for file in files:
+        # Copy in a worker thread so large parts do not block the event loop
+        await run_in_threadpool(save_part, job, file.file, file.filename)
+    start_job(job)
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "message": "Files received; extraction and queueing continue in the background",
+        "progress_url": f"/upload/bulk/{job.id}",
+    }
+
+
+@app.get("/upload/bulk/{job_id}")
+def get_bulk_upload(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_job(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Bulk upload job not found")
+    return job.progress()
+
 # ------------------------------------------------------------------
 # LIST DOCUMENTS
 # ------------------------------------------------------------------
@@ -198,6 +357,90 @@ def list_documents(
         for d in docs
     ]
 
+# ------------------------------------------------------------------
+# DELETE DOCUMENTS
+# ------------------------------------------------------------------
+MAX_DELETE_BATCH = 1000
+
+
+class DeleteRequest(BaseModel):
+    document_ids: List[int]
+
+
+@app.delete("/documents/{doc_id}")
+def delete_document(
+    doc_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    verify_document_ownership(doc_id, current_user.id, db)
+    result = delete_documents(db, current_user.id, [doc_id])
+    return {
+        "document_id": doc_id,
+        "status": "deleted",
+        "bytes_reclaimed": result["bytes_reclaimed"],
+    }
+
+
+@app.post("/documents/delete")
+def delete_documents_bulk(
+    request: DeleteRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if len(request.document_ids) > MAX_DELETE_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_DELETE_BATCH} documents per request",
+        )
+    # Documents of other users are reported as not found, never deleted
+    return delete_documents(db, current_user.id, request.document_ids)
+
+
+# ------------------------------------------------------------------
+# QUEUE POSITION
+# ------------------------------------------------------------------
+@app.get("/documents/{doc_id}/queue")
+def get_queue_position(
+    doc_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    document = verify_document_ownership(doc_id, current_user.id, db)
+
+    response = {
+        "document_id": document.id,
+        "status": document.status,
+        "priority": document.queue_lane,
+        "position": 0,
+    }
+    # Only documents still waiting in Kafka have a position
+    if document.status != "uploaded":
+        return response
+    if document.queue_offset is None:
+        response["position"] = None  # event not acknowledged by Kafka yet
+        return response
+
+    try:
+        response["position"] = estimate_position(
+            document.queue_lane, document.queue_partition, document.queue_offset
+        )
+    except Exception as e:
+        print(f"Could not estimate queue position for document {doc_id}: {e}")
+        response["position"] = None
+    return response
+
+
+@app.get("/queue")
+def get_queue_overview(current_user: User = Depends(get_current_user)):
+    try:
+        overview = queue_overview()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Queue status unavailable: {e}")
+    # Events committed but not yet acknowledged by Kafka
+    overview["outbox"] = dict(relay.stats(), unpublished=relay.pending())
+    return overview
+
 # ------------------------------------------------------------------
 # DOCUMENT CHAT HISTORY (STAGE 5)
 # ------------------------------------------------------------------
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -22,6 +22,11 @@ class Document(Base):
         default="uploaded"
     )  # uploaded → processing → ready → error
 
+    # Where the upload event sits in Kafka, for queue position estimates
+    queue_lane = Column(String, nullable=True)  # interactive | bulk
+    queue_partition = Column(Integer, nullable=True)
+    queue_offset = Column(BigInteger, nullable=True)
+
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -36,4 +41,28 @@ class QueryHistory(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
 
-    asked_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    asked_at = Column(DateTime, default=datetime.utcnow)
+
+class OutboxEvent(Base):
+    """
+    Kafka event waiting to be published (transactional outbox).
+
+    Written in the same transaction as the row it describes, so an event
+    exists if and only if the document does; the relay publishes it later.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, nullable=False, index=True)
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    traceparent = Column(String, nullable=True)  # trace context of the upload, sent as a Kafka header
+
+    status = Column(String, default="pending", index=True)  # pending → sending → sent
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)  # retry backoff
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
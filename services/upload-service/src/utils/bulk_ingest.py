@@ -0,0 +1,295 @@
+"""
+Bulk Ingestion - Multipart Batches and ZIP Archives
+
+Partners upload case files as ZIPs of hundreds of PDFs. Sending them one
+`/upload` request at a time pays for auth, a DB commit and a Kafka flush per
+file. `/upload/bulk` instead:
+
+1. Streams every uploaded part to disk (nothing is held in memory), while
+   the request is open.
+2. Returns a job id right away; the rest happens in the background:
+   - ZIP archives are unpacked member by member (streamed, size-checked)
+   - text is extracted in a process pool (PDF parsing is CPU-bound)
+   - each batch of BULK_BATCH_SIZE documents is inserted with ONE
+     INSERT ... RETURNING statement
+   - their events are written to the outbox in the same transaction and
+     published to the bulk lane by the outbox relay
+3. `GET /upload/bulk/{job_id}` reports progress.
+
+Jobs live in this process's memory for BULK_JOB_TTL_SECONDS, so progress
+must be polled on the replica that accepted the upload.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import Document
+
+from .extraction import extract_text
+from .outbox import add_document_events, relay
+from .rate_limit import charge, quota_remaining, text_pages
+from .tracing import span
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+MAX_FILE_SIZE = 20 * 1024 * 1024  # same limit as /upload
+
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+BULK_MAX_TOTAL_MB = int(os.getenv("BULK_MAX_TOTAL_MB", "2048"))  # uncompressed, per job
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+BULK_EXTRACT_WORKERS = int(os.getenv("BULK_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+BULK_MAX_CONCURRENT_JOBS = int(os.getenv("BULK_MAX_CONCURRENT_JOBS", "2"))
+BULK_JOB_TTL_SECONDS = int(os.getenv("BULK_JOB_TTL_SECONDS", "86400"))
+
+COPY_BUFFER = 1024 * 1024
+
+
+class BulkJob:
+    """Progress of one bulk upload."""
+
+    def __init__(self, user_id: int, upload_dir: str, quota_key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.quota_key = quota_key  # daily embedding page quota (utils/rate_limit.py)
+        self.upload_dir = upload_dir
+        self.staging_dir = os.path.join(upload_dir, ".bulk", self.id)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        self.status = "receiving"  # receiving → queued → unpacking → processing → done | error
+        self.files: List[Tuple[str, str]] = []  # (path on disk, original filename)
+        self.archives: List[Tuple[str, str]] = []
+        self.bytes_total = 0
+        self.extracted = 0
+        self.inserted = 0
+        self.document_ids: List[int] = []
+        self.errors: List[dict] = []
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._finished = 0.0  # monotonic, for expiry
+        self._lock = threading.Lock()
+
+    def add_error(self, filename: Optional[str], error: str):
+        with self._lock:
+            if len(self.errors) < 100:
+                self.errors.append({"filename": filename, "error": error})
+
+    def reserve(self, size: int, filename: str) -> bool:
+        """Account for one more file; False if it breaks a per-job limit."""
+        with self._lock:
+            if len(self.files) >= BULK_MAX_FILES:
+                reason = f"More than {BULK_MAX_FILES} files in one job"
+            elif self.bytes_total + size > BULK_MAX_TOTAL_MB * 1024 * 1024:
+                reason = f"Job larger than {BULK_MAX_TOTAL_MB} MB"
+            else:
+                self.bytes_total += size
+                return True
+        self.add_error(filename, reason)
+        return False
+
+    def finish(self, status: str):
+        self.status = status
+        self.finished_at = datetime.utcnow()
+        self._finished = time.monotonic()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def progress(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.files),
+            "extracted": self.extracted,
+            "inserted": self.inserted,
+            "failed": len(self.errors),
+            "errors": self.errors,
+            "document_ids": self.document_ids,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+jobs: Dict[str, BulkJob] = {}
+_jobs_lock = threading.Lock()
+
+# Jobs run in the background; at most BULK_MAX_CONCURRENT_JOBS at a time
+_job_runner = ThreadPoolExecutor(max_workers=BULK_MAX_CONCURRENT_JOBS, thread_name_prefix="bulk-upload")
+_extract_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        with _jobs_lock:
+            if _extract_pool is None:
+                _extract_pool = ProcessPoolExecutor(max_workers=BULK_EXTRACT_WORKERS)
+    return _extract_pool
+
+
+def create_job(user_id: int, upload_dir: str, quota_key: Optional[str] = None) -> BulkJob:
+    job = BulkJob(user_id, upload_dir, quota_key)
+    with _jobs_lock:
+        # Forget finished jobs nobody has asked about for a while
+        now = time.monotonic()
+        for job_id in [j for j, old in jobs.items() if old._finished and now - old._finished > BULK_JOB_TTL_SECONDS]:
+            del jobs[job_id]
+        jobs[job.id] = job
+    return job
+
+
+def get_job(job_id: str) -> Optional[BulkJob]:
+    return jobs.get(job_id)
+
+
+def _copy_limited(source, path: str, limit: int) -> Optional[int]:
+    """Stream `source` to `path`; returns the size, or None if it exceeds `limit`."""
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            block = source.read(COPY_BUFFER)
+            if not block:
+                return size
+            size += len(block)
+            if size > limit:
+                break
+            out.write(block)
+    os.remove(path)
+    return None
+
+
+def save_part(job: BulkJob, source, filename: str):
+    """Stream one uploaded part (a document or a ZIP archive) to disk."""
+    ext = os.path.splitext(filename.lower())[1]
+    if ext == ".zip":
+        path = os.path.join(job.staging_dir, f"{uuid.uuid4()}.zip")
+        if _copy_limited(source, path, BULK_MAX_TOTAL_MB * 1024 * 1024) is None:
+            job.add_error(filename, f"Archive larger than {BULK_MAX_TOTAL_MB} MB")
+        else:
+            job.archives.append((path, filename))
+    elif ext in SUPPORTED_EXTENSIONS:
+        path = os.path.join(job.upload_dir, f"{uuid.uuid4()}{ext}")
+        size = _copy_limited(source, path, MAX_FILE_SIZE)
+        if size is None:
+            job.add_error(filename, "File too large (max 20MB)")
+        elif job.reserve(size, filename):
+            job.files.append((path, filename))
+        else:
+            os.remove(path)
+    else:
+        job.add_error(filename, "Invalid file type. Only PDF, DOCX, TXT and ZIP allowed.")
+
+
+def _unpack(job: BulkJob, archive: str, archive_name: str):
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            for member in zf.infolist():
+                name = os.path.basename(member.filename)
+                ext = os.path.splitext(name.lower())[1]
+                if member.is_dir() or not name or name.startswith("."):
+                    continue
+                if ext not in SUPPORTED_EXTENSIONS:
+                    job.add_error(f"{archive_name}/{member.filename}", "Unsupported file type, skipped")
+                    continue
+                if member.file_size > MAX_FILE_SIZE:
+                    job.add_error(f"{archive_name}/{member.filename}", "File too large (max 20MB)")
+                    continue
+                # Never trust member paths: files get fresh names in UPLOAD_DIR
+                path = os.path.join(job.upload_dir, f"{uuid.uuid4()}{ext}")
+                with zf.open(member) as source:
+                    size = _copy_limited(source, path, MAX_FILE_SIZE)  # declared sizes can lie
+                if size is None:
+                    job.add_error(f"{archive_name}/{member.filename}", "File too large (max 20MB)")
+                elif job.reserve(size, name):
+                    job.files.append((path, name))
+                else:
+                    os.remove(path)
+    except zipfile.BadZipFile:
+        job.add_error(archive_name, "Not a valid ZIP archive")
+    finally:
+        os.remove(archive)
+
+
+def _process_batch(job: BulkJob, batch: List[Tuple[str, str]]):
+    paths = [path for path, _ in batch]
+    names = [name for _, name in batch]
+    with span("extract_text", documents=len(batch)):
+        texts = list(_get_extract_pool().map(extract_text, paths, names))
+    job.extracted += len(batch)
+
+    # Documents beyond the user's daily embedding page quota are not queued
+    remaining = quota_remaining(job.quota_key, "embedding_pages") if job.quota_key else None
+    rows, pages = [], 0
+    for (path, name), text in zip(batch, texts):
+        if remaining is not None and pages >= remaining:
+            job.add_error(name, "Daily embedding page quota used up")
+            os.remove(path)
+            continue
+        pages += text_pages(text)
+        rows.append({
+            "user_id": job.user_id,
+            "filename": name,
+            "file_path": path,
+            "extracted_text": text,
+            "status": "uploaded",
+            "created_at": datetime.utcnow(),
+        })
+    if not rows:
+        return
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            insert(Document).returning(Document.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        events = [
+            {
+                "document_id": document_id,
+                "user_id": job.user_id,
+                "filename": row["filename"],
+                "extracted_text": row["extracted_text"],
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+            for document_id, row in zip(ids, rows)
+        ]
+        # Documents and their events commit together (transactional outbox)
+        add_document_events(db, events, lane="bulk")
+        db.commit()
+        relay.wake()
+        charge(job.quota_key, "embedding_pages", pages)
+
+        job.inserted += len(ids)
+        job.document_ids.extend(ids)
+    finally:
+        db.close()
+
+
+def _run(job: BulkJob):
+    try:
+        job.status = "unpacking"
+        for archive, name in job.archives:
+            _unpack(job, archive, name)
+
+        job.status = "processing"
+        for start in range(0, len(job.files), BULK_BATCH_SIZE):
+            batch = job.files[start:start + BULK_BATCH_SIZE]
+            # Each batch is its own trace; its documents' events carry it on
+            with span("bulk.batch", job_id=job.id, documents=len(batch)):
+                _process_batch(job, batch)
+        job.finish("done")
+        print(f"Bulk job {job.id}: {job.inserted} documents stored and queued")
+    except Exception as e:
+        print(f"Bulk job {job.id} failed: {e}")
+        job.add_error(None, str(e))
+        job.finish("error")
+
+
+def start_job(job: BulkJob):
+    job.status = "queued"
+    _job_runner.submit(_run, job)
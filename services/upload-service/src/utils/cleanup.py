@@ -0,0 +1,217 @@
+"""
+Document Deletion and Storage GC
+
+Deleting a document (DELETE /documents/{id}, POST /documents/delete for many):
+
+1. in ONE transaction: deletes its query history, its upload events not yet
+   published, the document row, and stages a `document_deleted` event in the
+   outbox (utils/outbox.py), so the embedding service is told even if this
+   process dies right after the commit
+2. then removes the uploaded file
+
+The embedding service drops the vectors when the event arrives (its
+utils/vector_gc.py). Deleting only marks space free inside the database;
+`storage_gc`, a background thread, gives it back every
+UPLOAD_GC_INTERVAL_SECONDS:
+
+- removes files in UPLOAD_DIR that no document points to (crash between
+  saving a file and committing its row, quota-rejected bulk files, ...) and
+  abandoned bulk staging directories, once older than UPLOAD_GC_MIN_AGE_SECONDS
+  (younger ones may belong to an upload still in progress)
+- VACUUMs the tables deletions leave holes in (SQLite: the whole file) and
+  records the size before and after; the last run is exported on /metrics
+  (internal only: sizes and orphan counts are not for end users)
+
+Run the sweep on one replica only when several share UPLOAD_DIR: set
+UPLOAD_GC_INTERVAL_SECONDS=0 on the others.
+"""
+
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import engine, SessionLocal
+from models import Document, OutboxEvent, QueryHistory
+
+from .kafka_producer import LANE_TOPICS
+from .outbox import add_deletion_events, relay
+
+UPLOAD_GC_INTERVAL_SECONDS = int(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "3600"))  # 0 disables it
+UPLOAD_GC_MIN_AGE_SECONDS = int(os.getenv("UPLOAD_GC_MIN_AGE_SECONDS", "86400"))
+
+# Tables deletions shrink (PostgreSQL VACUUMs them one by one)
+VACUUM_TABLES = ("documents", "query_history", "outbox_events")
+
+BYTES_RECLAIMED = Counter(
+    "upload_gc_reclaimed_bytes_total",
+    "Disk space freed by deleting documents and by the storage GC",
+    ["source"],  # deleted_files | orphaned_files | database
+)
+
+
+def _remove_file(path: str) -> int:
+    """Delete a file; returns the bytes freed (0 if it was already gone)."""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+def delete_documents(db: Session, user_id: int, document_ids: List[int]) -> Dict[str, object]:
+    """
+    Delete the user's documents (ids of other users count as not found).
+
+    Returns {"deleted": [...], "not_found": [...], "bytes_reclaimed": n},
+    where bytes_reclaimed counts the uploaded files removed.
+    """
+    wanted = sorted(set(document_ids))
+    rows = (
+        db.query(Document.id, Document.file_path)
+        .filter(Document.user_id == user_id, Document.id.in_(wanted))
+        .all()
+    )
+    ids = [r.id for r in rows]
+
+    if ids:
+        db.query(QueryHistory).filter(QueryHistory.document_id.in_(ids)).delete(synchronize_session=False)
+        # An upload event still waiting in the outbox would only be skipped downstream
+        db.query(OutboxEvent).filter(
+            OutboxEvent.document_id.in_(ids),
+            OutboxEvent.topic.in_(list(LANE_TOPICS.values())),
+            OutboxEvent.status == "pending",
+        ).delete(synchronize_session=False)
+        db.query(Document).filter(Document.id.in_(ids)).delete(synchronize_session=False)
+        add_deletion_events(db, ids)
+        db.commit()
+        relay.wake()
+
+    # Files go after the commit: a failed transaction must not lose them
+    reclaimed = sum(_remove_file(r.file_path) for r in rows)
+    BYTES_RECLAIMED.labels(source="deleted_files").inc(reclaimed)
+    found = set(ids)
+    return {
+        "deleted": ids,
+        "not_found": [i for i in wanted if i not in found],
+        "bytes_reclaimed": reclaimed,
+    }
+
+
+def _database_size(conn) -> Optional[int]:
+    if engine.dialect.name == "postgresql":
+        sizes = " + ".join(f"pg_total_relation_size('{t}')" for t in VACUUM_TABLES)
+        return conn.execute(text(f"SELECT {sizes}")).scalar()
+    if engine.dialect.name == "sqlite":
+        pages = conn.execute(text("PRAGMA page_count")).scalar()
+        return pages * conn.execute(text("PRAGMA page_size")).scalar()
+    return None
+
+
+class StorageGC:
+    """Background thread removing orphaned uploads and compacting the database."""
+
+    def __init__(self, upload_dir: str):
+        self.upload_dir = upload_dir
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_run: Optional[dict] = None
+        self.last_run_at: Optional[float] = None
+
+    def start(self):
+        if UPLOAD_GC_INTERVAL_SECONDS <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="storage-gc", daemon=True)
+                self._thread.start()
+
+    def _orphaned_files(self) -> Dict[str, int]:
+        """Removes old files no document points to; returns files and bytes removed."""
+        cutoff = time.time() - UPLOAD_GC_MIN_AGE_SECONDS
+        candidates = []
+        with os.scandir(self.upload_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith(".") and entry.stat().st_mtime < cutoff:
+                    candidates.append(entry.path)
+
+        removed, reclaimed = 0, 0
+        db = SessionLocal()
+        try:
+            for start in range(0, len(candidates), 1000):
+                batch = candidates[start:start + 1000]
+                known = {p for (p,) in db.query(Document.file_path).filter(Document.file_path.in_(batch))}
+                for path in batch:
+                    if path not in known:
+                        reclaimed += _remove_file(path)
+                        removed += 1
+        finally:
+            db.close()
+
+        # Staging directories of bulk jobs that died with their replica
+        staging = os.path.join(self.upload_dir, ".bulk")
+        if os.path.isdir(staging):
+            with os.scandir(staging) as entries:
+                for entry in entries:
+                    if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                        reclaimed += sum(
+                            os.path.getsize(os.path.join(root, f))
+                            for root, _, files in os.walk(entry.path) for f in files
+                        )
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed += 1
+        return {"removed": removed, "bytes_reclaimed": reclaimed}
+
+    def _vacuum(self) -> Dict[str, Optional[int]]:
+        # VACUUM cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            before = _database_size(conn)
+            if engine.dialect.name == "postgresql":
+                for table in VACUUM_TABLES:
+                    conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+            elif engine.dialect.name == "sqlite":
+                conn.execute(text("VACUUM"))
+            after = _database_size(conn)
+        reclaimed = max(0, before - after) if before is not None and after is not None else None
+        return {"bytes_before": before, "bytes_after": after, "bytes_reclaimed": reclaimed}
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        files = self._orphaned_files()
+        database = self._vacuum()
+        BYTES_RECLAIMED.labels(source="orphaned_files").inc(files["bytes_reclaimed"])
+        BYTES_RECLAIMED.labels(source="database").inc(database["bytes_reclaimed"] or 0)
+        self.last_run = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 2),
+            "orphaned_files": files,
+            "database": database,
+            "bytes_reclaimed": files["bytes_reclaimed"] + (database["bytes_reclaimed"] or 0),
+        }
+        self.last_run_at = time.time()
+        print(f"Storage GC: {files['removed']} orphaned files, {self.last_run['bytes_reclaimed']} bytes reclaimed")
+        return self.last_run
+
+    def database_sizes(self) -> Dict[str, int]:
+        """Database bytes before/after the last run's VACUUM (empty until the first run)."""
+        database = (self.last_run or {}).get("database", {})
+        return {
+            when: database[f"bytes_{when}"]
+            for when in ("before", "after")
+            if database.get(f"bytes_{when}") is not None
+        }
+
+    def _run(self):
+        while True:
+            time.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Storage GC error: {e}")
@@ -1,45 +1,216 @@
+"""
+Kafka Publishing - Non-Blocking, Batched, Compressed
+
+Requests never wait for Kafka. Upload events are written to the outbox
+table (see utils/outbox.py); the outbox relay hands them to `publisher`, a
+background thread that:
+
+- owns the KafkaProducer (and, if the broker is down, the reconnect
+  backoff, so no request ever sleeps)
+- hands events to the producer, which batches them per partition for up to
+  KAFKA_LINGER_MS / KAFKA_BATCH_SIZE and compresses each batch
+  (KAFKA_COMPRESSION: lz4 by default, zstd also supported)
+- never flushes per message: acknowledgements arrive through delivery
+  callbacks, which mark outbox rows sent and record where each event
+  landed (documents.queue_*, used for queue position estimates) in one
+  bulk UPDATE per round
+
+Upload latency is therefore independent of broker round-trip time.
+"""
+
 import json
 import os
+import queue
+import threading
 import time
+from typing import Callable, List, Optional
+
 from kafka import KafkaProducer
 from kafka.errors import NoBrokersAvailable
+from sqlalchemy import bindparam, update
+
+from database import SessionLocal
+from models import Document
 
 bootstrap_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 
-_producer = None
+# Priority lanes (see infrastructure/kafka/topics.yaml). Single uploads go to
+# the interactive lane; archive imports go to the bulk lane so they never
+# queue in front of a user waiting for one document.
+LANE_TOPICS = {
+    "interactive": "document_uploaded",
+    "bulk": "document_uploaded.bulk",
+}
 
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "10"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", str(128 * 1024)))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")  # lz4 | zstd | gzip | none
+KAFKA_PUBLISH_QUEUE_SIZE = int(os.getenv("KAFKA_PUBLISH_QUEUE_SIZE", "10000"))
 
-def _get_producer():
-    global _producer
-    if _producer:
-        return _producer
+# Queue positions reported by delivery callbacks, written in one statement
+_positions: List[dict] = []
+_positions_lock = threading.Lock()
 
-    # Retry a few times in case Kafka is still starting up
-    attempts = 0
-    while attempts < 5:
-        try:
-            _producer = KafkaProducer(
-                bootstrap_servers=bootstrap_servers,
-                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-                acks="all",
-                retries=3,
-            )
-            return _producer
-        except NoBrokersAvailable:
-            attempts += 1
-            wait = 2 * attempts
-            print(f"Kafka not ready, retrying in {wait}s (attempt {attempts}/5)")
-            time.sleep(wait)
 
-    raise NoBrokersAvailable("Kafka broker not reachable after retries")
+def remember_position(document_id: int, lane: str):
+    def on_delivery(partition: int, offset: int):
+        with _positions_lock:
+            _positions.append(
+                {"doc_id": document_id, "lane": lane, "partition": partition, "offset": offset}
+            )
+    return on_delivery
 
 
-def publish_document_uploaded(event: dict):
-    producer = _get_producer()
+def record_deliveries():
+    with _positions_lock:
+        rows = list(_positions)
+        _positions.clear()
+    if not rows:
+        return
+    db = SessionLocal()
     try:
-        producer.send("document_uploaded", value=event)
-        producer.flush()
-        print(f"Published event: {event['document_id']}")
+        # One executemany; documents deleted meanwhile are simply not matched
+        table = Document.__table__
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("doc_id"))
+            .values(
+                queue_lane=bindparam("lane"),
+                queue_partition=bindparam("partition"),
+                queue_offset=bindparam("offset"),
+            ),
+            rows,
+        )
+        db.commit()
     except Exception as e:
-        print(f"Kafka publish error: {e}")
-        # In prod: use DLQ or retry queue
\ No newline at end of file
+        print(f"Could not record queue positions: {e}")
+    finally:
+        db.close()
+
+
+
+class AsyncPublisher:
+    """
+    Background Kafka publisher.
+
+    Example:
+        >>> publisher.send("document_uploaded", key=42, value=event,
+        ...                on_delivery=lambda partition, offset: ...)
+        True
+    """
+
+    def __init__(self, after_deliveries: Optional[Callable[[], None]] = None):
+        self.after_deliveries = after_deliveries
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=KAFKA_PUBLISH_QUEUE_SIZE)
+        self._producer: Optional[KafkaProducer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._completed: List[Callable[[], None]] = []  # filled by callbacks on Kafka's I/O thread
+        self._last_completed = time.monotonic()
+        self._stats = {"queued": 0, "sent": 0, "delivered": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="kafka-publisher", daemon=True)
+                    self._thread.start()
+
+    def send(self, topic: str, key, value: dict, on_delivery=None, on_error=None,
+             headers=None, block: bool = False) -> bool:
+        """Queue one message. Returns False if the queue is full (Kafka far behind or down)."""
+        self.start()
+        try:
+            self._queue.put((topic, key, value, headers, on_delivery, on_error), block=block)
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("queued")
+        return True
+
+    def flush(self, timeout: float = 10):
+        """Wait until everything queued so far has been handed to Kafka and acknowledged."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self._producer is not None:
+            self._producer.flush(timeout=max(0, deadline - time.monotonic()))
+        self._run_completed()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, waiting=self._queue.qsize(), connected=self._producer is not None)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _connect(self) -> KafkaProducer:
+        wait = 1
+        while True:
+            try:
+                return KafkaProducer(
+                    bootstrap_servers=bootstrap_servers,
+                    key_serializer=lambda k: str(k).encode("utf-8"),
+                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    acks="all",
+                    retries=5,
+                    linger_ms=KAFKA_LINGER_MS,
+                    batch_size=KAFKA_BATCH_SIZE,
+                    compression_type=None if KAFKA_COMPRESSION == "none" else KAFKA_COMPRESSION,
+                )
+            except NoBrokersAvailable:
+                # Only this background thread waits; requests keep queueing
+                print(f"Kafka not ready, publisher retrying in {wait}s")
+                time.sleep(wait)
+                wait = min(wait * 2, 30)
+
+    # kafka-python calls add_callback/add_errback functions as f(*args, result)
+    def _on_success(self, on_delivery, metadata):
+        self._count("delivered")
+        if on_delivery:
+            with self._lock:
+                self._completed.append(lambda: on_delivery(metadata.partition, metadata.offset))
+
+    def _on_failure(self, value, on_error, exc):
+        self._count("failed")
+        print(f"Kafka publish error for document {value.get('document_id')}: {exc}")
+        if on_error:
+            with self._lock:
+                self._completed.append(lambda: on_error(exc))
+
+    def _run_completed(self):
+        # Delivery callbacks run here, on the publisher thread, not on Kafka's I/O thread
+        with self._lock:
+            completed, self._completed = self._completed, []
+        for callback in completed:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Delivery callback failed: {e}")
+        if completed and self.after_deliveries:
+            self.after_deliveries()
+        self._last_completed = time.monotonic()
+
+    def _run(self):
+        self._producer = self._connect()
+        while True:
+            try:
+                topic, key, value, headers, on_delivery, on_error = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                self._run_completed()
+                continue
+            try:
+                future = self._producer.send(topic, key=key, value=value, headers=headers or None)
+                future.add_callback(self._on_success, on_delivery)
+                future.add_errback(self._on_failure, value, on_error)
+                self._count("sent")
+            except Exception as e:
+                self._on_failure(value, on_error, e)
+            self._queue.task_done()
+            # Record deliveries whenever the queue drains, and at least twice a second
+            if self._queue.empty() or time.monotonic() - self._last_completed > 0.5:
+                self._run_completed()
+
+
+publisher = AsyncPublisher(after_deliveries=record_deliveries)
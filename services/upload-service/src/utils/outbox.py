@@ -0,0 +1,274 @@
+"""
+Transactional Outbox - Reliable Upload Events
+
+Committing a Document and then publishing to Kafka can fail halfway: the
+document exists but its event never does, and it stays "uploaded" forever.
+Instead, the event is written to the `outbox_events` table in the SAME
+transaction as the document, so both exist or neither does.
+
+A relay thread in every upload-service replica then:
+
+1. claims up to OUTBOX_BATCH_SIZE pending rows in one query
+   (SELECT ... FOR UPDATE SKIP LOCKED, so replicas never claim the same rows)
+2. hands them to the background Kafka publisher (batched, compressed)
+3. marks delivered rows "sent" and puts failed ones back to "pending" with
+   exponential backoff, both in bulk, from the delivery callbacks
+
+Rows claimed by a replica that died are released after
+OUTBOX_CLAIM_TIMEOUT_SECONDS. Delivery is at-least-once: an event can be
+published twice (e.g. a crash between the ack and the "sent" update), which
+the embedding service tolerates since re-embedding a document replaces its
+vectors. Sent rows are deleted after OUTBOX_RETENTION_HOURS.
+
+Deleting documents goes through the same table: `add_deletion_events`
+stages one `document_deleted` event per document in the transaction that
+deletes the rows, so the embedding service always learns to drop the
+vectors (see utils/cleanup.py).
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import OutboxEvent
+
+from .kafka_producer import LANE_TOPICS, publisher, remember_position
+from .tracing import current_traceparent, kafka_headers
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_MAX_IN_FLIGHT = int(os.getenv("OUTBOX_MAX_IN_FLIGHT", "2000"))
+OUTBOX_POLL_INTERVAL_MS = int(os.getenv("OUTBOX_POLL_INTERVAL_MS", "500"))
+OUTBOX_CLAIM_TIMEOUT_SECONDS = int(os.getenv("OUTBOX_CLAIM_TIMEOUT_SECONDS", "300"))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+
+DELETED_TOPIC = os.getenv("DOCUMENT_DELETED_TOPIC", "document_deleted")
+
+_TOPIC_LANES = {topic: lane for lane, topic in LANE_TOPICS.items()}
+
+
+def add_document_event(db: Session, event: dict, lane: str):
+    """Stage an upload event in the caller's transaction (committed with the document)."""
+    db.add(OutboxEvent(
+        document_id=event["document_id"],
+        topic=LANE_TOPICS[lane],
+        payload=json.dumps(event),
+        traceparent=current_traceparent(),
+    ))
+
+
+def add_document_events(db: Session, events: List[dict], lane: str):
+    """Stage many upload events with one INSERT, in the caller's transaction."""
+    if events:
+        traceparent = current_traceparent()
+        db.execute(
+            insert(OutboxEvent),
+            [
+                {
+                    "document_id": e["document_id"],
+                    "topic": LANE_TOPICS[lane],
+                    "payload": json.dumps(e),
+                    "traceparent": traceparent,
+                }
+                for e in events
+            ],
+        )
+
+
+def add_deletion_events(db: Session, document_ids: List[int]):
+    """Stage `document_deleted` events with one INSERT, in the caller's transaction."""
+    if document_ids:
+        traceparent = current_traceparent()
+        now = datetime.utcnow().isoformat()
+        db.execute(
+            insert(OutboxEvent),
+            [
+                {
+                    "document_id": document_id,
+                    "topic": DELETED_TOPIC,
+                    "payload": json.dumps({"document_id": document_id, "timestamp": now}),
+                    "traceparent": traceparent,
+                }
+                for document_id in document_ids
+            ],
+        )
+
+
+class OutboxRelay:
+    """Background thread publishing pending outbox rows."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, int] = {}  # outbox id -> attempts
+        self._sent: List[int] = []
+        self._failed: List[Tuple[int, str]] = []
+        self._last_reclaim = 0.0
+        self._last_purge = 0.0
+        self._stats = {"published": 0, "failed": 0}
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+                    self._thread.start()
+
+    def wake(self):
+        """Publish right away instead of at the next poll (called after an upload commits)."""
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
+
+    def pending(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.count(OutboxEvent.id)).filter(OutboxEvent.status != "sent").scalar()
+        finally:
+            db.close()
+
+    # -- delivery callbacks (run on the publisher thread) ---------------
+
+    def _on_delivery(self, outbox_id: int, document_id: int, lane: Optional[str]):
+        # Only upload events have a queue position; deletion events have no lane
+        position = remember_position(document_id, lane) if lane else None
+
+        def on_delivery(partition: int, offset: int):
+            if position:
+                position(partition, offset)
+            with self._lock:
+                self._sent.append(outbox_id)
+
+        return on_delivery
+
+    def _on_error(self, outbox_id: int):
+        def on_error(exc: Exception):
+            with self._lock:
+                self._failed.append((outbox_id, str(exc)))
+
+        return on_error
+
+    # -- relay loop -----------------------------------------------------
+
+    def _claim(self, db: Session, limit: int) -> List[tuple]:
+        now = datetime.utcnow()
+        rows = (
+            db.query(OutboxEvent.id, OutboxEvent.document_id, OutboxEvent.topic,
+                     OutboxEvent.payload, OutboxEvent.attempts, OutboxEvent.traceparent)
+            .filter(OutboxEvent.status == "pending", OutboxEvent.available_at <= now)
+            .order_by(OutboxEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if rows:
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_([r.id for r in rows])).update(
+                {
+                    OutboxEvent.status: "sending",
+                    OutboxEvent.claimed_at: now,
+                    OutboxEvent.attempts: OutboxEvent.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        db.commit()
+        return rows
+
+    def _record_results(self, db: Session):
+        with self._lock:
+            sent, self._sent = self._sent, []
+            failed, self._failed = self._failed, []
+            attempts = {i: self._in_flight.pop(i, 1) for i in sent + [i for i, _ in failed]}
+            self._stats["published"] += len(sent)
+            self._stats["failed"] += len(failed)
+        if not sent and not failed:
+            return
+
+        now = datetime.utcnow()
+        if sent:
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_(sent)).update(
+                {OutboxEvent.status: "sent", OutboxEvent.sent_at: now}, synchronize_session=False
+            )
+        if failed:
+            db.execute(
+                update(OutboxEvent),
+                [
+                    {
+                        "id": outbox_id,
+                        "status": "pending",
+                        "last_error": error,
+                        "available_at": now + timedelta(seconds=min(2 ** attempts[outbox_id], 300)),
+                    }
+                    for outbox_id, error in failed
+                ],
+            )
+        db.commit()
+
+    def _housekeeping(self, db: Session):
+        now = time.monotonic()
+        if now - self._last_reclaim > 30:
+            # Release rows claimed by a replica that died before they were sent
+            cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT_SECONDS)
+            with self._lock:
+                mine: Set[int] = set(self._in_flight)
+            query = db.query(OutboxEvent).filter(OutboxEvent.status == "sending", OutboxEvent.claimed_at < cutoff)
+            if mine:
+                query = query.filter(OutboxEvent.id.notin_(mine))
+            released = query.update({OutboxEvent.status: "pending"}, synchronize_session=False)
+            if released:
+                print(f"Outbox: released {released} stale claims")
+            self._last_reclaim = now
+        if now - self._last_purge > 600:
+            cutoff = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+            db.execute(delete(OutboxEvent).where(OutboxEvent.status == "sent", OutboxEvent.sent_at < cutoff))
+            self._last_purge = now
+        db.commit()
+
+    def _publish(self, rows: List[tuple]):
+        for row in rows:
+            with self._lock:
+                self._in_flight[row.id] = (row.attempts or 0) + 1
+            lane = _TOPIC_LANES.get(row.topic)
+            publisher.send(
+                row.topic,
+                key=row.document_id,
+                value=json.loads(row.payload),
+                headers=kafka_headers(row.traceparent),
+                on_delivery=self._on_delivery(row.id, row.document_id, lane),
+                on_error=self._on_error(row.id),
+                block=True,
+            )
+
+    def _run(self):
+        while True:
+            rows = []
+            db = SessionLocal()
+            try:
+                self._record_results(db)
+                self._housekeeping(db)
+                with self._lock:
+                    room = OUTBOX_MAX_IN_FLIGHT - len(self._in_flight)
+                if room > 0:
+                    rows = self._claim(db, min(room, OUTBOX_BATCH_SIZE))
+                    self._publish(rows)
+            except Exception as e:
+                db.rollback()
+                print(f"Outbox relay error: {e}")
+            finally:
+                db.close()
+
+            # A full batch means more is probably waiting: go again right away
+            if len(rows) < OUTBOX_BATCH_SIZE:
+                self._wake.wait(OUTBOX_POLL_INTERVAL_MS / 1000)
+                self._wake.clear()
+
+
+relay = OutboxRelay()
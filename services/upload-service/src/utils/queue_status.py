@@ -0,0 +1,156 @@
+"""
+Queue Status - Consumer Lag, Queue Position and Backpressure
+
+Uploaded documents wait in one of two Kafka lanes until the embedding
+service picks them up:
+
+    interactive  document_uploaded       drained first
+    bulk         document_uploaded.bulk  one message per EMBEDDING_INTERACTIVE_WEIGHT
+                                         interactive messages
+
+For every partition, lag = end offset - offset committed by the embedding
+service's consumer group, i.e. the number of documents still waiting. From
+that we can:
+
+- tell a user roughly how many documents are ahead of theirs
+- refuse new bulk imports (HTTP 429 + Retry-After) while the bulk lane is
+  more than BULK_MAX_LAG documents behind, instead of letting the backlog
+  grow without limit
+
+Lag is read from Kafka at most once every QUEUE_LAG_CACHE_SECONDS, so polling
+the queue endpoint or a burst of uploads does not hammer the broker. If Kafka
+cannot be reached, uploads are not blocked (fail open); the failure is cached
+for the same time, so uploads do not each wait out the connect timeout.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from kafka import KafkaAdminClient, KafkaConsumer, TopicPartition
+
+from .kafka_producer import LANE_TOPICS, bootstrap_servers
+
+CONSUMER_GROUP = os.getenv("EMBEDDING_CONSUMER_GROUP", "embedding-service-group")
+INTERACTIVE_WEIGHT = int(os.getenv("EMBEDDING_INTERACTIVE_WEIGHT", "4"))  # same value as the embedding service
+QUEUE_LAG_CACHE_SECONDS = float(os.getenv("QUEUE_LAG_CACHE_SECONDS", "5"))
+BULK_MAX_LAG = int(os.getenv("BULK_MAX_LAG", "5000"))
+BULK_RETRY_AFTER_SECONDS = int(os.getenv("BULK_RETRY_AFTER_SECONDS", "60"))
+
+
+class QueueFullError(Exception):
+    """Raised when a lane is too far behind to accept more work."""
+
+    def __init__(self, lane: str, lag: int, retry_after: int):
+        super().__init__(f"The {lane} queue is full ({lag} documents waiting)")
+        self.lane = lane
+        self.lag = lag
+        self.retry_after = retry_after
+
+
+class LagMonitor:
+    """Cached view of per-partition end and committed offsets for both lanes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._consumer: Optional[KafkaConsumer] = None
+        self._admin: Optional[KafkaAdminClient] = None
+        self._snapshot: Dict[str, Dict[int, Dict[str, int]]] = {}
+        self._error: Optional[Exception] = None
+        self._fetched_at = 0.0
+
+    def _fetch(self) -> Dict[str, Dict[int, Dict[str, int]]]:
+        if self._consumer is None:
+            # No group_id: this consumer only reads offsets, it never joins the group
+            self._consumer = KafkaConsumer(bootstrap_servers=bootstrap_servers, enable_auto_commit=False)
+            self._admin = KafkaAdminClient(bootstrap_servers=bootstrap_servers)
+
+        partitions = [
+            TopicPartition(topic, p)
+            for topic in LANE_TOPICS.values()
+            for p in sorted(self._consumer.partitions_for_topic(topic) or ())
+        ]
+        end = self._consumer.end_offsets(partitions)
+        start = self._consumer.beginning_offsets(partitions)
+        committed = self._admin.list_consumer_group_offsets(CONSUMER_GROUP)
+
+        snapshot: Dict[str, Dict[int, Dict[str, int]]] = {lane: {} for lane in LANE_TOPICS}
+        lanes = {topic: lane for lane, topic in LANE_TOPICS.items()}
+        for tp in partitions:
+            # A partition the group never committed is read from the beginning
+            done = committed[tp].offset if tp in committed else start[tp]
+            snapshot[lanes[tp.topic]][tp.partition] = {"end": end[tp], "committed": done}
+        return snapshot
+
+    def snapshot(self) -> Dict[str, Dict[int, Dict[str, int]]]:
+        with self._lock:
+            if time.monotonic() - self._fetched_at >= QUEUE_LAG_CACHE_SECONDS:
+                try:
+                    self._snapshot = self._fetch()
+                    self._error = None
+                except Exception as e:
+                    self._error = e
+                self._fetched_at = time.monotonic()
+            if self._error is not None:
+                raise self._error
+            return self._snapshot
+
+    def lane_lag(self, lane: str) -> int:
+        return sum(max(0, p["end"] - p["committed"]) for p in self.snapshot().get(lane, {}).values())
+
+
+lag_monitor = LagMonitor()
+
+
+def check_backpressure(lane: str):
+    """Raise QueueFullError if a bulk upload should be refused right now."""
+    if lane != "bulk":
+        return
+    try:
+        lag = lag_monitor.lane_lag("bulk")
+    except Exception as e:
+        print(f"Could not read consumer lag, accepting upload: {e}")
+        return
+    if lag > BULK_MAX_LAG:
+        raise QueueFullError(lane, lag, BULK_RETRY_AFTER_SECONDS)
+
+
+def queue_overview() -> dict:
+    snapshot = lag_monitor.snapshot()
+    return {
+        lane: {
+            "waiting": lag_monitor.lane_lag(lane),
+            "partitions": len(snapshot.get(lane, {})),
+        }
+        for lane in LANE_TOPICS
+    }
+
+
+def estimate_position(lane: str, partition: int, offset: int) -> int:
+    """
+    Estimated number of documents that will be processed before this one.
+
+    Within its own partition the answer is exact (offset - committed). Other
+    partitions of the lane are drained in parallel, so only about as many of
+    their messages as are ahead in ours count. Interactive documents also
+    wait for the bulk messages interleaved by weighted fairness; bulk
+    documents wait for the whole interactive lane.
+    """
+    snapshot = lag_monitor.snapshot()
+    own = snapshot.get(lane, {}).get(partition)
+    if own is None or offset < own["committed"]:
+        return 0
+
+    ahead_in_partition = offset - own["committed"]
+    ahead = ahead_in_partition + sum(
+        min(max(0, p["end"] - p["committed"]), ahead_in_partition)
+        for number, p in snapshot[lane].items()
+        if number != partition
+    )
+
+    if lane == "interactive":
+        ahead += min(lag_monitor.lane_lag("bulk"), ahead // max(1, INTERACTIVE_WEIGHT))
+    else:
+        ahead += lag_monitor.lane_lag("interactive")
+    return ahead